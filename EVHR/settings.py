@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import socket
 import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -102,6 +103,7 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
@@ -192,16 +194,51 @@ LOGGING = {
 }
 
 # WranglerProcess Settings
+ADMISSION_CONTROL = True
+ADMISSION_RESERVE_GB = 2
+COMMAND_EXECUTORS = {'gumby': 'SshExecutor'}
+COMMAND_TIMEOUTS = {'mapproject': 6 * 3600}
+CONSTITUENT_MAX_RETRIES = 3
+CONSTITUENT_RETRY_SECONDS = 60
+CONSTITUENT_SLOTS = 10
 DAYS_UNTIL_REQUEST_PURGE = 30
 DEFAULT_SCALE_IN_METERS = 30
 DEM_APPLICATION = '/att/nobackup/rlgill/DgStereo/evhr/dg_stereo.sh'
+DISTRIBUTOR = 'PythonFuturesDistributor'
 FOOTPRINTS_FILE = '/css/nga/INDEX/Footprints/current/newest/geodatabase/nga_inventory_canon.gdb'
+HOUSEKEEPING_BATCH_SIZE = 500
+JOB_DAEMON_HOUSEKEEPING_SECONDS = 60
+JOB_DAEMON_LEASE_SECONDS = 120
+JOB_DAEMON_MAX_REQUESTS_PER_WORKER = 50
+JOB_DAEMON_POLL_SECONDS = 30
+JOB_DAEMON_WORKERS = 10
 MAXIMUM_PROCESSES = 5
 # MAXIMUM_SCENES = 20
 MERRA_END_DATE = '2017-05-31'
 MERRA_START_DATE = '1980-01-01'
 MOST_RECENT_MAIAC = '2017-12-31'
+NODE_AGENT_ADDRESS = socket.gethostname()
+NODE_AGENT_PORT = 8760
+NODE_AGENT_SECRET = os.environ.get('EVHR_NODE_AGENT_SECRET')
 NODE_GROUP = 'gumby'
+NODE_HEARTBEAT_SECONDS = 60
+NODE_SELECTION_USE_LOAD = True
 NO_DATA_VALUE = -9999
+PLANNER_STAGE_COSTS = {}
+PRODUCT_CACHE_DIR = os.path.join(BASE_DIRECTORY, 'productCache')
+PRODUCT_CACHE_QUOTA_GB = 2000
 PYTHON_PATH = '/att/nobackup/rlgill/DgStereo/dgtools:/att/nobackup/rlgill/DgStereo/pygeotools:/att/nobackup/rlgill/DgStereo/imview'
+REQUEST_COST_ESTIMATOR = 'EvhrEngine.management.EvhrCostEstimator.estimateCost'
+REQUEST_LOG_BACKUP_COUNT = 5
+REQUEST_LOG_COMPRESS = True
+REQUEST_LOG_ROTATE_BYTES = 0
+SCHEDULER_AGING_SECONDS = 3600
+SCHEDULER_PRIORITY_AGING_SECONDS = 14400
+SLOT_LEASE_SECONDS = 300
+SPECULATION_MIN_SAMPLES = 3
+SPECULATION_PERCENTILE = 90
+SSH_CONTROL_PERSIST_SECONDS = 600
+STAGE_LEASE_SECONDS = 300
+SYSTEM_COMMAND_TAIL_LINES = 100
+THREAD_DISTRIBUTOR = 'ThreadPoolDistributor'
 WORK_DIRECTORY = OUTPUT_DIRECTORY
@@ -0,0 +1,236 @@
+
+import importlib
+import os
+import pipes
+import tempfile
+import threading
+
+from django.conf import settings
+
+from EvhrEngine.models import EvhrNode
+
+#-------------------------------------------------------------------------------
+# class CommandExecutor
+#
+# An executor turns a command for a node into the command to run here, like
+# ['pdsh', '-w', node, cmd], an argv list, so no local shell is needed.
+# Commands are strings or argv lists.  SystemCommand runs the result, so
+# output capture, error detection and telemetry are the same for every
+# executor.
+#
+# settings.COMMAND_EXECUTORS chooses the executor of each node group, like
+# {'gumby': 'SshExecutor'}.  Values name a class in this module or give the
+# full path to one elsewhere, like package.module.ClassName.  Groups not
+# listed use PdshExecutor.
+#
+# executor = CommandExecutor.forGroup('gumby')
+# argv = executor.wrap('gdalinfo x.tif', 'evhr103')
+#-------------------------------------------------------------------------------
+class CommandExecutor(object):
+
+    DEFAULT = 'PdshExecutor'
+
+    # The return code meaning the node, rather than the command, failed
+    NODE_FAILURE_CODE = None
+
+    # Executors, by group and class name, so their state is shared
+    executors = {}
+    executorsLock = threading.Lock()
+
+    #---------------------------------------------------------------------------
+    # forGroup
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def forGroup(groupName):
+
+        name = CommandExecutor.DEFAULT
+
+        if hasattr(settings, 'COMMAND_EXECUTORS'):
+            name = settings.COMMAND_EXECUTORS.get(groupName, name)
+
+        with CommandExecutor.executorsLock:
+
+            key = (groupName, name)
+
+            if key not in CommandExecutor.executors:
+
+                if '.' in name:
+                    modName, className = name.rsplit('.', 1)
+
+                else:
+                    modName, className = __name__, name
+
+                mod = importlib.import_module(modName)
+                CommandExecutor.executors[key] = getattr(mod, className)()
+
+            return CommandExecutor.executors[key]
+
+    #---------------------------------------------------------------------------
+    # forNode
+    #
+    # This returns the executor of the node's group, or the default executor
+    # for nodes that are not EvhrNodes.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def forNode(nodeName):
+
+        groupName = EvhrNode.objects.filter(name = nodeName). \
+                        values_list('group', flat = True).first()
+
+        return CommandExecutor.forGroup(groupName)
+
+    #---------------------------------------------------------------------------
+    # isNodeFailure
+    #---------------------------------------------------------------------------
+    def isNodeFailure(self, returnCode):
+
+        return self.NODE_FAILURE_CODE != None and \
+               returnCode == self.NODE_FAILURE_CODE
+
+    #---------------------------------------------------------------------------
+    # toString
+    #
+    # This returns a command as one string, quoting argv lists for the shell.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def toString(cmd):
+
+        if isinstance(cmd, (list, tuple)):
+            return ' '.join([pipes.quote(str(arg)) for arg in cmd])
+
+        return str(cmd)
+
+    #---------------------------------------------------------------------------
+    # wrap
+    #---------------------------------------------------------------------------
+    def wrap(self, cmd, nodeName):
+
+        raise NotImplementedError()
+
+#-------------------------------------------------------------------------------
+# class FakeExecutor
+#
+# This records each command and its node in commands, and runs it here, for
+# tests.
+#-------------------------------------------------------------------------------
+class FakeExecutor(CommandExecutor):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self):
+
+        self.commands = []    # [(nodeName, cmd), ...]
+
+    #---------------------------------------------------------------------------
+    # wrap
+    #---------------------------------------------------------------------------
+    def wrap(self, cmd, nodeName):
+
+        self.commands.append((nodeName, cmd))
+        return cmd
+
+#-------------------------------------------------------------------------------
+# class LocalExecutor
+#
+# This runs commands here, whatever their node, like on a single-host
+# installation.
+#-------------------------------------------------------------------------------
+class LocalExecutor(CommandExecutor):
+
+    #---------------------------------------------------------------------------
+    # wrap
+    #---------------------------------------------------------------------------
+    def wrap(self, cmd, nodeName):
+
+        return cmd
+
+#-------------------------------------------------------------------------------
+# class PdshExecutor
+#
+# pdsh opens an ssh session for each command.
+#-------------------------------------------------------------------------------
+class PdshExecutor(CommandExecutor):
+
+    #---------------------------------------------------------------------------
+    # wrap
+    #---------------------------------------------------------------------------
+    def wrap(self, cmd, nodeName):
+
+        return ['pdsh', '-w', nodeName, CommandExecutor.toString(cmd)]
+
+#-------------------------------------------------------------------------------
+# class SrunExecutor
+#
+# This runs commands as Slurm job steps on the node, within the current
+# allocation.
+#-------------------------------------------------------------------------------
+class SrunExecutor(CommandExecutor):
+
+    #---------------------------------------------------------------------------
+    # wrap
+    #---------------------------------------------------------------------------
+    def wrap(self, cmd, nodeName):
+
+        return ['srun',
+                '--quiet',
+                '--nodes=1',
+                '--ntasks=1',
+                '--nodelist=' + nodeName,
+                '/bin/sh',
+                '-c',
+                CommandExecutor.toString(cmd)]
+
+#-------------------------------------------------------------------------------
+# class SshExecutor
+#
+# This keeps a master ssh connection to each node, which its commands share,
+# so they do not each pay for connecting and authenticating.  The first
+# command to a node starts the master, which stays for
+# settings.SSH_CONTROL_PERSIST_SECONDS after the last command ends.  Control
+# sockets are in settings.SSH_CONTROL_DIR.
+#-------------------------------------------------------------------------------
+class SshExecutor(CommandExecutor):
+
+    # ssh exits with 255 when it cannot reach the node.
+    NODE_FAILURE_CODE = 255
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self):
+
+        self.controlDir     = os.path.join(tempfile.gettempdir(), 'evhr-ssh')
+        self.persistSeconds = 600
+
+        if hasattr(settings, 'SSH_CONTROL_DIR'):
+            self.controlDir = settings.SSH_CONTROL_DIR
+
+        if hasattr(settings, 'SSH_CONTROL_PERSIST_SECONDS'):
+            self.persistSeconds = settings.SSH_CONTROL_PERSIST_SECONDS
+
+        if not os.path.isdir(self.controlDir):
+
+            try:
+                os.makedirs(self.controlDir, 0700)
+
+            except OSError:
+
+                # Another process made it.
+                if not os.path.isdir(self.controlDir):
+                    raise
+
+    #---------------------------------------------------------------------------
+    # wrap
+    #
+    # %C is a hash of the connection, keeping socket paths short.
+    #---------------------------------------------------------------------------
+    def wrap(self, cmd, nodeName):
+
+        return ['ssh',
+                '-o', 'BatchMode=yes',
+                '-o', 'ControlMaster=auto',
+                '-o', 'ControlPath=' + os.path.join(self.controlDir, '%C'),
+                '-o', 'ControlPersist=' + str(self.persistSeconds),
+                nodeName,
+                CommandExecutor.toString(cmd)]
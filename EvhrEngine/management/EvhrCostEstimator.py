@@ -0,0 +1,82 @@
+import os
+
+from django.conf import settings
+
+from GeoProcessingEngine.management.GeoRetriever import GeoRetriever
+from GeoProcessingEngine.models import GeoRequest
+
+from EvhrEngine.management.FootprintsQuery import FootprintsQuery
+from EvhrEngine.models import EvhrScene
+
+# Relative costs.  A strip pays for dg_mosaic, orthorectification and TOA.
+STRIP_COST = 1.0
+SCENE_COST = 0.25
+
+#-------------------------------------------------------------------------------
+# estimateCost
+#
+# This is the job daemon's cost estimator for EVHR requests.  Enable it with
+# REQUEST_COST_ESTIMATOR = 'EvhrEngine.management.EvhrCostEstimator.estimateCost'
+#
+# Requests with EvhrScenes are estimated from them.  Otherwise, when
+# COST_ESTIMATE_WITH_FOOTPRINTS is set, Footprints is queried for the AoI.
+# Failing both, the cost is unknown and None is returned.
+#-------------------------------------------------------------------------------
+def estimateCost(request):
+
+    sceneFiles = EvhrScene.objects.filter(request = request). \
+                                   values_list('sceneFile', flat = True)
+
+    if sceneFiles:
+        return costOfScenes(sceneFiles)
+
+    if not hasattr(settings, 'COST_ESTIMATE_WITH_FOOTPRINTS') or \
+       not settings.COST_ESTIMATE_WITH_FOOTPRINTS:
+
+        return None
+
+    try:
+        geoRequest = GeoRequest.objects.get(id = request.id)
+
+    except GeoRequest.DoesNotExist:
+        return None
+
+    fpq = FootprintsQuery()
+
+    fpq.addAoI(float(geoRequest.ulx),
+               float(geoRequest.uly),
+               float(geoRequest.lrx),
+               float(geoRequest.lry),
+               GeoRetriever.constructSrs(geoRequest.srs))
+
+    fpq.setMinimumOverlapInDegrees()
+
+    if hasattr(settings, 'MAXIMUM_SCENES'):
+        fpq.setMaximumScenes(settings.MAXIMUM_SCENES)
+
+    return costOfScenes([fps.fileName() for fps in fpq.getScenes()])
+
+#-------------------------------------------------------------------------------
+# costOfScenes
+#-------------------------------------------------------------------------------
+def costOfScenes(sceneFiles):
+
+    strips = set([stripKey(sceneFile) for sceneFile in sceneFiles])
+    return len(strips) * STRIP_COST + len(sceneFiles) * SCENE_COST
+
+#-------------------------------------------------------------------------------
+# stripKey
+#
+# Scenes of one strip share a catalog ID and product code.  Deriving this from
+# the name avoids opening the NITF, as DgFile.getStripName() must.
+#
+# WV01_20080228205612_1020010001076500_08FEB28205612-P1BS-005733445010_03_P001.ntf
+#-------------------------------------------------------------------------------
+def stripKey(sceneFile):
+
+    baseName = os.path.basename(sceneFile)
+    fields = baseName.split('_')
+    catalogId = fields[2] if len(fields) > 2 else baseName
+    prodCode = 'P1BS' if 'P1BS' in baseName else 'M1BS'
+
+    return catalogId + '-' + prodCode
@@ -24,6 +24,11 @@ class EvhrDemRetriever(GeoRetriever):
 
     DEBUG_ONLY_PREPARE_DATA = False
     
+    # Stereo processing is much heavier than other constituents.
+    slotWeight = 4
+    subprocessBound = True
+    stageProfiles = {'stereo': {'memoryGB': 16, 'cpus': 4, 'io': True}}
+    
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
@@ -65,6 +70,20 @@ class EvhrDemRetriever(GeoRetriever):
 
         self.logger.info('PYTHONPATH = ' + os.environ['PYTHONPATH'])
 
+    #---------------------------------------------------------------------------
+    # cancel
+    #---------------------------------------------------------------------------
+    def cancel(self):
+
+        SystemCommand.killRunning(self.request.id)
+
+    #---------------------------------------------------------------------------
+    # finish
+    #---------------------------------------------------------------------------
+    def finish(self):
+
+        SystemCommand.forgetRequest(self.request.id)
+
     #---------------------------------------------------------------------------
     # getEndPointSRSs
     #---------------------------------------------------------------------------
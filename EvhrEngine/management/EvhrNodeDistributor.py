@@ -0,0 +1,522 @@
+import glob
+import os
+import Queue
+import shutil
+import socket
+import threading
+import time
+import traceback
+
+from django import db
+from django.conf import settings
+
+from EvhrEngine.management.NodeAgent import agentPort
+from EvhrEngine.management.NodeAgent import agentSecret
+from EvhrEngine.management.NodeAgent import callAgent
+from EvhrEngine.management.NodeAgent import readMessage
+from EvhrEngine.management.NodeAgent import sendMessage
+from EvhrEngine.management.NodeAgent import speculativeDir
+from EvhrEngine.models import EvhrNode
+
+from ProcessingEngine.management.Distributor import Distributor
+
+#-------------------------------------------------------------------------------
+# EvhrNodeDistributor
+#
+# This sends whole constituents to the NodeAgents running on the enabled
+# EvhrNodes of settings.NODE_GROUP, instead of running them on the daemon's
+# host.  Each strip's pipeline then runs on one node, and the work of
+# orchestrating it is spread across the cluster.  The agents apply their own
+# slot pools and admission control, so this only bounds how many constituents
+# are outstanding, by maxRunning.
+#
+# Each constituent goes to the reachable node with the fewest constituents
+# running per CPU.  When a node cannot be reached, it is skipped for the rest
+# of the request, and its constituents go elsewhere.
+#
+# Near the end of a request, one strip on a slow node can hold up aggregation
+# long after the others finish.  Once every constituent has been sent and
+# settings.SPECULATION_MIN_SAMPLES have finished, a constituent running longer
+# than settings.SPECULATION_PERCENTILE of the finished ones' durations gets a
+# speculative duplicate on another node.  The first to succeed wins, and the
+# other is cancelled.  A winning duplicate's output is moved from its scratch
+# directory into the request directory.  Without SPECULATION_PERCENTILE,
+# constituents are not duplicated.  The threshold comes from the durations of
+# this request's whole constituents, not from EvhrCommandResults by stage.
+#
+# For tests, a node named localhost with an agent running locally stands in
+# for the cluster.
+#
+# The ToA and DEM retrievers are subprocessBound, so RequestProcessor gives
+# their requests settings.THREAD_DISTRIBUTOR, not settings.DISTRIBUTOR.
+#
+# THREAD_DISTRIBUTOR = \
+#     'EvhrEngine.management.EvhrNodeDistributor.EvhrNodeDistributor'
+#-------------------------------------------------------------------------------
+class EvhrNodeDistributor(Distributor):
+
+    # Seconds to wait for an agent's status.
+    STATUS_SECONDS = 10
+
+    # Seconds to wait for a completion before checking for cancellation.
+    WAIT_SECONDS = 30
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cpList, maxRunning, logger):
+
+        super(EvhrNodeDistributor, self).__init__(cpList, maxRunning, logger)
+
+        self.abandoned    = set()    # attempts cancelled individually
+        self.attemptNodes = {}       # attempt -> node name
+        self.cancelled    = False
+        self.completions  = Queue.Queue()
+        self.deadNodes    = set()
+        self.lock         = threading.Lock()
+        self.minSamples   = 3
+        self.percentile   = None
+        self.port         = agentPort()
+        self.sockets      = {}       # attempt -> socket
+        self.submitted    = {}       # node name -> constituents sent by this
+
+        if hasattr(settings, 'SPECULATION_MIN_SAMPLES'):
+            self.minSamples = settings.SPECULATION_MIN_SAMPLES
+
+        if hasattr(settings, 'SPECULATION_PERCENTILE'):
+            self.percentile = settings.SPECULATION_PERCENTILE
+
+    #---------------------------------------------------------------------------
+    # cancel
+    #
+    # Closing a constituent's connection tells its agent to terminate it.
+    #---------------------------------------------------------------------------
+    def cancel(self):
+
+        self.cancelled = True
+
+        with self.lock:
+
+            for attempt in self.sockets.keys():
+                self.closeAttempt(attempt)
+
+    #---------------------------------------------------------------------------
+    # cancelAttempt
+    #
+    # An attempt is (constituent ID, whether it is speculative).
+    #---------------------------------------------------------------------------
+    def cancelAttempt(self, attempt):
+
+        with self.lock:
+
+            self.abandoned.add(attempt)
+            self.closeAttempt(attempt)
+
+    #---------------------------------------------------------------------------
+    # chooseNode
+    #
+    # This returns the name of the least busy reachable node, other than
+    # avoid, or None.
+    #---------------------------------------------------------------------------
+    def chooseNode(self, avoid = None):
+
+        bestNode = None
+        bestLoad = None
+
+        for name in self.getNodeNames():
+
+            if name in self.deadNodes or name == avoid:
+                continue
+
+            try:
+                status = callAgent(name,
+                                   {'op': 'status'},
+                                   self.port,
+                                   EvhrNodeDistributor.STATUS_SECONDS)
+
+            except (socket.error, ValueError):
+                status = None
+
+            if not status or 'error' in status:
+
+                self.nodeFailed(name)
+                continue
+
+            # Count what this sent, which the agent may not have started.
+            with self.lock:
+
+                running = max(status['running'], self.submitted.get(name, 0))
+
+            load = float(running) / max(1, status['cpus'])
+
+            if bestLoad == None or load < bestLoad:
+
+                bestNode = name
+                bestLoad = load
+
+        return bestNode
+
+    #---------------------------------------------------------------------------
+    # closeAttempt
+    #
+    # The caller must hold the lock.
+    #---------------------------------------------------------------------------
+    def closeAttempt(self, attempt):
+
+        sock = self.sockets.pop(attempt, None)
+
+        if sock:
+
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+
+            except socket.error:
+                pass
+
+    #---------------------------------------------------------------------------
+    # distribute
+    #
+    # Constituents always go to the nodes, even when they must run one at a
+    # time.
+    #---------------------------------------------------------------------------
+    def distribute(self):
+
+        return self.myDistribute()
+
+    #---------------------------------------------------------------------------
+    # getNodeNames
+    #---------------------------------------------------------------------------
+    def getNodeNames(self):
+
+        if not hasattr(settings, 'NODE_GROUP'):
+            return []
+
+        return [node.name for node in \
+                EvhrNode.objects.filter(group = settings.NODE_GROUP,
+                                        enabled = True,
+                                        group__enabled = True)]
+
+    #---------------------------------------------------------------------------
+    # myDistribute
+    #---------------------------------------------------------------------------
+    def myDistribute(self):
+
+        durations = []    # seconds taken by finished constituents
+        pending   = list(self.constituentProcessors)
+        running   = {}    # constituent ID -> {'cp', 'started', 'attempts', ...}
+        success   = True
+
+        try:
+            while (pending or running) and not self.cancelled:
+
+                # Send constituents.
+                while pending and len(running) < self.maxRunning:
+
+                    cp = pending.pop()
+
+                    running[cp.constituent.id] = {'cp': cp,
+                                                  'started': time.time(),
+                                                  'attempts': 1,
+                                                  'speculated': False}
+
+                    self.startAttempt(cp, False)
+
+                if not pending:
+                    self.speculate(running, durations)
+
+                # Wait for an attempt to finish.
+                try:
+                    cp, reply, speculative = self.completions.get(True,
+                                            EvhrNodeDistributor.WAIT_SECONDS)
+
+                except Queue.Empty:
+                    continue
+
+                entry = running.get(cp.constituent.id)
+
+                # The loser of a race that was already decided.
+                if not entry:
+                    continue
+
+                entry['attempts'] -= 1
+                cSuccess = bool(reply and reply.get('success'))
+
+                # Let the other attempt finish.
+                if not cSuccess and entry['attempts']:
+                    continue
+
+                del running[cp.constituent.id]
+                success = success and cSuccess
+
+                if not cSuccess:
+                    continue
+
+                durations.append(time.time() - entry['started'])
+                destination = reply.get('destination')
+
+                if entry['attempts']:
+                    self.cancelAttempt((cp.constituent.id, not speculative))
+
+                if speculative:
+                    destination = self.promote(cp, destination)
+
+                elif entry['speculated']:
+
+                    shutil.rmtree(speculativeDir(
+                                      cp.constituent.request.destination.name,
+                                      cp.constituent.id),
+                                  True)
+
+                self.constituentDone(cp, destination)
+
+        except Exception as e:
+
+            if self.logger:
+                self.logger.info(traceback.format_exc())
+
+            self.cancel()
+            raise e
+
+        return success and not self.cancelled
+
+    #---------------------------------------------------------------------------
+    # nodeFailed
+    #---------------------------------------------------------------------------
+    def nodeFailed(self, name):
+
+        if name not in self.deadNodes and self.logger:
+
+            self.logger.warning('Unable to reach the agent on ' + str(name) +
+                                ', so it will not be used for this request.')
+
+        self.deadNodes.add(name)
+
+    #---------------------------------------------------------------------------
+    # percentile
+    #
+    # This returns the value below which the given percent of values fall.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def percentile(values, percent):
+
+        ordered = sorted(values)
+        index   = int(round(percent / 100.0 * (len(ordered) - 1)))
+
+        return ordered[max(0, min(index, len(ordered) - 1))]
+
+    #---------------------------------------------------------------------------
+    # promote
+    #
+    # This moves a winning speculative duplicate's output and its sidecars from
+    # its scratch directory into the request directory, records it as the
+    # constituent's destination, and returns it.
+    #---------------------------------------------------------------------------
+    def promote(self, cp, destination):
+
+        requestDir = cp.constituent.request.destination.name
+        scratchDir = speculativeDir(requestDir, cp.constituent.id)
+
+        finalDest = os.path.join(requestDir,
+                                 os.path.relpath(destination, scratchDir))
+
+        scratchRoot = os.path.splitext(destination)[0]
+        finalRoot   = os.path.splitext(finalDest)[0]
+
+        for scratchFile in glob.glob(scratchRoot + '.*'):
+
+            if os.path.isfile(scratchFile):
+
+                os.rename(scratchFile,
+                          finalRoot + scratchFile[len(scratchRoot):])
+
+        shutil.rmtree(scratchDir, True)
+
+        cp.constituent.destination = finalDest
+        cp.constituent.save(update_fields = ['destination'])
+
+        if self.logger:
+
+            self.logger.info('The speculative duplicate of constituent ' +
+                             str(cp.constituent.id) + ' won.')
+
+        return finalDest
+
+    #---------------------------------------------------------------------------
+    # runOne
+    #
+    # This runs in an attempt's thread.
+    #---------------------------------------------------------------------------
+    def runOne(self, cp, speculative = False, avoid = None):
+
+        cId     = cp.constituent.id
+        attempt = (cId, speculative)
+        reply   = None
+
+        message = {'op': 'run',
+                   'constituent': cId,
+                   'parent': cp.parent.id,
+                   'speculative': speculative,
+                   'secret': agentSecret()}
+
+        try:
+            while not self.cancelled and attempt not in self.abandoned:
+
+                node = self.chooseNode(avoid)
+
+                if not node:
+
+                    if self.logger and speculative:
+
+                        self.logger.info('No other node can run a duplicate '
+                                         'of constituent ' + str(cId) + '.')
+
+                    elif self.logger:
+
+                        self.logger.error('No node agent can run constituent '
+                                          + str(cId) + '.')
+
+                    break
+
+                try:
+                    sock = socket.create_connection((node, self.port),
+                                            EvhrNodeDistributor.STATUS_SECONDS)
+
+                except socket.error:
+
+                    self.nodeFailed(node)
+                    continue
+
+                if self.logger:
+
+                    self.logger.info('Sending ' +
+                                     ('a speculative duplicate of ' \
+                                      if speculative else '') +
+                                     'constituent ' + str(cId) +
+                                     ' to ' + str(node))
+
+                startTime = time.time()
+
+                with self.lock:
+
+                    self.attemptNodes[attempt] = node
+                    self.sockets[attempt] = sock
+                    self.submitted[node] = self.submitted.get(node, 0) + 1
+
+                try:
+                    # Constituents run for hours, so wait without a timeout.
+                    sock.settimeout(None)
+                    sendMessage(sock, message)
+                    reply = readMessage(sock.makefile('r'))
+
+                except socket.error:
+                    reply = None
+
+                finally:
+
+                    with self.lock:
+
+                        self.sockets.pop(attempt, None)
+                        self.submitted[node] -= 1
+
+                    sock.close()
+
+                if self.cancelled or attempt in self.abandoned:
+
+                    reply = None
+                    break
+
+                if reply == None:
+
+                    # The node died before it replied.
+                    self.nodeFailed(node)
+                    continue
+
+                if 'error' in reply:
+
+                    if self.logger:
+
+                        self.logger.error('The agent on ' + str(node) +
+                                          ' failed constituent ' + str(cId) +
+                                          ': ' + str(reply['error']))
+
+                    reply = None
+                    break
+
+                success = reply['success']
+
+                if self.logger:
+
+                    self.logger.info('Constituent ' + str(cId) +
+                                     (' succeeded' if success else ' failed') +
+                                     ' on ' + str(node) + ' in ' +
+                                     '%.1f' % (time.time() - startTime) +
+                                     ' seconds.')
+
+                break
+
+        except Exception:
+
+            if self.logger:
+                self.logger.error(traceback.format_exc())
+
+        finally:
+            db.connection.close()
+
+        self.completions.put((cp, reply, speculative))
+
+    #---------------------------------------------------------------------------
+    # speculate
+    #
+    # This duplicates running constituents that have taken longer than the
+    # percentile of finished ones, once each.
+    #---------------------------------------------------------------------------
+    def speculate(self, running, durations):
+
+        if self.percentile == None or len(durations) < self.minSamples:
+            return
+
+        threshold = EvhrNodeDistributor.percentile(durations, self.percentile)
+        now       = time.time()
+
+        for cId, entry in running.items():
+
+            if entry['speculated'] or now - entry['started'] <= threshold:
+                continue
+
+            # The duplicate's scratch directory mirrors the request's.
+            cp = entry['cp']
+
+            if not cp.inputFile.startswith(
+                                    cp.constituent.request.destination.name):
+                continue
+
+            with self.lock:
+                node = self.attemptNodes.get((cId, False))
+
+            # Wait until the original reached a node.
+            if not node:
+                continue
+
+            if self.logger:
+
+                self.logger.info('Constituent ' + str(cId) + ' has run ' +
+                                 '%.1f' % (now - entry['started']) +
+                                 ' seconds, longer than ' +
+                                 str(self.percentile) + '% of those ' +
+                                 'finished, so it will be duplicated.')
+
+            entry['speculated'] = True
+            entry['attempts'] += 1
+            self.startAttempt(cp, True, node)
+
+    #---------------------------------------------------------------------------
+    # startAttempt
+    #---------------------------------------------------------------------------
+    def startAttempt(self, cp, speculative, avoid = None):
+
+        thread = threading.Thread(target = self.runOne,
+                                  args = (cp, speculative, avoid))
+
+        thread.daemon = True
+        thread.start()
@@ -0,0 +1,260 @@
+import math
+
+from django.conf import settings
+
+from GeoProcessingEngine.management.GeoRetriever import GeoRetriever
+from GeoProcessingEngine.models import GeoRequest
+
+from EvhrEngine.management.DgFile import DgFile
+from EvhrEngine.management.EvhrToaRetriever import EvhrToaRetriever
+from EvhrEngine.management.FootprintsQuery import FootprintsQuery
+from EvhrEngine.models import EvhrScene
+
+#-------------------------------------------------------------------------------
+# EvhrPlanner
+#
+# This works out what an EVHR request would do, without doing it:  its scenes,
+# their strips, the tasks of each strip's TaskGraph, and the CPU-hours, peak
+# memory and disk they need.  Nothing is saved, so requests can be sized before
+# they are ordered.
+#
+# Stages cost STAGE_COSTS per task, in CPU-hours and GB written.  Calibrate
+# them for the cluster with settings.PLANNER_STAGE_COSTS, keyed by stage, like
+# {'ortho': {'cpuHours': 0.5, 'diskGB': 2.0}}.  Memory comes from the ToA
+# retriever's stage profiles, which admission control also uses.
+#
+# planner = EvhrPlanner(-148, 65, -147.5, 64.5, srs)
+# plan = planner.plan()
+#
+# {'scenes': 3, 'strips': {stripName: {...}, ...}, 'demTiles': 2,
+#  'tasks': {'extract': 3, 'mosaic': 1, ...},
+#  'cpuHours': 1.2, 'peakMemoryGB': 16, 'diskGB': 6.5}
+#-------------------------------------------------------------------------------
+class EvhrPlanner(object):
+
+    # Per task
+    STAGE_COSTS = {'extract': {'cpuHours': 0.02, 'diskGB': 0.5},
+                   'mosaic':  {'cpuHours': 0.05, 'diskGB': 1.0},
+                   'dem':     {'cpuHours': 0.05, 'diskGB': 0.2},
+                   'ortho':   {'cpuHours': 0.5,  'diskGB': 1.0},
+                   'toa':     {'cpuHours': 0.05, 'diskGB': 1.0},
+                   'merge':   {'cpuHours': 0.02, 'diskGB': 1.0}}
+
+    STAGES = ['extract', 'mosaic', 'dem', 'ortho', 'toa', 'merge']
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #
+    # Without sceneFiles, Footprints is queried for the AoI, as the retriever
+    # would.
+    #---------------------------------------------------------------------------
+    def __init__(self, ulx, uly, lrx, lry, srs, sceneFiles = None,
+                 logger = None):
+
+        self.logger     = logger
+        self.sceneFiles = sceneFiles
+        self.srs        = srs
+        self.ulx        = float(ulx)
+        self.uly        = float(uly)
+        self.lrx        = float(lrx)
+        self.lry        = float(lry)
+
+    #---------------------------------------------------------------------------
+    # forRequest
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def forRequest(request, logger = None):
+
+        geoRequest = GeoRequest.objects.get(id = request.id)
+
+        sceneFiles = list(EvhrScene.objects.filter(request = request). \
+                                            values_list('sceneFile',
+                                                        flat = True))
+
+        return EvhrPlanner(geoRequest.ulx,
+                           geoRequest.uly,
+                           geoRequest.lrx,
+                           geoRequest.lry,
+                           GeoRetriever.constructSrs(geoRequest.srs),
+                           sceneFiles or None,
+                           logger)
+
+    #---------------------------------------------------------------------------
+    # getDemTiles
+    #
+    # SRTM tiles are one degree square.
+    #---------------------------------------------------------------------------
+    def getDemTiles(self):
+
+        ulx, uly, lrx, lry = self.getGeographicBbox()
+
+        cols = int(math.ceil(lrx)) - int(math.floor(ulx))
+        rows = int(math.ceil(uly)) - int(math.floor(lry))
+
+        return max(1, cols) * max(1, rows)
+
+    #---------------------------------------------------------------------------
+    # getGeographicBbox
+    #---------------------------------------------------------------------------
+    def getGeographicBbox(self):
+
+        return GeoRetriever.transformBbox(self.ulx,
+                                          self.uly,
+                                          self.lrx,
+                                          self.lry,
+                                          self.srs,
+                                          GeoRetriever.GEOG_4326)
+
+    #---------------------------------------------------------------------------
+    # getScenes
+    #---------------------------------------------------------------------------
+    def getScenes(self):
+
+        if self.sceneFiles != None:
+            return sorted(self.sceneFiles)
+
+        fpq = FootprintsQuery(logger = self.logger)
+        fpq.addAoI(self.ulx, self.uly, self.lrx, self.lry, self.srs)
+        fpq.setMinimumOverlapInDegrees()
+
+        maxScenes = EvhrToaRetriever.MAXIMUM_SCENES
+
+        if hasattr(settings, 'MAXIMUM_SCENES'):
+            maxScenes = min(maxScenes, settings.MAXIMUM_SCENES)
+
+        fpq.setMaximumScenes(maxScenes)
+
+        return sorted([fps.fileName() for fps in fpq.getScenes()])
+
+    #---------------------------------------------------------------------------
+    # getStageCosts
+    #
+    # This returns {stage: {'cpuHours':, 'diskGB':, 'memoryGB':}, ...}.
+    #---------------------------------------------------------------------------
+    def getStageCosts(self):
+
+        stageProfiles = EvhrToaRetriever.stageProfiles
+
+        if hasattr(settings, 'CONSTITUENT_STAGE_PROFILES') and \
+           'EvhrToaRetriever' in settings.CONSTITUENT_STAGE_PROFILES:
+
+            stageProfiles = \
+                settings.CONSTITUENT_STAGE_PROFILES['EvhrToaRetriever']
+
+        calibrated = {}
+
+        if hasattr(settings, 'PLANNER_STAGE_COSTS'):
+            calibrated = settings.PLANNER_STAGE_COSTS
+
+        costs = {}
+
+        for stage in EvhrPlanner.STAGES:
+
+            costs[stage] = dict(EvhrPlanner.STAGE_COSTS[stage])
+            costs[stage].update(calibrated.get(stage, {}))
+
+            costs[stage]['memoryGB'] = \
+                stageProfiles.get(stage, {}).get('memoryGB', 1)
+
+        return costs
+
+    #---------------------------------------------------------------------------
+    # groupStrips
+    #
+    # This returns {stripName: [scene, ...], ...}.
+    #---------------------------------------------------------------------------
+    def groupStrips(self, sceneFiles):
+
+        strips = {}
+
+        for sceneFile in sceneFiles:
+
+            stripName = DgFile(sceneFile, self.logger).getStripName()
+            strips.setdefault(stripName, []).append(sceneFile)
+
+        return strips
+
+    #---------------------------------------------------------------------------
+    # plan
+    #---------------------------------------------------------------------------
+    def plan(self):
+
+        costs  = self.getStageCosts()
+        scenes = self.getScenes()
+        strips = self.groupStrips(scenes)
+
+        plan = {'scenes': len(scenes),
+                'strips': {},
+                'demTiles': self.getDemTiles(),
+                'tasks': dict([(stage, 0) for stage in EvhrPlanner.STAGES]),
+                'cpuHours': 0.0,
+                'peakMemoryGB': 0,
+                'diskGB': 0.0}
+
+        stripPeaks = []
+
+        for stripName, stripScenes in strips.items():
+
+            stripPlan = self.planStrip(stripName, stripScenes, costs)
+            plan['strips'][stripName] = stripPlan
+            stripPeaks.append(stripPlan['peakMemoryGB'])
+
+            for stage, numTasks in stripPlan['tasks'].items():
+                plan['tasks'][stage] += numTasks
+
+            plan['cpuHours'] += stripPlan['cpuHours']
+            plan['diskGB'] += stripPlan['diskGB']
+
+        # The heaviest strips may run at once.
+        maxRunning = 1
+
+        if hasattr(settings, 'MAXIMUM_PROCESSES'):
+            maxRunning = settings.MAXIMUM_PROCESSES
+
+        plan['peakMemoryGB'] = \
+            sum(sorted(stripPeaks, reverse = True)[:maxRunning])
+
+        return plan
+
+    #---------------------------------------------------------------------------
+    # planStrip
+    #
+    # The tasks mirror EvhrToaRetriever.retrieveOne():  each band is extracted
+    # from each scene, mosaicked, orthorectified and converted to TOA, with
+    # one DEM and one merge for the strip.
+    #---------------------------------------------------------------------------
+    def planStrip(self, stripName, stripScenes, costs):
+
+        numBands = len(EvhrToaRetriever.getStripBandNames(stripName))
+
+        tasks = {'extract': numBands * len(stripScenes),
+                 'mosaic': numBands,
+                 'dem': 1,
+                 'ortho': numBands,
+                 'toa': numBands,
+                 'merge': 1}
+
+        stripPlan = {'scenes': len(stripScenes),
+                     'bands': numBands,
+                     'tasks': tasks,
+                     'cpuHours': 0.0,
+                     'peakMemoryGB': 0,
+                     'diskGB': 0.0}
+
+        taskThreads = EvhrToaRetriever.taskThreads
+
+        for stage, numTasks in tasks.items():
+
+            stripPlan['cpuHours'] += numTasks * costs[stage]['cpuHours']
+            stripPlan['diskGB'] += numTasks * costs[stage]['diskGB']
+
+            # A stage's tasks run concurrently, up to its limit.
+            concurrent = min(numTasks,
+                             EvhrToaRetriever.taskLimits.get(stage,
+                                                             taskThreads))
+
+            stripPlan['peakMemoryGB'] = max(stripPlan['peakMemoryGB'],
+                                            concurrent *
+                                            costs[stage]['memoryGB'])
+
+        return stripPlan
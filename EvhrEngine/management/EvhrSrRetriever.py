@@ -1,6 +1,5 @@
 import math
 import os
-import shutil
 import tempfile
 
 import gdal
@@ -8,6 +7,7 @@ import numpy
 
 from django.conf import settings
 
+from EvhrEngine.management.CommandExecutor import CommandExecutor
 from EvhrEngine.management.DgFile import DgFile
 from EvhrEngine.management.GdalFile import GdalFile
 from EvhrEngine.management.EvhrToaRetriever import EvhrToaRetriever
@@ -15,6 +15,8 @@ from EvhrEngine.management.FootprintsQuery import FootprintsQuery
 from EvhrEngine.management.SystemCommand import SystemCommand
 from EvhrEngine.models import EvhrScene
 
+from ProcessingEngine.management.Retriever import Retriever
+
 #-------------------------------------------------------------------------------
 # class EvhrSrRetriever
 #
@@ -26,14 +28,22 @@ from EvhrEngine.models import EvhrScene
 #-------------------------------------------------------------------------------
 class EvhrSrRetriever(EvhrToaRetriever):
 
+    #---
+    # The SR programs can only run on evhr103, one strip at a time, so only
+    # that stage is serialized.  Strips are orthorectified concurrently.
+    #---
+    stageLimits = {'maiac': 1}
+
+    SR_NODE = 'evhr103'
+
+    stageProfiles = dict(EvhrToaRetriever.stageProfiles,
+                         maiac = {'memoryGB': 4, 'io': True})
+    
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
     def __init__(self, request, logger, numProcesses):
 
-        # NumProcesses must be 1 because SR can only run on evhr103.
-        numProcesses = 1
-        
         # Initialize the base class.
         super(EvhrSrRetriever, self).__init__(request, logger, numProcesses)
 
@@ -69,6 +79,12 @@ class EvhrSrRetriever(EvhrToaRetriever):
         # sCmd = SystemCommand(cmd, None, self.logger, self.request, True, True)
         pass
         
+    #---------------------------------------------------------------------------
+    # aggregateOne
+    #---------------------------------------------------------------------------
+    def aggregateOne(self, constituentFileName, outFile):
+        pass
+        
     #---------------------------------------------------------------------------
     # binToTif
     #---------------------------------------------------------------------------
@@ -116,6 +132,13 @@ class EvhrSrRetriever(EvhrToaRetriever):
 
         outDS = outArr = None
 
+    #---------------------------------------------------------------------------
+    # getStripBandNames
+    #---------------------------------------------------------------------------
+    def getStripBandNames(self, stripName):
+        
+        return ['BAND_C', 'BAND_B', 'BAND_G', 'BAND_R', 'BAND_N']
+
     #---------------------------------------------------------------------------
     # getScenes
     #---------------------------------------------------------------------------
@@ -243,48 +266,12 @@ class EvhrSrRetriever(EvhrToaRetriever):
 
         return constituents
 
-    #---------------------------------------------------------------------------
-    # orthoStrip
-    #
-    # Input:  a mosaic of all the scenes for each band:  a mosaic containing
-    # band1 from every scene, a mosaic containing band2 from every scene ...
-    #
-    # Output:  an orthorectified version of each of the bands in stripBands
-    #---------------------------------------------------------------------------
-    def orthoStrip(self, stripBands, orthoFinal):
-
-        # If the output file exists, don't bother running it again.
-        if not os.path.exists(orthoFinal):
-
-            if self.logger:
-                self.logger.info('Orthorectifing strip {}'.format(orthoFinal))
-
-            # Catch errors, so the constituent continues despite errors.
-            try:
-
-                orthoBands = []
-                
-                for stripBand in stripBands:
-
-                    dgStrip = DgFile(stripBand)
-                    orthoBand = self.orthoOne(stripBand, dgStrip)
-                    orthoBands.append(orthoBand)
-
-                self.mergeBands(orthoBands, orthoFinal)
-      
-                shutil.copy(dgStrip.xmlFileName, 
-                            orthoFinal.replace('.tif', '.xml'))    
-
-            except:
-                pass
-
     #---------------------------------------------------------------------------
     # retrieveOne
     #---------------------------------------------------------------------------
     def retrieveOne(self, constituentFileName, fileList):
         
         stripName = DgFile(fileList[0], self.logger).getStripName()
-        stripBandList = self.scenesToStrip(stripName, fileList)
 
         baseName ='.'.join(os.path.basename(constituentFileName). \
                            split('.')[1:])
@@ -292,26 +279,42 @@ class EvhrSrRetriever(EvhrToaRetriever):
         orthoName = os.path.join(self.orthoDir, 
                                  baseName.replace('.bin', '.tif'))
         
-        self.orthoStrip(stripBandList, orthoName)
-
-        #---
-        # Run the SR code.  Yujie's code does not properly report errors, so
-        # check for expected output after each step.
-        #---
-        metaFileName, binFileName = self.writeMetaAndBin(stripName, orthoName)
+        # If the output file exists, don't bother running it again.
+        if not os.path.exists(orthoName):
 
-        if not os.path.exists(metaFileName) or not os.path.exists(binFileName):
-            raise RuntimeError('WV02Cal failed for ' + constituentFileName)
+            if self.logger:
+                self.logger.info('Orthorectifing strip {}'.format(orthoName))
 
-        wv2File = self.writeWv2(stripName)
+            # Orthorectify the bands concurrently, then merge them.
+            graph = self.createTaskGraph()
+            bandTasks = self.addStripTasks(graph, stripName, fileList)
+            mosaicTasks = [mosaicTask for b, mosaicTask, o in bandTasks]
+            orthoTasks = [orthoTask for b, m, orthoTask in bandTasks]
+            
+            # Merging removes the ortho bands, so take the XML from a mosaic.
+            graph.add('merge ' + stripName,
+                      self.mergeStrip,
+                      [mosaicTasks[-1]] + orthoTasks,
+                      (orthoName,),
+                      'merge')
 
-        if not os.path.exists(wv2File):
-            raise RuntimeError('WVimg5 failed for ' + constituentFileName)
+            #---
+            # Catch errors, so the constituent continues despite errors,
+            # except those worth retrying.
+            #---
+            try:
+                graph.run()
+                
+            except Exception as e:
+                
+                if self.classifyFailure(e) != Retriever.PERMANENT:
+                    raise
 
-        srFile = self.runMaiac(stripName)
-            
-        if not os.path.exists(srFile):
-            raise RuntimeError('MAIAC_WV2_5 failed for ' + constituentFileName)
+        srFile = self.runStage('maiac', 
+                               self.runSr, 
+                               constituentFileName, 
+                               stripName, 
+                               orthoName)
 
         #---
         # Convert SR binary to geoTIFF output
@@ -348,10 +351,7 @@ class EvhrSrRetriever(EvhrToaRetriever):
                   self.srOutputDir + ' ' + \
                   lutDir
             
-            cmd = "pdsh -w {} '{}'".format('evhr103', cmd)
-
-            sCmd = SystemCommand(cmd, None, self.logger, self.request, True,
-                                 False)
+            sCmd = self.runOnSrNode(cmd)
             
             if sCmd.returnCode != 0:
 
@@ -363,18 +363,48 @@ class EvhrSrRetriever(EvhrToaRetriever):
         return srFile      
 
     #---------------------------------------------------------------------------
-    # scenesToStrip()
+    # runOnSrNode
+    #
+    # This runs the command on SR_NODE, through its CommandExecutor.
+    #---------------------------------------------------------------------------
+    def runOnSrNode(self, cmd):
+        
+        executor = CommandExecutor.forNode(EvhrSrRetriever.SR_NODE)
+        
+        return SystemCommand(executor.wrap(cmd, EvhrSrRetriever.SR_NODE),
+                             None,
+                             self.logger,
+                             self.request,
+                             True,
+                             False,
+                             stage = SystemCommand.programName(cmd))
+        
+    #---------------------------------------------------------------------------
+    # runSr
+    #
+    # This runs the SR code on SR_NODE, returning the SR file.  Yujie's code
+    # does not properly report errors, so check for expected output after each
+    # step.
     #---------------------------------------------------------------------------
-    def scenesToStrip(self, stripName, stripScenes):
+    def runSr(self, constituentFileName, stripName, orthoName):
+        
+        metaFileName, binFileName = self.writeMetaAndBin(stripName, orthoName)
+
+        if not os.path.exists(metaFileName) or not os.path.exists(binFileName):
+            raise RuntimeError('WV02Cal failed for ' + constituentFileName)
+
+        wv2File = self.writeWv2(stripName)
 
-        if self.logger:
-            self.logger.info('Extracting bands and mosaicking to strips for' + \
-                    ' {} ({} input scenes)'.format(stripName, len(stripScenes)))
+        if not os.path.exists(wv2File):
+            raise RuntimeError('WVimg5 failed for ' + constituentFileName)
 
-        bands = ['BAND_C', 'BAND_B', 'BAND_G', 'BAND_R', 'BAND_N']
+        srFile = self.runMaiac(stripName)
+            
+        if not os.path.exists(srFile):
+            raise RuntimeError('MAIAC_WV2_5 failed for ' + constituentFileName)
 
-        return self.scenesToStripFromBandList(stripName, stripScenes, bands)
-                  
+        return srFile
+        
     #---------------------------------------------------------------------------
     # writeMetaAndBin
     #---------------------------------------------------------------------------
@@ -421,10 +451,7 @@ class EvhrSrRetriever(EvhrToaRetriever):
             
             # Build and run the command.  
             cmd = wv02CalExe + ' ' + tempInput + ' ' + self.srInputDir
-            cmd = "pdsh -w {} '{}'".format('evhr103', cmd)
-
-            sCmd = SystemCommand(cmd, None, self.logger, self.request, True,
-                                 self.maxProcesses != 1)
+            sCmd = self.runOnSrNode(cmd)
                                  
             if sCmd.returnCode != 0:
 
@@ -486,10 +513,7 @@ class EvhrSrRetriever(EvhrToaRetriever):
                   tempInput + ' ' + \
                   self.srInputDir
 
-            cmd = "pdsh -w {} '{}'".format('evhr103', cmd)
-            
-            sCmd = SystemCommand(cmd, None, self.logger, self.request, True,
-                                 False)
+            sCmd = self.runOnSrNode(cmd)
 
             if sCmd.returnCode != 0:
 
@@ -5,6 +5,7 @@ import math
 import os
 import random
 import shutil
+import threading
 import traceback
 import operator
 
@@ -18,13 +19,17 @@ from EvhrEngine.management.DgFile import DgFile
 from EvhrEngine.management.EvhrHelper import EvhrHelper
 from EvhrEngine.management.FootprintsQuery import FootprintsQuery
 from EvhrEngine.management.FootprintsScene import FootprintsScene
+from EvhrEngine.management.ProductCache import ProductCache
 from EvhrEngine.management.SystemCommand import SystemCommand
+from EvhrEngine.management.SystemCommand import SystemCommandError
 from EvhrEngine.management.TilerHalfDegree import TilerHalfDegree
 from EvhrEngine.management.UTM import UTM
 from EvhrEngine.management.commands.TOA import TOA
 from EvhrEngine.models import EvhrError
 from EvhrEngine.models import EvhrScene
 
+from ProcessingEngine.management.Retriever import Retriever
+
 #-------------------------------------------------------------------------------
 # class EvhrToaRetriever
 #
@@ -40,6 +45,33 @@ class EvhrToaRetriever(GeoRetriever):
 
     MAXIMUM_SCENES = 100
     
+    # Strips with the same footprint share a DEM, so only one creates it.
+    demLocks = {}
+    demLocksLock = threading.Lock()
+    
+    #---
+    # Bands run concurrently, but at most two orthorectifications at once.
+    # Each runs mapproject with two threads.
+    #---
+    slotWeight = 4
+    subprocessBound = True
+    
+    # Increment this when a stage's output changes, to invalidate the cache.
+    productVersion = 1
+    
+    taskLimits = {'ortho': 2}
+    taskThreads = 4
+    
+    #---
+    # Mapproject on a WV03 strip needs many GB, while dg_mosaic, DEM 
+    # mosaicking and band merging mostly read and write.
+    #---
+    stageProfiles = {'mosaic': {'memoryGB': 1, 'io': True},
+                     'dem':    {'memoryGB': 1, 'io': True},
+                     'ortho':  {'memoryGB': 16, 'cpus': 4},
+                     'toa':    {'memoryGB': 2},
+                     'merge':  {'memoryGB': 2, 'io': True}}
+    
     #---------------------------------------------------------------------------
     # __init__
     #---------------------------------------------------------------------------
@@ -82,6 +114,23 @@ class EvhrToaRetriever(GeoRetriever):
                   self.toaDir]:
             if not os.path.exists(d): os.mkdir(d)
             
+        #---
+        # Strips are added to the mosaics as they finish.  These remember
+        # each mosaic's strips, their cloud cover, and which have pyramids.
+        #---
+        self.cloudCover = {}
+        self.mosaics    = {}    # VRT name -> strips
+        self.pyramided  = set()
+        
+        #---
+        # Mosaics, orthos and TOA bands are shared with other requests through
+        # the product cache.  Each product's key is kept with its file, so the
+        # next stage can chain its key from it.
+        #---
+        self.productCache = ProductCache(logger)
+        self.productKeys  = {}    # file -> cache key
+        self.stripScenes  = {}    # strip name -> scenes
+            
     #---------------------------------------------------------------------------
     # aggregate
     #---------------------------------------------------------------------------
@@ -98,8 +147,99 @@ class EvhrToaRetriever(GeoRetriever):
             self.buildVrtAndPyramids(multiList, os.path.join(self.toaDir,
                                                         'toa-multispec.vrt'))
       
+    #---------------------------------------------------------------------------
+    # aggregateOne
+    #
+    # This adds a finished strip to its mosaic, so the mosaic is usable while
+    # other strips run.  Only the new strip gets pyramids.
+    #---------------------------------------------------------------------------
+    def aggregateOne(self, constituentFileName, outFile):
+
+        dgf = DgFile(outFile)
+        
+        if dgf.isPanchromatic():
+            vrtName = 'toa-pan.vrt'
+            
+        elif dgf.isMultispectral():
+            vrtName = 'toa-multispec.vrt'
+            
+        else:
+            return
+            
+        strips = self.mosaics.setdefault(vrtName, set())
+        strips.add(outFile)
+
+        self.buildVrtAndPyramids(list(strips), 
+                                 os.path.join(self.toaDir, vrtName))
+      
+    #---------------------------------------------------------------------------
+    # addStripTasks
+    #
+    # This adds the tasks that orthorectify one strip's bands to a TaskGraph,
+    # and returns [(bandName, mosaicTask, orthoTask), ...].
+    #
+    # extract scene band -> mosaic band ---------------> ortho band
+    #                       mosaic first band -> DEM -->
+    #---------------------------------------------------------------------------
+    def addStripTasks(self, graph, stripName, stripScenes):
+
+        bandTasks = []
+        demTask   = None
+        
+        self.stripScenes[stripName] = stripScenes
+
+        for bandName in self.getStripBandNames(stripName):
+
+            extractTasks = []
+            scenesToExtract = stripScenes
+
+            # A mosaic already made, here or in the cache, needs no bands.
+            if os.path.exists(self.getStripBandFileName(stripName, bandName))\
+               or self.productCache.contains(self.getMosaicKey(stripName, 
+                                                               bandName)):
+                scenesToExtract = []
+                
+            for scene in scenesToExtract:
+
+                extractTasks.append( \
+                    graph.add('extract ' + os.path.basename(scene) + ' ' +
+                              bandName,
+                              self.extractBand,
+                              [],
+                              (scene, bandName),
+                              'extract'))
+
+            mosaicTask = graph.add('mosaic ' + bandName,
+                                   self.mosaicBand,
+                                   extractTasks,
+                                   (stripName, bandName),
+                                   'mosaic')
+
+            # All bands share the strip's footprint, so they share a DEM.
+            if not demTask:
+
+                demTask = graph.add('dem ' + stripName,
+                                    self.createDemForStrip,
+                                    [mosaicTask],
+                                    (),
+                                    'dem')
+
+            orthoTask = graph.add('ortho ' + bandName,
+                                  self.orthoBand,
+                                  [mosaicTask, demTask],
+                                  (),
+                                  'ortho')
+
+            bandTasks.append((bandName, mosaicTask, orthoTask))
+
+        return bandTasks
+
     #---------------------------------------------------------------------------
     # buildVrtAndPyramids
+    #
+    # The VRT is only a list of its strips, so it is rebuilt whole, but
+    # pyramids are built only for strips without them.  The VRT has no
+    # pyramids of its own, so readers use its strips' pyramids.
     #---------------------------------------------------------------------------
     def buildVrtAndPyramids(self, fileList, outVrt):
 
@@ -108,12 +248,26 @@ class EvhrToaRetriever(GeoRetriever):
 
         for outFile in fileList:
 
-            dg = DgFile(outFile)
-            ccDict[outFile] = dg.cloudCover()
+            if outFile not in self.cloudCover:
+                self.cloudCover[outFile] = DgFile(outFile).cloudCover()
+                
+            ccDict[outFile] = self.cloudCover[outFile]
 
         sortedFiles = [key for (key, value) in sorted(ccDict.items(), 
                                      key=operator.itemgetter(1), reverse=True)]
 
+        # Build pyramids for new strips.
+        for outFile in sortedFiles:
+            
+            if outFile not in self.pyramided:
+                
+                cmd = 'gdaladdo -q ' + outFile + ' 2 4 8 16'
+
+                sCmd = SystemCommand(cmd, None, self.logger, self.request, 
+                                     True, True)
+                                     
+                self.pyramided.add(outFile)
+
         # Build the VRT.
         cmd = 'gdalbuildvrt -q -overwrite ' + \
               outVrt + ' ' + \
@@ -121,14 +275,17 @@ class EvhrToaRetriever(GeoRetriever):
 
         sCmd = SystemCommand(cmd, None, self.logger, self.request, True, True)
 
-        # Build pyramids.
-        cmd = 'gdaladdo -q ' + outVrt + ' 2 4 8 16'
-        sCmd = SystemCommand(cmd, None, self.logger, self.request, True, True)
+    #---------------------------------------------------------------------------
+    # cancel
+    #---------------------------------------------------------------------------
+    def cancel(self):
+
+        SystemCommand.killRunning(self.request.id)
 
     #---------------------------------------------------------------------------
     # createDemForOrthos
     #
-    # retrieveOne -> processScene -> orthoOne -> createDemForOrthos
+    # retrieveOne -> orthoBand -> orthoOne -> createDemForOrthos
     #---------------------------------------------------------------------------
     def createDemForOrthos(self, ulx, uly, lrx, lry, srs):
 
@@ -136,26 +293,49 @@ class EvhrToaRetriever(GeoRetriever):
             self.logger.info('Creating DEM for orthorectification.')
 
         # If there is already a clipped DEM for this bounding box, use it.
-        demName = 'dem-'                          + \
-                  str(ulx) + '-'                  + \
-                  str(uly) + '-'                  + \
-                  str(lrx) + '-'                  + \
-                  str(lry) + '-'                  + \
-                  str(srs.GetAuthorityCode(None)) + \
-                  '-adj.tif'
-
-        demName = os.path.join(self.demDir, demName)
+        demName = self.getDemName(ulx, uly, lrx, lry, srs)
 
-        if os.path.exists(demName):
-            return demName
+        with EvhrToaRetriever.demLocksLock:
+            
+            demLock = EvhrToaRetriever.demLocks.setdefault(demName, 
+                                                           threading.Lock())
+            
+        with demLock:
+            
+            if os.path.exists(demName):
+                return demName
+
+            # The name describes the DEM, so it is its key.
+            key = ProductCache.makeKey('dem', 
+                                       [], 
+                                       {'dem': os.path.basename(demName),
+                                        'version': self.productVersion})
+                                       
+            # Expand the bounding box before clipping the DEM.
+            xUlx, xUly, xLrx, xLry = self.expandByPercentage(ulx, uly, lrx, 
+                                                             lry, srs)
+
+            # Mosaic SRTM tiles to cover this AoI.
+            self.productCache.produce(key,
+                                      demName,
+                                      lambda: self.mosaicAndClipDemTiles( \
+                                          demName, xUlx, xUly, xLrx, xLry, 
+                                          srs))
 
-        # Expand the bounding box before clipping the DEM.
-        xUlx, xUly, xLrx, xLry = self.expandByPercentage(ulx, uly, lrx, lry,srs)
+        return demName
 
-        # Mosaic SRTM tiles to cover this AoI.
-        self.mosaicAndClipDemTiles(demName, xUlx, xUly, xLrx, xLry, srs)
+    #---------------------------------------------------------------------------
+    # createDemForStrip
+    #---------------------------------------------------------------------------
+    def createDemForStrip(self, stripBandFile):
 
-        return demName
+        dgStrip = DgFile(stripBandFile)
+        
+        return self.createDemForOrthos(dgStrip.ulx,
+                                       dgStrip.uly,
+                                       dgStrip.lrx,
+                                       dgStrip.lry,
+                                       dgStrip.srs)
 
     #---------------------------------------------------------------------------
     # deleteFiles
@@ -169,6 +349,20 @@ class EvhrToaRetriever(GeoRetriever):
         for f in files:
             os.remove(f)
             
+    #---------------------------------------------------------------------------
+    # extractBand
+    #---------------------------------------------------------------------------
+    def extractBand(self, scene, bandName):
+        
+        return DgFile(scene).getBand(self.bandDir, bandName)
+        
+    #---------------------------------------------------------------------------
+    # finish
+    #---------------------------------------------------------------------------
+    def finish(self):
+
+        SystemCommand.forgetRequest(self.request.id)
+
     #---------------------------------------------------------------------------
     # _fpScenesToEvhrScenes
     #---------------------------------------------------------------------------
@@ -187,6 +381,54 @@ class EvhrToaRetriever(GeoRetriever):
     def getEndPointSRSs(self, endPoint):
         return [GeoRetriever.GEOG_4326]
 
+    #---------------------------------------------------------------------------
+    # getDemName
+    #---------------------------------------------------------------------------
+    def getDemName(self, ulx, uly, lrx, lry, srs):
+        
+        demName = 'dem-'                          + \
+                  str(ulx) + '-'                  + \
+                  str(uly) + '-'                  + \
+                  str(lrx) + '-'                  + \
+                  str(lry) + '-'                  + \
+                  str(srs.GetAuthorityCode(None)) + \
+                  '-adj.tif'
+
+        return os.path.join(self.demDir, demName)
+
+    #---------------------------------------------------------------------------
+    # getMosaicKey
+    #
+    # This returns the product cache key of a strip's band mosaic, from the
+    # strip's scenes, or None when they are unknown.
+    #---------------------------------------------------------------------------
+    def getMosaicKey(self, stripName, bandName):
+        
+        if stripName not in self.stripScenes:
+            return None
+            
+        return ProductCache.makeKey('mosaic',
+                                    self.stripScenes[stripName],
+                                    {'band': bandName,
+                                     'version': self.productVersion})
+        
+    #---------------------------------------------------------------------------
+    # getStripBandFileName
+    #---------------------------------------------------------------------------
+    def getStripBandFileName(self, stripName, bandName):
+        
+        return os.path.join(self.stripDir, 
+                            '{}_{}.r100.tif'.format(stripName, bandName))
+
+    #---------------------------------------------------------------------------
+    # getStripBandNames
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def getStripBandNames(stripName):
+        
+        return ['BAND_P'] if 'P1BS' in stripName else \
+               ['BAND_B', 'BAND_G', 'BAND_R', 'BAND_N']
+
     #---------------------------------------------------------------------------
     # getScenes
     #---------------------------------------------------------------------------
@@ -255,6 +497,92 @@ class EvhrToaRetriever(GeoRetriever):
             
         return constituents
     
+    #---------------------------------------------------------------------------
+    # makeMosaic
+    #
+    # retrieveOne -> mosaicBand -> makeMosaic
+    #---------------------------------------------------------------------------
+    def makeMosaic(self, stripName, bandName, stripBandFile, bandScenes):
+
+        # The cached mosaic could have been evicted since it was found.
+        if not bandScenes:
+
+            bandScenes = [self.extractBand(scene, bandName) for scene in \
+                          self.stripScenes[stripName]]
+            
+        cmd = '/opt/StereoPipeline/bin/dg_mosaic ' + \
+              '--output-nodata-value 0' + \
+              ' --ignore-inconsistencies --output-prefix {} {}'. \
+              format(stripBandFile.replace('.r100.tif', ''), 
+                     ' '.join(bandScenes))
+
+        sCmd = SystemCommand(cmd, stripBandFile, self.logger, 
+                             self.request, True, self.maxProcesses != 1)
+        
+        DgFile(stripBandFile).setBandName(bandName)                          
+
+    #---------------------------------------------------------------------------
+    # makeOrtho
+    #
+    # retrieveOne -> orthoBand -> orthoOne -> makeOrtho
+    #---------------------------------------------------------------------------
+    def makeOrtho(self, bandFile, origDgFile, orthoFile, outRes):
+
+        if self.logger:
+            
+            self.logger.info('Orthorectifying ' + \
+                             str(bandFile) + \
+                             ' to ' + \
+                             orthoFile)
+
+        try:
+            clippedDEM = self.createDemForOrthos(origDgFile.ulx,
+                                                 origDgFile.uly,
+                                                 origDgFile.lrx,
+                                                 origDgFile.lry,
+                                                 origDgFile.srs)
+
+        except RuntimeError, e:
+
+            msg = str(e) + ' Band file: ' + str(bandFile) + \
+                  ' DgFile: ' + str(origDgFile.fileName)
+                  
+            raise RuntimeError(msg)
+
+        # Orthorectify.
+        orthoFileTemp = orthoFile.replace('.tif', '-temp.tif')
+        bandName = DgFile(bandFile).getBandName()
+
+        cmd = '/opt/StereoPipeline/bin/mapproject --nodata-value 0' + \
+              ' --threads=2 -t rpc'                                 + \
+              ' --mpp={}'.format(outRes)                            + \
+              ' --t_srs "{}"'.format(self.proj4)                    + \
+              ' ' + clippedDEM                                      + \
+              ' ' + bandFile                                        + \
+              ' ' + origDgFile.xmlFileName                          + \
+              ' ' + orthoFileTemp
+
+        sCmd = SystemCommand(cmd, 
+                             orthoFileTemp, 
+                             self.logger, 
+                             self.request, 
+                             True,
+                             self.maxProcesses != 1)
+
+        # Convert NoData to settings value, set output type to Int16
+        cmd = '/opt/StereoPipeline/bin/image_calc -c "var_0" {} -d int16   \
+                    --output-nodata-value {} -o {}'.format(orthoFileTemp, 
+                                        settings.NO_DATA_VALUE, orthoFile)
+
+        sCmd = SystemCommand(cmd, orthoFile, self.logger, self.request,
+                             True, True)
+
+        # Copy xml to accompany ortho file (needed for TOA)
+        shutil.copy(origDgFile.xmlFileName,
+                    orthoFile.replace('.tif', '.xml'))
+
+        DgFile(orthoFile).setBandName(bandName)
+
     #---------------------------------------------------------------------------
     # mergeBands
     #---------------------------------------------------------------------------
@@ -275,10 +603,23 @@ class EvhrToaRetriever(GeoRetriever):
                              
         for bandFile in bandFiles: os.remove(bandFile)
 
+    #---------------------------------------------------------------------------
+    # mergeStrip
+    #
+    # This merges the band files, which it removes, and copies the XML of
+    # xmlSource to accompany the output.
+    #---------------------------------------------------------------------------
+    def mergeStrip(self, outFileName, xmlSource, *bandFiles):
+        
+        self.mergeBands(list(bandFiles), outFileName)
+
+        shutil.copy(DgFile(xmlSource).xmlFileName, 
+                    outFileName.replace('.tif', '.xml'))    
+
     #---------------------------------------------------------------------------
     # mosaicAndClipDemTiles
     #
-    # retrieveOne -> processScene -> orthoOne -> createDemForOrthos
+    # retrieveOne -> orthoBand -> orthoOne -> createDemForOrthos
     # -> mosaicAndClipDemTiles
     #
     # To build the SRTM index file:
@@ -366,124 +707,128 @@ class EvhrToaRetriever(GeoRetriever):
         for log in glob.glob(os.path.join(self.demDir, '*log*.txt')):
             os.remove(log) # remove dem_geoid log file
     
+    #---------------------------------------------------------------------------
+    # mosaicBand
+    #
+    # Input: one band extracted from each scene of a strip
+    #
+    # Output:  a mosaic of the band for the whole strip
+    #---------------------------------------------------------------------------
+    def mosaicBand(self, stripName, bandName, *bandScenes):
+
+        stripBandFile = self.getStripBandFileName(stripName, bandName)
+        key = self.getMosaicKey(stripName, bandName)
+
+        self.productCache.produce(key, 
+                                  stripBandFile,
+                                  lambda: self.makeMosaic(stripName,
+                                                          bandName,
+                                                          stripBandFile,
+                                                          bandScenes))
+        
+        DgFile(stripBandFile).setBandName(bandName)                          
+        self.productKeys[stripBandFile] = key
+
+        return stripBandFile
+
+    #---------------------------------------------------------------------------
+    # orthoBand
+    #
+    # The DEM argument only orders this after the DEM task.  orthoOne finds
+    # the DEM it created.
+    #---------------------------------------------------------------------------
+    def orthoBand(self, stripBandFile, demName):
+        
+        return self.orthoOne(stripBandFile, DgFile(stripBandFile))
+        
     #---------------------------------------------------------------------------
     # orthoOne
     #
-    # retrieveOne -> processScene -> orthoOne
+    # retrieveOne -> orthoBand -> orthoOne
     #---------------------------------------------------------------------------
     def orthoOne(self, bandFile, origDgFile):
 
         baseName  = os.path.splitext(os.path.basename(bandFile))[0]
         orthoFile = os.path.join(self.orthoDir, baseName + '-ortho.tif')
-
-        if not os.path.exists(orthoFile):
-
-            if self.logger:
-                
-                self.logger.info('Orthorectifying ' + \
-                                 str(bandFile) + \
-                                 ' to ' + \
-                                 orthoFile)
-
-            try:
-                clippedDEM = self.createDemForOrthos(origDgFile.ulx,
-                                                     origDgFile.uly,
-                                                     origDgFile.lrx,
-                                                     origDgFile.lry,
-                                                     origDgFile.srs)
-
-            except RuntimeError, e:
-
-                msg = str(e) + ' Band file: ' + str(bandFile) + \
-                      ' DgFile: ' + str(origDgFile.fileName)
-                      
-                raise RuntimeError(msg)
-
-            # Orthorectify.
-            orthoFileTemp = orthoFile.replace('.tif', '-temp.tif')
-            bandName = DgFile(bandFile).getBandName()
-            outRes = 2
-            if origDgFile.isPanchromatic(): outRes = 1            
-
-            cmd = '/opt/StereoPipeline/bin/mapproject --nodata-value 0' + \
-                  ' --threads=2 -t rpc'                                 + \
-                  ' --mpp={}'.format(outRes)                            + \
-                  ' --t_srs "{}"'.format(self.proj4)                    + \
-                  ' ' + clippedDEM                                      + \
-                  ' ' + bandFile                                        + \
-                  ' ' + origDgFile.xmlFileName                          + \
-                  ' ' + orthoFileTemp
-
-            sCmd = SystemCommand(cmd, 
-                                 orthoFileTemp, 
-                                 self.logger, 
-                                 self.request, 
-                                 True,
-                                 self.maxProcesses != 1)
-
-            # Convert NoData to settings value, set output type to Int16
-            cmd = '/opt/StereoPipeline/bin/image_calc -c "var_0" {} -d int16   \
-                        --output-nodata-value {} -o {}'.format(orthoFileTemp, 
-                                            settings.NO_DATA_VALUE, orthoFile)
-
-            sCmd = SystemCommand(cmd, orthoFile, self.logger, self.request,
-                                 True, True)
-
-            # Copy xml to accompany ortho file (needed for TOA)
-            shutil.copy(origDgFile.xmlFileName,
-                        orthoFile.replace('.tif', '.xml'))
-
-            DgFile(orthoFile).setBandName(bandName)
+        outRes    = 1 if origDgFile.isPanchromatic() else 2
+        key       = None
+        
+        if self.productKeys.get(bandFile):
+            
+            demName = self.getDemName(origDgFile.ulx,
+                                      origDgFile.uly,
+                                      origDgFile.lrx,
+                                      origDgFile.lry,
+                                      origDgFile.srs)
+                                      
+            key = ProductCache.makeKey('ortho',
+                                       [self.productKeys[bandFile]],
+                                       {'dem': os.path.basename(demName),
+                                        'outRes': outRes,
+                                        'proj4': self.proj4,
+                                        'version': self.productVersion})
+
+        self.productCache.produce(key, 
+                                  orthoFile,
+                                  lambda: self.makeOrtho(bandFile, 
+                                                         origDgFile, 
+                                                         orthoFile, 
+                                                         outRes))
+
+        self.productKeys[orthoFile] = key
 
         return orthoFile
 
     #---------------------------------------------------------------------------
-    # processStrip()
+    # retrieveOne
     #
-    # Takes a strip and a list of band mosaics (from dg_mosaic) and processes
     # The original NITF, extracted band strips and orthorectified strips remain
     # unclipped.  Only the final orthorectified image is clipped in mergeBands
     # or compress. 
     #---------------------------------------------------------------------------
-    def processStrip(self, stripBands, toaFinal):
+    def retrieveOne(self, constituentFileName, fileList):
 
         # If the output file exists, don't bother running it again.
-        if not os.path.exists(toaFinal):
-
-            if self.logger:
-                self.logger.info('Processing strip {}'.format(toaFinal))
-
-            # Catch errors, so the constituent continues despite errors.
-            try:
-
-                toaBands = []
-                
-                for stripBand in stripBands:
+        if os.path.exists(constituentFileName):
+            return constituentFileName
+            
+        stripName = DgFile(fileList[0], self.logger).getStripName()
 
-                    dgStrip = DgFile(stripBand)
-                    orthoBand = self.orthoOne(stripBand, dgStrip)
+        if self.logger:
+            
+            self.logger.info('Processing strip {} ({} input scenes)'. \
+                             format(constituentFileName, len(fileList)))
 
-                    toaBands.append(TOA.run(orthoBand,
-                                            self.toaDir,
-                                            stripBand, # instead of inputNitf
-                                            self.logger))
+        graph = self.createTaskGraph()
+        toaTasks = []
+        
+        for bandName, mosaicTask, orthoTask in \
+            self.addStripTasks(graph, stripName, fileList):
 
-                self.mergeBands(toaBands, toaFinal)
-      
-                shutil.copy(DgFile(orthoBand).xmlFileName, 
-                            toaFinal.replace('.tif', '.xml'))    
+            toaTasks.append(graph.add('toa ' + bandName,
+                                      self.toaBand,
+                                      [orthoTask, mosaicTask],
+                                      (),
+                                      'toa'))
 
-            except:
-                pass
+        graph.add('merge ' + stripName,
+                  self.mergeStrip,
+                  [orthoTask] + toaTasks,
+                  (constituentFileName,),
+                  'merge')
 
-    #---------------------------------------------------------------------------
-    # retrieveOne
-    #---------------------------------------------------------------------------
-    def retrieveOne(self, constituentFileName, fileList):
+        #---
+        # Catch errors, so the constituent continues despite errors, except
+        # those worth retrying.
+        #---
+        try:
+            graph.run()
+            
+        except Exception as e:
+            
+            if self.classifyFailure(e) != Retriever.PERMANENT:
+                raise
 
-        stripName = DgFile(fileList[0], self.logger).getStripName()
-        stripBandList = self.scenesToStrip(stripName, fileList)
-        self.processStrip(stripBandList, constituentFileName)
         # self.deleteFiles(self.stripDir)
         # self.deleteFiles(self.demDir)
         # self.deleteFiles(self.orthoDir)
@@ -491,61 +836,46 @@ class EvhrToaRetriever(GeoRetriever):
         return constituentFileName
 
     #---------------------------------------------------------------------------
-    # scenesToStrip
+    # speculate
+    #
+    # A speculative duplicate makes the products whose leases are held,
+    # because the slow original racing it may hold them.
     #---------------------------------------------------------------------------
-    def scenesToStrip(self, stripName, stripScenes):
-
-        if self.logger:
-            self.logger.info('Extracting bands and mosaicking to strips for' + \
-                    ' {} ({} input scenes)'.format(stripName, len(stripScenes)))
-
-        bands = ['BAND_P'] if 'P1BS' in stripName else \
-                ['BAND_B', 'BAND_G', 'BAND_R', 'BAND_N']
+    def speculate(self):
 
-        return self.scenesToStripFromBandList(stripName, stripScenes, bands)
+        self.productCache.waitForLeases = False
 
     #---------------------------------------------------------------------------
-    # scenesToStripFromBandList
-    #
-    # This need not have stripName passed because stripName is derived from any
-    # of the stripScenes.
-    #
-    # Input: a list of scenes all belonging to the same strip and list of bands
-    #
-    # Output:  a mosaic of all the scenes for each band:  a mosaic containing
-    # band1 from every scene, a mosaic containing band2 from every scene ...
+    # toaBand
     #---------------------------------------------------------------------------
-    def scenesToStripFromBandList(self, stripName, stripScenes, bands):
-
-        stripBandList = [] # Length of list = number of bands
-
-        for bandName in bands:
-           
-            bandScenes = [DgFile(scene).getBand(self.bandDir, bandName) \
-                         for scene in stripScenes]
- 
-            bandScenesStr = ' '.join(bandScenes)
-
-            stripBandFile = os.path.join(self.stripDir, 
-                                         '{}_{}.r100.tif'.format(stripName, 
-                                                                 bandName))
-
-            if not os.path.exists(stripBandFile):
-                
-                cmd = '/opt/StereoPipeline/bin/dg_mosaic ' + \
-                      '--output-nodata-value 0' + \
-                      ' --ignore-inconsistencies --output-prefix {} {}'. \
-                      format(stripBandFile.replace('.r100.tif', ''), 
-                             bandScenesStr)
-
-                sCmd = SystemCommand(cmd, stripBandFile, self.logger, 
-                                     self.request, True, self.maxProcesses != 1)
+    def toaBand(self, orthoBandFile, stripBandFile):
+        
+        toaBandFile = os.path.join(self.toaDir, 
+                                   os.path.basename(orthoBandFile). \
+                                       replace('.tif', '-toa.tif'))
+        
+        key = None
+        
+        if self.productKeys.get(orthoBandFile):
             
-            DgFile(stripBandFile).setBandName(bandName)                          
-            stripBandList.append(stripBandFile) 
-
-        # Return the list of band strips.
-        return stripBandList
+            key = ProductCache.makeKey('toa', 
+                                       [self.productKeys[orthoBandFile]],
+                                       {'version': self.productVersion})
+        
+        self.productCache.produce(key,
+                                  toaBandFile,
+                                  lambda: TOA.run(orthoBandFile,
+                                                  self.toaDir,
+                                                  stripBandFile, # not NITF
+                                                  self.logger))
+                              
+        # TOA reports failures by not creating its output.
+        if not os.path.exists(toaBandFile):
+            
+            raise SystemCommandError('TOA did not create ' + toaBandFile + 
+                                     ' for band file ' + orthoBandFile + '.')
+            
+        return toaBandFile
 
     #---------------------------------------------------------------------------
     # _validateScenes
@@ -0,0 +1,512 @@
+import datetime
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import Queue
+import select
+import shutil
+import signal
+import socket
+import SocketServer
+import threading
+import time
+import traceback
+
+from django import db
+from django.conf import settings
+
+from ProcessingEngine.management.AdmissionController \
+    import AdmissionController
+
+from ProcessingEngine.management.ConstituentProcessor \
+    import ConstituentProcessor
+
+from EvhrEngine.management.SystemCommand import SystemCommand
+from EvhrEngine.models import EvhrNode
+
+from ProcessingEngine.management.RequestProcessor import RequestProcessor
+from ProcessingEngine.management.SlotPool import SlotPool
+from ProcessingEngine.models import Constituent
+from ProcessingEngine.models import Request
+from ProcessingEngine.models import RequestProcess
+from ProcessingEngine.models import thisHost
+
+from JobDaemon.management.RequestWorkerPool import getTrueRequest
+
+#-------------------------------------------------------------------------------
+# agentPort
+#-------------------------------------------------------------------------------
+def agentPort():
+
+    port = 8760
+
+    if hasattr(settings, 'NODE_AGENT_PORT'):
+        port = settings.NODE_AGENT_PORT
+
+    return port
+
+#-------------------------------------------------------------------------------
+# agentSecret
+#
+# Agents only obey messages carrying settings.NODE_AGENT_SECRET.
+#-------------------------------------------------------------------------------
+def agentSecret():
+
+    if hasattr(settings, 'NODE_AGENT_SECRET'):
+        return settings.NODE_AGENT_SECRET
+
+    return None
+
+#-------------------------------------------------------------------------------
+# callAgent
+#
+# This sends one message to the agent on host, with the secret, and returns
+# its reply.  With a timeout, socket.timeout is raised when the agent is slow
+# to reply.
+#-------------------------------------------------------------------------------
+def callAgent(host, message, port = None, timeout = None):
+
+    sock = socket.create_connection((host, port or agentPort()), timeout)
+
+    try:
+        sendMessage(sock, dict(message, secret = agentSecret()))
+        return readMessage(sock.makefile('r'))
+
+    finally:
+        sock.close()
+
+#-------------------------------------------------------------------------------
+# readMessage
+#
+# Messages are JSON objects, one per line.  This returns None at the end of
+# the stream.
+#-------------------------------------------------------------------------------
+def readMessage(stream):
+
+    line = stream.readline()
+
+    if not line:
+        return None
+
+    return json.loads(line)
+
+#-------------------------------------------------------------------------------
+# sendMessage
+#-------------------------------------------------------------------------------
+def sendMessage(sock, message):
+
+    sock.sendall(json.dumps(message) + '\n')
+
+#-------------------------------------------------------------------------------
+# speculativeDir
+#
+# Speculative duplicates of a constituent work in this copy of the request
+# directory, so they cannot clash with the original.
+#-------------------------------------------------------------------------------
+def speculativeDir(requestDir, constituentId):
+
+    return os.path.join(requestDir, 'speculative', str(constituentId))
+
+#-------------------------------------------------------------------------------
+# NodeAgent
+#
+# This runs on each EvhrNode host, and processes whole constituents sent by
+# EvhrNodeDistributor, so a strip's entire pipeline runs on one node, instead
+# of each of its commands paying for pdsh.  Every connection carries one
+# request and its reply, each a line of JSON.
+#
+#    {'op': 'status', 'secret': ...}
+#        -> {'host': ..., 'running': ..., 'cpus': ..., 'load': ...}
+#
+#    {'op': 'run', 'constituent': ..., 'parent': ..., 'speculative': ...,
+#     'secret': ...}
+#        -> {'constituent': ..., 'success': ..., 'destination': ...,
+#            'host': ..., 'pid': ...}
+#
+# The agent listens on settings.NODE_AGENT_ADDRESS, localhost by default, and
+# refuses messages without settings.NODE_AGENT_SECRET.  It will not start
+# without the secret.
+#
+# Constituents run in child processes, after the node's constituent slot pool
+# and admission control allow them, exactly as they would on the daemon's
+# host.  The database and request directories are shared, so the agent only
+# needs the IDs of the constituent and its parent RequestProcess.  The
+# constituent's request, input file and files are read from its row, never
+# from the message, because they become command lines.  When
+# the distributor closes the connection before the reply, the constituent is
+# terminated, with the commands it is running.
+#
+# Retrievers are built once per request, and their lines are appended to the
+# request's log.
+#
+# startHeartbeat() records the node's load average in its EvhrNode every
+# settings.NODE_HEARTBEAT_SECONDS, so SystemCommand can weigh real load when
+# choosing nodes.
+#
+# A speculative run duplicates a slow constituent running elsewhere.  It gets
+# its own retriever, working in speculativeDir(), and does not touch the
+# constituent's records, which belong to the original.  Its destination is in
+# that directory, and the distributor moves it into place if it wins.  The
+# directory is removed when it fails or is cancelled.
+#
+# manage.py nodeAgent
+#-------------------------------------------------------------------------------
+class NodeAgent(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+
+    allow_reuse_address = True
+    daemon_threads      = True
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger, port = None, address = None):
+
+        if not agentSecret():
+            raise RuntimeError('settings.NODE_AGENT_SECRET must be set.')
+
+        if address == None:
+
+            address = 'localhost'
+
+            if hasattr(settings, 'NODE_AGENT_ADDRESS'):
+                address = settings.NODE_AGENT_ADDRESS
+
+        SocketServer.TCPServer.__init__(self,
+                                        (address, agentPort() \
+                                                  if port == None else port),
+                                        NodeAgentHandler)
+
+        self.admission  = AdmissionController(logger)
+        self.lock       = threading.Lock()
+        self.logger     = logger
+        self.retrievers = {}    # request ID -> retriever
+        self.running    = 0
+        self.slotPool   = None
+
+    #---------------------------------------------------------------------------
+    # authorized
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def authorized(message):
+
+        return hmac.compare_digest(str(message.get('secret') or ''),
+                                   str(agentSecret()))
+
+    #---------------------------------------------------------------------------
+    # buildRetriever
+    #
+    # Given workDir, the retriever works there, instead of in the request's
+    # directory.
+    #---------------------------------------------------------------------------
+    def buildRetriever(self, requestId, workDir = None):
+
+        request = getTrueRequest(Request.objects.get(id = requestId))
+
+        reqLogger = logging.getLogger('nodeAgent.request.' + str(requestId))
+        reqLogger.setLevel(logging.INFO)
+
+        if not reqLogger.handlers:
+
+            logFile = os.path.join(request.destination.name,
+                                   request.name + '.log')
+
+            reqLogger.addHandler(logging.FileHandler(logFile))
+
+        if workDir:
+            request.destination.name = workDir
+
+        return RequestProcessor(request, -1, reqLogger).chooseRetriever()
+
+    #---------------------------------------------------------------------------
+    # getRetriever
+    #---------------------------------------------------------------------------
+    def getRetriever(self, requestId):
+
+        with self.lock:
+
+            if requestId not in self.retrievers:
+                self.retrievers[requestId] = self.buildRetriever(requestId)
+
+            if self.slotPool == None:
+                self.slotPool = SlotPool.constituentPool(self.logger)
+
+            return self.retrievers[requestId]
+
+    #---------------------------------------------------------------------------
+    # heartbeat
+    #
+    # This runs in the heartbeat thread.  Nodes are named by their short host
+    # names.
+    #---------------------------------------------------------------------------
+    def heartbeat(self, seconds):
+
+        host = thisHost()
+
+        while True:
+
+            try:
+                EvhrNode.objects.filter(name__in = [host,
+                                                    host.split('.')[0]]). \
+                    update(load = AdmissionController.readLoadAverage(),
+                           heartbeat = datetime.datetime.now())
+
+            except Exception:
+
+                if self.logger:
+                    self.logger.warning(traceback.format_exc())
+
+            finally:
+                db.connection.close()
+
+            time.sleep(seconds)
+
+    #---------------------------------------------------------------------------
+    # runConstituent
+    #
+    # This runs in the connection's thread, and returns the reply.
+    #---------------------------------------------------------------------------
+    def runConstituent(self, message, connection):
+
+        constituent = Constituent.objects.get(id = message['constituent'])
+        requestId   = constituent.request_id
+        retriever   = self.getRetriever(requestId)
+        inputFile   = constituent.inputFile
+        files       = json.loads(constituent.constituentFiles)
+        scratchDir  = None
+
+        parent      = RequestProcess.objects.get(id = message['parent'],
+                                                 request = requestId)
+
+        result      = {'constituent': constituent.id,
+                       'success': False,
+                       'destination': None,
+                       'host': thisHost()}
+
+        if message.get('speculative'):
+
+            requestDir = retriever.request.destination.name
+            scratchDir = speculativeDir(requestDir, constituent.id)
+
+            if not os.path.exists(scratchDir):
+                os.makedirs(scratchDir)
+
+            retriever = self.buildRetriever(requestId, scratchDir)
+
+            target = runSpeculativeConstituent
+
+            args = (retriever,
+                    inputFile.replace(requestDir, scratchDir, 1),
+                    files)
+
+        else:
+
+            target = runRemoteConstituent
+
+            args = (retriever,
+                    inputFile,
+                    files,
+                    constituent,
+                    parent)
+
+        profile = retriever.getCostProfile()
+        weight  = retriever.getSlotWeight()
+
+        self.admission.wait(profile,
+                            lambda: self.slotPool.capacity - \
+                                    self.slotPool.available())
+
+        slot = self.slotPool.acquire(weight)
+        resultQueue = multiprocessing.Queue()
+
+        process = multiprocessing.Process(target = target,
+                                          args = args + (resultQueue,))
+
+        with self.lock:
+            self.running += 1
+
+        try:
+            # The child must not share this thread's database connection.
+            db.connection.close()
+            process.start()
+            result['pid'] = process.pid
+
+            while True:
+
+                try:
+                    result.update(resultQueue.get(True, 1))
+                    break
+
+                except Queue.Empty:
+                    pass
+
+                if not process.is_alive():
+                    break
+
+                # The distributor closing the connection cancels the work.
+                if select.select([connection], [], [], 0)[0] and \
+                   not connection.recv(1, socket.MSG_PEEK):
+
+                    if self.logger:
+
+                        self.logger.info('Cancelling constituent ' +
+                                         str(constituent.id))
+
+                    process.terminate()
+                    break
+
+            process.join(5)
+
+        finally:
+
+            with self.lock:
+                self.running -= 1
+
+            self.slotPool.release(slot)
+
+        if scratchDir and not result['success']:
+            shutil.rmtree(scratchDir, True)
+
+        return result
+
+    #---------------------------------------------------------------------------
+    # startHeartbeat
+    #---------------------------------------------------------------------------
+    def startHeartbeat(self):
+
+        seconds = 60
+
+        if hasattr(settings, 'NODE_HEARTBEAT_SECONDS'):
+            seconds = settings.NODE_HEARTBEAT_SECONDS
+
+        thread = threading.Thread(target = self.heartbeat, args = (seconds,))
+        thread.daemon = True
+        thread.start()
+
+    #---------------------------------------------------------------------------
+    # status
+    #---------------------------------------------------------------------------
+    def status(self):
+
+        try:
+            load = AdmissionController.readLoadAverage()
+
+        except (IOError, OSError, ValueError):
+            load = None
+
+        return {'host': thisHost(),
+                'running': self.running,
+                'cpus': multiprocessing.cpu_count(),
+                'load': load}
+
+#-------------------------------------------------------------------------------
+# NodeAgentHandler
+#-------------------------------------------------------------------------------
+class NodeAgentHandler(SocketServer.StreamRequestHandler):
+
+    #---------------------------------------------------------------------------
+    # handle
+    #---------------------------------------------------------------------------
+    def handle(self):
+
+        agent = self.server
+
+        try:
+            message = readMessage(self.rfile)
+
+            if not message:
+                return
+
+            if not agent.authorized(message):
+
+                if agent.logger:
+
+                    agent.logger.warning('Refused a message from ' +
+                                         str(self.client_address[0]) +
+                                         ' without the secret.')
+
+                reply = {'error': 'Not authorized.'}
+
+            elif message.get('op') == 'status':
+                reply = agent.status()
+
+            elif message.get('op') == 'run':
+                reply = agent.runConstituent(message, self.connection)
+
+            else:
+                reply = {'error': 'Unknown operation: ' +
+                                  str(message.get('op'))}
+
+        except Exception:
+
+            if agent.logger:
+                agent.logger.error(traceback.format_exc())
+
+            reply = {'error': traceback.format_exc()}
+
+        finally:
+            db.connection.close()
+
+        try:
+            sendMessage(self.connection, reply)
+
+        except socket.error:
+
+            # The distributor went away.
+            pass
+
+#-------------------------------------------------------------------------------
+# runRemoteConstituent
+#
+# This runs in the agent's child process.
+#-------------------------------------------------------------------------------
+def runRemoteConstituent(retriever, inputFile, constituentFiles, constituent,
+                         parent, resultQueue):
+
+    signal.signal(signal.SIGTERM, stopCommands)
+
+    success = ConstituentProcessor.process(retriever,
+                                           inputFile,
+                                           constituentFiles,
+                                           constituent,
+                                           parent,
+                                           retriever.logger)
+
+    destination = constituent.destination.name \
+                  if constituent.destination else None
+
+    resultQueue.put({'success': success, 'destination': destination})
+
+#-------------------------------------------------------------------------------
+# runSpeculativeConstituent
+#
+# This runs in the agent's child process, without registering a
+# ConstituentProcess or retrying, because the original constituent does.
+#-------------------------------------------------------------------------------
+def runSpeculativeConstituent(retriever, inputFile, constituentFiles,
+                              resultQueue):
+
+    signal.signal(signal.SIGTERM, stopCommands)
+    destination = None
+
+    try:
+        retriever.speculate()
+        destination = retriever.retrieveOne(inputFile, constituentFiles)
+
+    except Exception:
+        retriever.logger.info(traceback.format_exc())
+
+    success = bool(destination and os.path.exists(destination))
+    resultQueue.put({'success': success, 'destination': destination})
+
+#-------------------------------------------------------------------------------
+# stopCommands
+#
+# Terminating a constituent's process does not reach its commands, which lead
+# their own process groups, so this kills them before the process exits.
+#-------------------------------------------------------------------------------
+def stopCommands(signum, frame):
+
+    SystemCommand.killRunning()
+    os._exit(1)
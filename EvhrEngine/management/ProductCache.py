@@ -0,0 +1,301 @@
+import errno
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from django.conf import settings
+
+from EvhrEngine.management.StageLease import StageLease
+
+#-------------------------------------------------------------------------------
+# ProductCache
+#
+# Requests each have their own directory, so requests sharing a strip used to
+# redo its mosaics, orthorectifications and TOA bands.  This keeps those
+# products in settings.PRODUCT_CACHE_DIR, shared by every request, and links
+# them into request directories.
+#
+# Products are keyed by what determines their content:  the stage, its inputs
+# and its parameters, like proj4, resolution and DEM source, and the stage's
+# code version.  Inputs are the scenes for the first stage and, for later
+# stages, the keys of the products they consume, so keys chain through the
+# pipeline.
+#
+# Each entry is a directory holding a product and its sidecar files, like its
+# DigitalGlobe XML.  A product x.tif is stored with every x.* file.  Entries
+# are written to a temporary directory, then renamed, so readers never see
+# partial entries.  Fetching hard links the files into the request directory,
+# or symbolic links them when the cache is on another file system.
+#
+# Fetching an entry touches it.  Eviction scans the whole cache, so instead of
+# every store paying for it, the job daemon's housekeeping calls evict(), which
+# removes the least recently used entries beyond
+# settings.PRODUCT_CACHE_QUOTA_GB.  Without PRODUCT_CACHE_DIR, the cache is
+# disabled, and fetch() always misses.
+#
+# produce() also prevents concurrent requests from making the same product:
+# the first takes a StageLease on the key and makes it, while the others wait
+# for the lease, then fetch the product.  Speculative duplicates of a
+# constituent clear waitForLeases, because the lease they would wait for may be
+# held by the slow original they are racing, so they make their own copy.
+#-------------------------------------------------------------------------------
+class ProductCache(object):
+
+    # Serializes eviction among the threads of a process.
+    evictionLock = threading.Lock()
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        self.cacheDir      = None
+        self.logger        = logger
+        self.quotaGB       = 500
+        self.waitForLeases = True
+
+        if hasattr(settings, 'PRODUCT_CACHE_DIR'):
+            self.cacheDir = settings.PRODUCT_CACHE_DIR
+
+        if hasattr(settings, 'PRODUCT_CACHE_QUOTA_GB'):
+            self.quotaGB = settings.PRODUCT_CACHE_QUOTA_GB
+
+        if self.cacheDir and not os.path.exists(self.cacheDir):
+
+            try:
+                os.makedirs(self.cacheDir)
+
+            except OSError as e:
+
+                if e.errno != errno.EEXIST:
+                    raise
+
+    #---------------------------------------------------------------------------
+    # contains
+    #---------------------------------------------------------------------------
+    def contains(self, key):
+
+        return bool(key and self.cacheDir and \
+                    os.path.isdir(self.entryDir(key)))
+
+    #---------------------------------------------------------------------------
+    # entryDir
+    #---------------------------------------------------------------------------
+    def entryDir(self, key):
+
+        return os.path.join(self.cacheDir, key[:2], key)
+
+    #---------------------------------------------------------------------------
+    # evict
+    #
+    # This removes the least recently used entries until the cache is within
+    # its quota, and returns the number removed.
+    #---------------------------------------------------------------------------
+    def evict(self):
+
+        if not self.cacheDir:
+            return 0
+
+        with ProductCache.evictionLock:
+
+            entries = []    # [(mtime, bytes, entry dir), ...]
+            total   = 0
+
+            for entryDir in glob.glob(os.path.join(self.cacheDir, '*', '*')):
+
+                if not os.path.isdir(entryDir) or '.tmp-' in entryDir:
+                    continue
+
+                try:
+                    size = sum([os.path.getsize(f) for f in \
+                                glob.glob(os.path.join(entryDir, '*'))])
+
+                    entries.append((os.path.getmtime(entryDir),
+                                    size,
+                                    entryDir))
+
+                except OSError:
+
+                    # Another process evicted it.
+                    continue
+
+                total += size
+
+            quota      = self.quotaGB * 1024 * 1024 * 1024
+            numRemoved = 0
+
+            for mtime, size, entryDir in sorted(entries):
+
+                if total <= quota:
+                    break
+
+                shutil.rmtree(entryDir, True)
+                total -= size
+                numRemoved += 1
+
+            if numRemoved and self.logger:
+
+                self.logger.info('Evicted ' + str(numRemoved) +
+                                 ' product(s) from the cache.')
+
+            return numRemoved
+
+    #---------------------------------------------------------------------------
+    # fetch
+    #
+    # This links the cached product and its sidecars to outFile, and returns
+    # True, or returns False when the product is not cached.
+    #---------------------------------------------------------------------------
+    def fetch(self, key, outFile):
+
+        if not self.contains(key):
+            return False
+
+        entryDir = self.entryDir(key)
+        outRoot  = os.path.splitext(outFile)[0]
+
+        try:
+            for cachedFile in glob.glob(os.path.join(entryDir, 'product*')):
+
+                suffix = os.path.basename(cachedFile)[len('product'):]
+                ProductCache.link(cachedFile, outRoot + suffix)
+
+            # Record the use, for eviction.
+            os.utime(entryDir, None)
+
+        except OSError:
+
+            # It was evicted while being fetched.
+            return False
+
+        if self.logger:
+            self.logger.info('Using cached product for ' + str(outFile))
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # link
+    #
+    # This hard links src to dest, or symbolic links it across file systems.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def link(src, dest):
+
+        if os.path.lexists(dest):
+            os.remove(dest)
+
+        try:
+            os.link(src, dest)
+
+        except OSError as e:
+
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+
+            os.symlink(src, dest)
+
+    #---------------------------------------------------------------------------
+    # makeKey
+    #
+    # inputs are scene files or the keys of the products a stage consumes.
+    # params is a dict of everything else determining the product.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def makeKey(stage, inputs, params = {}):
+
+        description = json.dumps({'stage': stage,
+                                  'inputs': sorted(inputs),
+                                  'params': params},
+                                 sort_keys = True)
+
+        return hashlib.sha1(description).hexdigest()
+
+    #---------------------------------------------------------------------------
+    # produce
+    #
+    # This ensures outFile exists, linking it from the cache, or calling make()
+    # to create it and caching the result.  Only one requester of a key makes
+    # it at once.  When the maker fails, a waiter makes it instead.
+    #---------------------------------------------------------------------------
+    def produce(self, key, outFile, make):
+
+        if os.path.exists(outFile):
+            return
+
+        if not key or not self.cacheDir:
+
+            make()
+            return
+
+        while not self.fetch(key, outFile):
+
+            lease = StageLease(key, self.logger)
+
+            if lease.acquire():
+
+                try:
+                    # It may have been stored before the lease was taken.
+                    if not self.fetch(key, outFile):
+
+                        make()
+                        self.store(key, outFile)
+
+                finally:
+                    lease.release()
+
+                return
+
+            if not self.waitForLeases:
+
+                make()
+                return
+
+            lease.wait()
+
+    #---------------------------------------------------------------------------
+    # store
+    #
+    # This adds outFile and its sidecars to the cache under key.
+    #---------------------------------------------------------------------------
+    def store(self, key, outFile):
+
+        if not key or not self.cacheDir or not os.path.exists(outFile) or \
+           self.contains(key):
+            return
+
+        entryDir = self.entryDir(key)
+        outRoot  = os.path.splitext(outFile)[0]
+
+        tempDir = entryDir + '.tmp-' + str(os.getpid()) + '-' + \
+                  str(threading.current_thread().ident)
+
+        try:
+            os.makedirs(tempDir)
+
+            for productFile in glob.glob(outRoot + '.*'):
+
+                if os.path.isdir(productFile):
+                    continue
+
+                cachedFile = os.path.join(tempDir, 'product' +
+                                          productFile[len(outRoot):])
+
+                try:
+                    os.link(os.path.realpath(productFile), cachedFile)
+
+                except OSError:
+                    shutil.copy2(productFile, cachedFile)
+
+            # Another process may have stored it first.
+            os.rename(tempDir, entryDir)
+
+        except OSError:
+            pass
+
+        finally:
+
+            if os.path.exists(tempDir):
+                shutil.rmtree(tempDir, True)
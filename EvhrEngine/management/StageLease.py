@@ -0,0 +1,160 @@
+import datetime
+import os
+import threading
+import time
+
+from django import db
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction
+
+from EvhrEngine.models import EvhrStageLease
+from ProcessingEngine.models import thisHost
+
+#-------------------------------------------------------------------------------
+# StageLease
+#
+# Concurrent requests sharing a strip would each see its products missing and
+# make them twice.  Before making a product cache entry, a requester takes the
+# entry's lease, an EvhrStageLease row whose key is unique, so only one
+# requester can hold it.  The others wait until it is released, then take the
+# product from the cache.
+#
+# The holder renews the lease in a thread every third of
+# settings.STAGE_LEASE_SECONDS.  A lease that is not renewed expires, and a
+# lease whose process died on this host is removed, so a crashed holder cannot
+# block others.
+#
+# lease = StageLease(key)
+#
+# if lease.acquire():
+#     try:
+#         makeIt()
+#     finally:
+#         lease.release()
+# else:
+#     lease.wait()
+#-------------------------------------------------------------------------------
+class StageLease(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, key, logger = None):
+
+        self.key          = key
+        self.lease        = None
+        self.logger       = logger
+        self.pollSeconds  = 10
+        self.leaseSeconds = 300
+        self.stopRenewing = threading.Event()
+
+        if hasattr(settings, 'STAGE_LEASE_SECONDS'):
+            self.leaseSeconds = settings.STAGE_LEASE_SECONDS
+
+    #---------------------------------------------------------------------------
+    # acquire
+    #
+    # This returns True when this requester holds the lease.
+    #---------------------------------------------------------------------------
+    def acquire(self):
+
+        self.removeStale()
+
+        now = datetime.datetime.now()
+
+        lease         = EvhrStageLease()
+        lease.key     = self.key
+        lease.pid     = os.getpid()
+        lease.expires = now + datetime.timedelta(seconds = self.leaseSeconds)
+
+        try:
+            with transaction.atomic():
+                lease.save()
+
+        except IntegrityError:
+            return False
+
+        self.lease = lease
+
+        renewer = threading.Thread(target = self.renew)
+        renewer.daemon = True
+        renewer.start()
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # release
+    #---------------------------------------------------------------------------
+    def release(self):
+
+        self.stopRenewing.set()
+
+        if self.lease:
+
+            EvhrStageLease.objects.filter(id = self.lease.id).delete()
+            self.lease = None
+
+    #---------------------------------------------------------------------------
+    # removeStale
+    #
+    # This removes this key's lease when it expired or its holder died here.
+    #---------------------------------------------------------------------------
+    def removeStale(self):
+
+        now = datetime.datetime.now()
+
+        for lease in EvhrStageLease.objects.filter(key = self.key):
+
+            if lease.expires < now or \
+               (lease.host == thisHost() and not lease.pidRunning()):
+
+                # Leave it when it was renewed meanwhile.
+                EvhrStageLease.objects.filter(id = lease.id,
+                                              expires = lease.expires). \
+                    delete()
+
+    #---------------------------------------------------------------------------
+    # renew
+    #
+    # This runs in a thread while the lease is held.
+    #---------------------------------------------------------------------------
+    def renew(self):
+
+        try:
+            while not self.stopRenewing.wait(self.leaseSeconds / 3.0):
+
+                lease = self.lease
+
+                if not lease:
+                    break
+
+                expires = datetime.datetime.now() + \
+                          datetime.timedelta(seconds = self.leaseSeconds)
+
+                EvhrStageLease.objects.filter(id = lease.id). \
+                    update(expires = expires)
+
+        finally:
+            db.connection.close()
+
+    #---------------------------------------------------------------------------
+    # wait
+    #
+    # This blocks until this key's lease is released or goes stale.
+    #---------------------------------------------------------------------------
+    def wait(self):
+
+        if self.logger:
+
+            self.logger.info('Waiting for another request to make product ' +
+                             str(self.key))
+
+        while True:
+
+            self.removeStale()
+
+            if not EvhrStageLease.objects.filter(key = self.key).exists():
+                return
+
+            time.sleep(self.pollSeconds)
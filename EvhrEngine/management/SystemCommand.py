@@ -1,22 +1,176 @@
 
+import collections
+import datetime
+import errno
 import logging
+import os
+import re
+import select
+import shlex
+import signal
 import subprocess
+import threading
+import time
 
 from django.conf import settings
+from django.db import DatabaseError
+from django.db import transaction
+from django.db.models import Count
 
+from EvhrEngine.management.CommandExecutor import CommandExecutor
+from EvhrEngine.models import EvhrCommandResult
 from EvhrEngine.models import EvhrError
 from EvhrEngine.models import EvhrNode
 from EvhrEngine.models import EvhrNodeGroup
 from EvhrEngine.models import EvhrNodePID
 
+from ProcessingEngine.management.Retriever import Retriever
+from ProcessingEngine.models import thisHost
+
+#-------------------------------------------------------------------------------
+# class SystemCommandError
+#
+# errorClass is Retriever.TRANSIENT, NODE or PERMANENT, so ConstituentProcessor
+# can decide whether to retry.  node is the EvhrNode that ran the command, or
+# None.
+#-------------------------------------------------------------------------------
+class SystemCommandError(RuntimeError):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, msg, errorClass = Retriever.PERMANENT, node = None):
+
+        super(SystemCommandError, self).__init__(msg)
+
+        self.errorClass = errorClass
+        self.node = node
+
+#-------------------------------------------------------------------------------
+# class OutputTail
+#
+# This watches one of a command's output streams as it is read, keeping only
+# its last maxLines lines and the error strings errorPattern found in it, so
+# verbose programs cannot fill memory.  Carriage returns end lines too, so
+# progress bars do not make one enormous line, and lines longer than
+# maxLineChars are cut.
+#-------------------------------------------------------------------------------
+class OutputTail(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, errorPattern, maxLines = 100, maxLineChars = 4096):
+
+        self.errorPattern = errorPattern
+        self.errors       = set()    # error strings found, in lower case
+        self.lines        = collections.deque(maxlen = maxLines)
+        self.maxLineChars = maxLineChars
+        self.partial      = ''
+
+    #---------------------------------------------------------------------------
+    # addLine
+    #---------------------------------------------------------------------------
+    def addLine(self, line):
+
+        if self.errorPattern:
+
+            for match in self.errorPattern.finditer(line):
+                self.errors.add(match.group(0).lower())
+
+        if line.strip():
+            self.lines.append(line[-self.maxLineChars:])
+
+    #---------------------------------------------------------------------------
+    # close
+    #---------------------------------------------------------------------------
+    def close(self):
+
+        if self.partial:
+
+            self.addLine(self.partial)
+            self.partial = ''
+
+    #---------------------------------------------------------------------------
+    # feed
+    #---------------------------------------------------------------------------
+    def feed(self, data):
+
+        pieces = re.split('[\r\n]', self.partial + data)
+        self.partial = pieces.pop()
+
+        for line in pieces:
+            self.addLine(line)
+
+        # Check an overlong line, then keep only its end.
+        if len(self.partial) > self.maxLineChars:
+
+            overflow = self.partial[:-self.maxLineChars]
+            self.partial = self.partial[-self.maxLineChars:]
+
+            if self.errorPattern:
+
+                for match in self.errorPattern.finditer(overflow):
+                    self.errors.add(match.group(0).lower())
+
+    #---------------------------------------------------------------------------
+    # text
+    #---------------------------------------------------------------------------
+    def text(self):
+
+        return '\n'.join(list(self.lines) + 
+                          ([self.partial] if self.partial else []))
+
 #-------------------------------------------------------------------------------
 # class SystemCommand
+#
+# Commands' output is read as it is written.  Only the last
+# settings.SYSTEM_COMMAND_TAIL_LINES lines of stdout and stderr are kept, in
+# stdOut and msg, and only they are logged and recorded in EvhrErrors, but
+# the whole output is searched for ERROR_STRINGS_TO_TEST.
+#
+# Each run's times, exit status and rusage are kept in result, an
+# EvhrCommandResult, which is saved when there is a request.  Its stage is the
+# program's name, unless a stage label is given.  summarizeCommands reports
+# them by stage.
+#
+# cmd is a string or an argv list.  Strings without shell syntax, like pipes,
+# redirection, variables and wildcards, are split and run without a shell.
+# Each command leads its own process group, so killing it kills every program
+# it started.  Commands running longer than the timeout given, or than their
+# stage's settings.COMMAND_TIMEOUTS seconds, are killed and fail as
+# transient.  killRunning() kills a request's commands when it is cancelled.
 #-------------------------------------------------------------------------------
 class SystemCommand(object):
 
     NODE_FAILURE_MSG = 'ssh exited with exit code 255'
     RANSAC_MSG = 'ransac'
     
+    #---
+    # Errors that can succeed when run again, and errors of the node that ran
+    # the command.  These must be in lower case.
+    #---
+    NODE_ERRORS = [NODE_FAILURE_MSG]
+    TRANSIENT_ERRORS = [RANSAC_MSG, 'stale file handle']
+    
+    #---
+    # The names of nodes that failed, by request ID, which distribute() avoids.
+    # Retrievers call forgetRequest() when their requests finish.
+    #---
+    failedNodes = {}
+    
+    # Compiled error patterns, by the errors they ignore
+    errorPatterns = {}
+    
+    # Seconds between asking a process group to terminate and killing it
+    KILL_GRACE_SECONDS = 10
+    
+    SHELL_SYNTAX = re.compile(r'[|&;<>()$`\\*?\[\]{}~#\n]')
+    
+    # The process groups of running commands, as {pid: request ID}
+    running = {}
+    runningLock = threading.Lock()
+    
     # These must be in lower case.
     ERROR_STRINGS_TO_TEST = [ \
         'aborted',
@@ -36,12 +190,21 @@ class SystemCommand(object):
     # __init__
     #---------------------------------------------------------------------------
     def __init__(self, cmd, inFile, logger, request=None, raiseException=False,
-                 distribute=False, errorsToIgnore=[]):
+                 distribute=False, errorsToIgnore=[], stage=None,
+                 timeout=None):
 
         self.errorsToIgnore = errorsToIgnore 
+        self.executor = None
         self.msg = None
+        self.result = None
         self.returnCode = None
+        self.stage = stage or SystemCommand.programName(cmd)
         self.stdOut = None
+        self.timedOut = False
+        self.timeout = timeout
+
+        if self.timeout == None and hasattr(settings, 'COMMAND_TIMEOUTS'):
+            self.timeout = settings.COMMAND_TIMEOUTS.get(self.stage)
 
         if not logger:
             logger = logging.getLogger('console') # standard output.
@@ -52,20 +215,96 @@ class SystemCommand(object):
         else:
             self.runSingleProcess(cmd, inFile, logger, request, raiseException)
             
+    #---------------------------------------------------------------------------
+    # chooseNode
+    #
+    # This returns the least busy enabled node of settings.NODE_GROUP, except
+    # those that failed for the request, or None.  Nodes are counted and
+    # fetched in one query.  A node's busyness is its running commands per
+    # unit of capacity.  With settings.NODE_SELECTION_USE_LOAD, the load
+    # average its agent reported counts instead, when it is higher and was
+    # reported within three NODE_HEARTBEAT_SECONDS, so work from elsewhere is
+    # seen.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def chooseNode(requestId = None):
+        
+        nodes = EvhrNode.objects.filter(group=settings.NODE_GROUP,
+                                        enabled=True,
+                                        group__enabled=True). \
+                    exclude(name__in = \
+                            SystemCommand.failedNodes.get(requestId, [])). \
+                    annotate(numPIDs = Count('evhrnodepid'))
+        
+        useLoad = hasattr(settings, 'NODE_SELECTION_USE_LOAD') and \
+                  settings.NODE_SELECTION_USE_LOAD
+
+        heartbeatSeconds = 60
+        
+        if hasattr(settings, 'NODE_HEARTBEAT_SECONDS'):
+            heartbeatSeconds = settings.NODE_HEARTBEAT_SECONDS
+            
+        oldestHeartbeat = datetime.datetime.now() - \
+                          datetime.timedelta(seconds = 3 * heartbeatSeconds)
+        
+        nodeToUse = None
+        bestScore = None
+
+        for node in nodes:
+            
+            busy = node.numPIDs
+            
+            if useLoad and node.load != None and node.heartbeat and \
+               node.heartbeat >= oldestHeartbeat:
+                
+                busy = max(busy, node.load)
+                
+            score = float(busy) / max(1, node.capacity)
+            
+            if bestScore == None or score < bestScore:
+                
+                nodeToUse = node
+                bestScore = score
+                
+        return nodeToUse
+        
+    #---------------------------------------------------------------------------
+    # classify
+    #
+    # This returns the Retriever failure class of an error message.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def classify(errorMsg):
+        
+        lcMsg = str(errorMsg).lower()
+        
+        if [e for e in SystemCommand.NODE_ERRORS if e in lcMsg]:
+            return Retriever.NODE
+            
+        if [e for e in SystemCommand.TRANSIENT_ERRORS if e in lcMsg]:
+            return Retriever.TRANSIENT
+            
+        return Retriever.PERMANENT
+        
     #---------------------------------------------------------------------------
     # distribute
+    #
+    # This runs the command on the least busy node, through the
+    # CommandExecutor of settings.NODE_GROUP.
     #---------------------------------------------------------------------------
     def distribute(self, cmd, inFile, logger, request, raiseException):
         
         origCmd = cmd
-        
-        # Get the candidate nodes on which to run.
-        nodes = []
+        nodeToUse = None
         
         if hasattr(settings, 'NODE_GROUP'):
 
+            requestId = request.id if request else None
+            nodeToUse = SystemCommand.chooseNode(requestId)
+            
             # Ensure the node group exists and is enabled.
-            if EvhrNodeGroup.objects.filter(name=settings.NODE_GROUP,
+            if nodeToUse == None and \
+               EvhrNodeGroup.objects.filter(name=settings.NODE_GROUP,
                                             enabled=True).count() == 0:
                 
                 msg = 'Node group, ' + \
@@ -78,134 +317,436 @@ class SystemCommand(object):
                 if raiseException:
                     raise RuntimeError(msg)
                 
-            # Get the nodes in the group.                                 
-            nodes = EvhrNode.objects.filter(group=settings.NODE_GROUP,
-                                            enabled=True)
-            
-        # Decide which node is least busy and use it.
-        nodeToUse = None
-        maxPIDs = 10000
-
-        for node in nodes:
-            
-            nodePIDs = EvhrNodePID.objects.filter(node=node)
-            numPIDs = len(nodePIDs)
-            
-            if numPIDs == 0:
-                
-                nodeToUse = node
-                break
-                
-            elif numPIDs < maxPIDs:
-                
-                maxPIDs = numPIDs
-                nodeToUse = node
-            
         if nodeToUse == None:
            
            if logger:
-               logger.info('Unable to choose a node for pdsh to use, so ' + \
+               logger.info('Unable to choose a node, so ' + \
                            'running on the local node.')
         else: 
                       
             if logger:
                 logger.info('Using node ' + str(nodeToUse.name)) 
 
-            # Wrap the command in pdsh and inside single quotes
-            cmd = "pdsh -w {} '{}'".format(nodeToUse.name, cmd)
+            self.executor = CommandExecutor.forGroup(settings.NODE_GROUP)
+            cmd = self.executor.wrap(cmd, nodeToUse.name)
 
-        # Run the pdsh version using runSingleProcess.
+        # Run the wrapped version using runSingleProcess.
         self.runSingleProcess(cmd, inFile, logger, request, raiseException, 
                               nodeToUse)
         
+    #---------------------------------------------------------------------------
+    # forgetRequest
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def forgetRequest(requestId):
+        
+        SystemCommand.failedNodes.pop(requestId, None)
+        
+    #---------------------------------------------------------------------------
+    # getErrorPattern
+    #
+    # This returns one regular expression matching any error string not
+    # ignored, compiled once for each set of ignored errors.
+    #---------------------------------------------------------------------------
+    def getErrorPattern(self):
+        
+        key = frozenset(self.errorsToIgnore)
+        
+        if key not in SystemCommand.errorPatterns:
+            
+            errorsToTest = [re.escape(e) for e in \
+                            SystemCommand.ERROR_STRINGS_TO_TEST \
+                            if e not in self.errorsToIgnore]
+        
+            SystemCommand.errorPatterns[key] = \
+                re.compile('|'.join(errorsToTest), re.IGNORECASE) \
+                if errorsToTest else None
+                
+        return SystemCommand.errorPatterns[key]
+        
+    #---------------------------------------------------------------------------
+    # killRunning
+    #
+    # This kills the process groups of the request's running commands, or of
+    # every running command, asking them to terminate first.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def killRunning(requestId = None):
+        
+        with SystemCommand.runningLock:
+            
+            pids = [pid for pid, rId in SystemCommand.running.items() \
+                    if requestId == None or rId == requestId]
+                    
+        pids = [pid for pid in pids \
+                if SystemCommand.signalGroup(pid, signal.SIGTERM)]
+        
+        deadline = time.time() + SystemCommand.KILL_GRACE_SECONDS
+        
+        # Commands leave running when they are reaped.
+        while pids and time.time() < deadline:
+            
+            time.sleep(0.5)
+            
+            with SystemCommand.runningLock:
+                pids = [pid for pid in pids if pid in SystemCommand.running]
+                
+        for pid in pids:
+            SystemCommand.signalGroup(pid, signal.SIGKILL)
+            
+    #---------------------------------------------------------------------------
+    # launch
+    #
+    # Commands without shell syntax run without a shell.  Those whose program
+    # cannot be run, like shell builtins, are given to the shell, which
+    # reports the error in words ERROR_STRINGS_TO_TEST finds.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def launch(cmd):
+        
+        argv = SystemCommand.toArgv(cmd)
+        
+        if argv:
+            
+            try:
+                return SystemCommand.popen(argv, False)
+                
+            except OSError as e:
+                
+                if e.errno not in (errno.ENOENT, errno.EACCES, errno.ENOEXEC):
+                    raise
+                    
+        return SystemCommand.popen(CommandExecutor.toString(cmd), True)
+        
+    #---------------------------------------------------------------------------
+    # popen
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def popen(args, shell):
+        
+        return subprocess.Popen(args, 
+                                shell = shell,
+                                stderr = subprocess.PIPE,
+                                stdout = subprocess.PIPE,
+                                close_fds = True,
+                                preexec_fn = os.setsid)
+        
+    #---------------------------------------------------------------------------
+    # programName
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def programName(cmd):
+        
+        words = list(cmd) if isinstance(cmd, (list, tuple)) else \
+                str(cmd).split()
+        
+        return os.path.basename(str(words[0])) if words else ''
+        
+    #---------------------------------------------------------------------------
+    # readOutput
+    #
+    # This reads the process's stdout and stderr as they are written, until
+    # both end, and returns their OutputTails.  When the command times out,
+    # its process group is asked to terminate, then killed after
+    # KILL_GRACE_SECONDS.
+    #---------------------------------------------------------------------------
+    def readOutput(self, process, logger):
+        
+        maxLines = 100
+        
+        if hasattr(settings, 'SYSTEM_COMMAND_TAIL_LINES'):
+            maxLines = settings.SYSTEM_COMMAND_TAIL_LINES
+            
+        pattern = self.getErrorPattern()
+        outTail = OutputTail(pattern, maxLines)
+        errTail = OutputTail(pattern, maxLines)
+        
+        tails = {process.stdout.fileno(): outTail,
+                 process.stderr.fileno(): errTail}
+                 
+        deadline = time.time() + self.timeout if self.timeout else None
+        
+        while tails:
+            
+            wait = None
+            
+            if deadline:
+                
+                wait = deadline - time.time()
+                
+                if wait <= 0 and self.timedOut:
+                    
+                    # It did not terminate.
+                    SystemCommand.signalGroup(process.pid, signal.SIGKILL)
+                    break
+                    
+                if wait <= 0:
+                    
+                    if logger:
+                        
+                        logger.warning('Command timed out after ' +
+                                       str(self.timeout) + ' seconds.')
+                                       
+                    self.timedOut = True
+                    SystemCommand.signalGroup(process.pid, signal.SIGTERM)
+                    wait = SystemCommand.KILL_GRACE_SECONDS
+                    deadline = time.time() + wait
+                    
+            for fd in select.select(tails.keys(), [], [], wait)[0]:
+                
+                data = os.read(fd, 65536)
+                
+                if data:
+                    tails[fd].feed(data)
+                    
+                else:
+                    
+                    tails[fd].close()
+                    del tails[fd]
+                    
+        # Programs that left the group may still hold the pipes.
+        for tail in tails.values():
+            tail.close()
+            
+        process.stdout.close()
+        process.stderr.close()
+        
+        return outTail, errTail
+        
+    #---------------------------------------------------------------------------
+    # recordResult
+    #---------------------------------------------------------------------------
+    def recordResult(self, cmd, request, node, start, rusage, logger = None):
+        
+        end = datetime.datetime.now()
+        
+        result               = EvhrCommandResult()
+        result.request       = request
+        result.stage         = self.stage[:80]
+        result.command       = cmd
+        result.node          = node.name if node else thisHost()
+        result.start         = start
+        result.end           = end
+        result.wallSeconds   = (end - start).total_seconds()
+        result.userSeconds   = rusage.ru_utime
+        result.systemSeconds = rusage.ru_stime
+        result.maxRssKB      = rusage.ru_maxrss
+        result.returnCode    = self.returnCode
+        
+        self.result = result
+        
+        if request == None:
+            return
+            
+        #---
+        # Telemetry must not fail a command that succeeded, as when SQLite is
+        # locked by other writers or the table is missing.
+        #---
+        try:
+            with transaction.atomic():
+                result.save()
+                
+        except DatabaseError as e:
+            
+            if logger:
+                
+                logger.warning('Unable to record the result of ' + 
+                               str(self.stage) + ': ' + str(e))
+        
     #---------------------------------------------------------------------------
     # runSingleProcess
     #---------------------------------------------------------------------------
     def runSingleProcess(self, cmd, inFile, logger, request, raiseException,
                          node=None):
         
+        cmdString = CommandExecutor.toString(cmd)
+        
         if logger:
-            logger.info('Cmd: ' + str(cmd))
+            logger.info('Cmd: ' + cmdString)
             
+        start = datetime.datetime.now()
+        
         # Launch the command.
-        process = subprocess.Popen(cmd, 
-                                   shell = True,
-                                   stderr = subprocess.PIPE,
-                                   stdout = subprocess.PIPE,
-                                   close_fds = True)
-
-        # If a node was passed, save its PID.  This tracks node usage.
-        nodePID = None
+        process = SystemCommand.launch(cmd)
+        
+        with SystemCommand.runningLock:
+            
+            SystemCommand.running[process.pid] = \
+                request.id if request else None
+                
+        try:
+            # If a node was passed, save its PID.  This tracks node usage.
+            nodePID = None
         
-        if node:
+            if node:
             
-            nodePID = EvhrNodePID()
-            nodePID.node = node
-            nodePID.pid = process.pid
-            nodePID.save()
+                nodePID = EvhrNodePID()
+                nodePID.node = node
+                nodePID.pid = process.pid
+                nodePID.save()
             
+            outTail, errTail = self.readOutput(process, logger)
+            rusage = SystemCommand.waitFor(process)
+            
+        finally:
+            
+            with SystemCommand.runningLock:
+                SystemCommand.running.pop(process.pid, None)
+                
         self.returnCode = process.returncode
-        stdOutStdErr = process.communicate()    # This makes Popen block.
-        self.stdOut = stdOutStdErr[0]
-        self.msg = stdOutStdErr[1]
+        self.stdOut = outTail.text()
+        self.msg = errTail.text()
         
-        #---
-        # The process blocked on the communicate statement, so now it has
-        # finished and the PID must be deleted to indicate less use of the node.
-        #---
+        # The process finished, so delete its PID to show less use of the node.
         if nodePID:
             nodePID.delete()
             
+        self.recordResult(cmdString, request, node, start, rusage, logger)
+        
         if logger:
 
             logger.info('Return code: ' + str(self.returnCode))
+            
+            logger.info('Wall seconds: ' + 
+                        str(round(self.result.wallSeconds, 2)) +
+                        ', CPU seconds: ' + 
+                        str(round(rusage.ru_utime + rusage.ru_stime, 2)) +
+                        ', max RSS KB: ' + str(rusage.ru_maxrss))
+                        
             logger.info('Message: ' + str(self.msg))
             
         #---
-        # There are cases where the shell command fails and still returns a 0,
-        # causing returnCode to be None.  To detect this, check if msg contains
-        # and error text.
+        # There are cases where the shell command fails and still returns 0.
+        # To detect this, the output was searched for error text.
         #---
-        lcMsg = self.msg.lower()
-        lcStdOut = self.stdOut.lower()
         error = None
+        errorsFound = None
         
-        errorsToTest = [e for e in SystemCommand.ERROR_STRINGS_TO_TEST \
-                            if e not in self.errorsToIgnore]
-        
-        for eMsg in errorsToTest:
+        if errTail.errors:
             
-            if lcMsg.find(eMsg) != -1:
-
-                if SystemCommand.NODE_FAILURE_MSG in lcMsg:
-                    logger.warning('Node failed. ' + str(self.msg))
+            error = self.msg
+            errorsFound = errTail.errors
+                
+        elif outTail.errors:
+            
+            error = self.stdOut
+            errorsFound = outTail.errors
+                
+        if error and SystemCommand.NODE_FAILURE_MSG in errorsFound:
+            logger.warning('Node failed. ' + str(error))
                     
-                error = self.msg
-                break
+        errorClass = SystemCommand.classify(' '.join(errorsFound)) \
+                     if error else Retriever.PERMANENT
         
-            elif lcStdOut.find(eMsg) != -1:
-
-                if SystemCommand.NODE_FAILURE_MSG in lcStdOut:
-                    logger.warning('Node failed. ' + str(self.stdOut))
+        if node and self.executor and \
+           self.executor.isNodeFailure(self.returnCode):
+            
+            logger.warning('Node failed. ' + str(self.msg))
+            errorClass = Retriever.NODE
+            
+        # A hung command can succeed when run again.
+        if self.timedOut:
+            
+            error = ('Timed out after ' + str(self.timeout) + ' seconds.  ' +
+                     str(error or self.msg)).strip()
                     
-                error = self.stdOut
-                break
+            errorClass = Retriever.TRANSIENT
+        
+        # Later commands of this request avoid a node that failed.
+        if node and request != None and errorClass == Retriever.NODE:
+            
+            SystemCommand.failedNodes.setdefault(request.id, set()). \
+                add(node.name)
         
         if self.returnCode or error:
             
+            if not error:
+                
+                error = self.msg or self.stdOut or \
+                        'Return code ' + str(self.returnCode) + '.'
+            
             if request != None:
             
                 err             = EvhrError()
                 err.request     = request
                 err.inputFile   = inFile
                 err.errorOutput = error
-                err.command     = cmd
+                err.command     = cmdString
                 err.save()
             
             if raiseException:
                 
                 msg = 'A system command error occurred.  ' + \
                       error + \
-                      ' Command: ' + str(cmd)
+                      ' Command: ' + cmdString
                       
-                raise RuntimeError(msg)
+                raise SystemCommandError(msg, errorClass, node)
+
+    #---------------------------------------------------------------------------
+    # signalGroup
+    #
+    # This returns False when the process group is gone.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def signalGroup(pid, sig):
+        
+        try:
+            os.killpg(pid, sig)
+            return True
+            
+        except OSError:
+            return False
+            
+    #---------------------------------------------------------------------------
+    # toArgv
+    #
+    # This returns cmd as an argv list, or None when it needs a shell.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def toArgv(cmd):
+        
+        if isinstance(cmd, (list, tuple)):
+            return [str(arg) for arg in cmd]
+            
+        if SystemCommand.SHELL_SYNTAX.search(str(cmd)):
+            return None
+            
+        try:
+            argv = shlex.split(str(cmd))
+            
+        except ValueError:
+            return None
+            
+        # Variable assignments need the shell.
+        if not argv or '=' in argv[0]:
+            return None
+            
+        return argv
+        
+    #---------------------------------------------------------------------------
+    # waitFor
+    #
+    # This reaps the process, sets its returncode, and returns its rusage,
+    # which includes the children it waited for, like the shell's command.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def waitFor(process):
+        
+        while True:
+            
+            try:
+                status, rusage = os.wait4(process.pid, 0)[1:]
+                break
+                
+            except OSError as e:
+                
+                if e.errno != errno.EINTR:
+                    raise
+                    
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+            
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+            
+        return rusage
@@ -2,6 +2,7 @@
 from django.core.management.base import BaseCommand
 
 from EvhrEngine.models import EvhrNodePID
+from ProcessingEngine.management.ProcessReconciler import reconcile
 
 class Command(BaseCommand):
 
@@ -10,18 +11,5 @@ class Command(BaseCommand):
     #---------------------------------------------------------------------------
     def handle(*args, **options):
 
-        nodePIDs = EvhrNodePID.objects.all()
-        
-        for nodePID in nodePIDs:
-            
-            try:
-                print 'Deleting NodePID with invalid pid.'
-                os.kill(nodePID, 0)
-                
-            except OSError:
-
-                nodePID.delete()
-
-            else:
-                return True
-    
\ No newline at end of file
+        numDeleted = reconcile([EvhrNodePID])
+        print 'Deleted ' + str(numDeleted) + ' NodePID(s) with invalid pids.'
@@ -0,0 +1,47 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from EvhrEngine.management.NodeAgent import NodeAgent
+
+#-------------------------------------------------------------------------------
+# Command
+#
+# This runs the agent that processes constituents sent by EvhrNodeDistributor.
+# Run it on each EvhrNode.
+#
+# ./manage.py nodeAgent --port 8760
+#-------------------------------------------------------------------------------
+class Command(BaseCommand):
+
+    #---------------------------------------------------------------------------
+    # add_arguments
+    #---------------------------------------------------------------------------
+    def add_arguments(self, parser):
+
+        parser.add_argument('--port',
+                            type = int,
+                            help = 'The port on which to listen, ' +
+                                   'settings.NODE_AGENT_PORT by default.')
+
+    #---------------------------------------------------------------------------
+    # handle
+    #---------------------------------------------------------------------------
+    def handle(*args, **options):
+
+        logger = logging.getLogger('console')
+        logger.setLevel(logging.INFO)
+
+        agent = NodeAgent(logger, options['port'])
+        agent.startHeartbeat()
+        logger.info('Node agent listening on port ' +
+                    str(agent.server_address[1]))
+
+        try:
+            agent.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            agent.server_close()
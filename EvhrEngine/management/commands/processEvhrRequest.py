@@ -1,4 +1,6 @@
 
+import json
+
 from osgeo.osr import SpatialReference
 
 from django.core.management.base import BaseCommand
@@ -9,6 +11,7 @@ from ProcessingEngine.models import EndPoint
 from GeoProcessingEngine.management.GeoRetriever import GeoRetriever
 from GeoProcessingEngine.models import GeoRequest
 
+from EvhrEngine.management.EvhrPlanner import EvhrPlanner
 from EvhrEngine.models import EvhrScene
 
 #-------------------------------------------------------------------------------
@@ -16,6 +19,8 @@ from EvhrEngine.models import EvhrScene
 #
 # ./manage.py processEvhrRequest --name testFairbanks --epName "EVHR Mosaic" --ulx -148 --uly 65 --lrx -147.5 --lry 64.5 --epsg 4326 -n 1
 #
+# ./manage.py processEvhrRequest --ulx -148 --uly 65 --lrx -147.5 --lry 64.5 --epsg 4326 --plan
+#
 # ./manage.py processEvhrRequest --name testFairbanks --epName "EVHR Mosaic" --ulx -148 --uly 65 --lrx -147.5 --lry 64.5 --epsg 4326 --scenes "/att/pubrepo/NGA/WV01/1B/2008/059/WV01_1020010001076500_X1BS_005733445010_03/WV01_20080228205612_1020010001076500_08FEB28205612-P1BS-005733445010_03_P001.ntf" "/att/pubrepo/NGA/WV01/1B/2008/059/WV01_1020010001076500_X1BS_052804587010_01/WV01_20080228205612_1020010001076500_08FEB28205612-P1BS-052804587010_01_P001.ntf" "/att/pubrepo/NGA/WV01/1B/2008/059/WV01_1020010001076500_X1BS_005733445010_03/WV01_20080228205614_1020010001076500_08FEB28205614-P1BS-005733445010_03_P002.ntf" -n 1
 #-------------------------------------------------------------------------------
 class Command(BaseCommand):
@@ -39,6 +44,11 @@ class Command(BaseCommand):
                             nargs = '*',
                             help = 'A list of fully-qualified scene files.')
 
+        parser.add_argument('--plan',
+                            action = 'store_true',
+                            help = 'Print the request\'s plan and estimated ' +
+                                   'cost, without processing it.')
+
         CommandHelper.addCommonArgs(parser)
                        
     #---------------------------------------------------------------------------
@@ -46,6 +56,20 @@ class Command(BaseCommand):
     #---------------------------------------------------------------------------
     def handle(*args, **options):
         
+        srs = GeoRetriever.constructSrsFromIntCode(options['epsg'])
+        
+        if options['plan']:
+            
+            planner = EvhrPlanner(options['ulx'],
+                                  options['uly'],
+                                  options['lrx'],
+                                  options['lry'],
+                                  srs,
+                                  options['scenes'])
+                                  
+            print json.dumps(planner.plan(), indent = 4, sort_keys = True)
+            return
+            
         request             = GeoRequest()
         request.name        = options['name']
         request.destination = options['o']
@@ -60,8 +84,7 @@ class Command(BaseCommand):
         ep = EndPoint.objects.filter(name = options['epName'])[0]
         request.endPoint = ep
         
-        request.srs = \
-            GeoRetriever.constructSrsFromIntCode(options['epsg']).ExportToWkt()
+        request.srs = srs.ExportToWkt()
         
         # request.outSRS = \
         #     GeoRetriever.constructSrsFromIntCode(options['outEpsg']). \
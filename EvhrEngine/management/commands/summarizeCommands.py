@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Sum
+
+from EvhrEngine.models import EvhrCommandResult
+
+#-------------------------------------------------------------------------------
+# Command
+#
+# This summarizes a request's EvhrCommandResults by stage, or by node, to show
+# where its time went.  Waiting is wall time without CPU time, like time spent
+# on NFS or waiting for pdsh.
+#
+# ./manage.py summarizeCommands --id 123
+# ./manage.py summarizeCommands --id 123 --by node
+#-------------------------------------------------------------------------------
+class Command(BaseCommand):
+
+    COLUMNS = '{:<24} {:>6} {:>6} {:>10} {:>10} {:>10} {:>10}'
+
+    #---------------------------------------------------------------------------
+    # add_arguments
+    #---------------------------------------------------------------------------
+    def add_arguments(self, parser):
+
+        parser.add_argument('--id', type = int, help = 'The request ID.')
+
+        parser.add_argument('--by',
+                            choices = ['node', 'stage'],
+                            default = 'stage',
+                            help = 'How to group the commands.')
+
+    #---------------------------------------------------------------------------
+    # handle
+    #---------------------------------------------------------------------------
+    def handle(*args, **options):
+
+        results = EvhrCommandResult.objects.filter(request = options['id'])
+
+        if not results.exists():
+
+            print 'No commands were recorded for request ' + \
+                  str(options['id']) + '.'
+
+            return
+
+        span = results.aggregate(first = Min('start'), last = Max('end'))
+
+        print 'Elapsed seconds: ' + \
+              str(round((span['last'] - span['first']).total_seconds(), 1))
+
+        groups = results.values(options['by']). \
+                     annotate(runs = Count('id'),
+                              wall = Sum('wallSeconds'),
+                              user = Sum('userSeconds'),
+                              system = Sum('systemSeconds'),
+                              maxRss = Max('maxRssKB')). \
+                     order_by('-wall')
+
+        failures = dict(results.exclude(returnCode = 0). \
+                            values_list(options['by']). \
+                            annotate(Count('id')))
+
+        print Command.COLUMNS.format(options['by'], 'runs', 'failed',
+                                     'wall s', 'CPU s', 'wait s',
+                                     'max RSS MB')
+
+        for group in groups:
+
+            cpu = (group['user'] or 0) + (group['system'] or 0)
+
+            print Command.COLUMNS.format(group[options['by']][:24],
+                                         group['runs'],
+                                         failures.get(group[options['by']], 0),
+                                         round(group['wall'], 1),
+                                         round(cpu, 1),
+                                         round(max(0, group['wall'] - cpu), 1),
+                                         (group['maxRss'] or 0) / 1024)
@@ -3,12 +3,53 @@ from __future__ import unicode_literals
 
 from django.db import models
 
+from ProcessingEngine.models import BaseProcess
 from ProcessingEngine.models import EndPoint
 from ProcessingEngine.models import Protocol
+from ProcessingEngine.models import thisHost
 
 import xml.etree.ElementTree as ET
 import os
 
+#-------------------------------------------------------------------------------
+# EvhrCommandResult
+#
+# One run of an external program by SystemCommand for a request:  when it ran,
+# where, how it ended and the resources it used.  CPU times and maxRssKB come
+# from the process's rusage, so for commands run through pdsh they describe
+# pdsh, not the remote program.
+#-------------------------------------------------------------------------------
+class EvhrCommandResult(models.Model):
+
+    request = models.ForeignKey('ProcessingEngine.Request',
+                                on_delete = models.CASCADE)
+
+    # The stage label, which is the program's name by default
+    stage = models.CharField(max_length = 80, db_index = True)
+
+    command = models.TextField()
+    node = models.CharField(max_length = 80)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    wallSeconds = models.FloatField()
+    userSeconds = models.FloatField(null = True, blank = True)
+    systemSeconds = models.FloatField(null = True, blank = True)
+    maxRssKB = models.BigIntegerField(null = True, blank = True)
+    returnCode = models.IntegerField(null = True, blank = True)
+
+    #---------------------------------------------------------------------------
+    # __unicode__
+    #---------------------------------------------------------------------------
+    def __unicode__(self):
+        return self.stage + ' on ' + self.node
+
+    #---------------------------------------------------------------------------
+    # Meta
+    #---------------------------------------------------------------------------
+    class Meta:
+        verbose_name = 'EVHR Command Result'
+        verbose_name_plural = 'EVHR Command Results'
+
 #-------------------------------------------------------------------------------
 # EvhrEndPoint
 #-------------------------------------------------------------------------------
@@ -49,6 +90,13 @@ class EvhrNode(models.Model):
     name = models.CharField(max_length=20)
     enabled = models.BooleanField(default=True)
     
+    # Commands are spread in proportion to capacity, like the node's CPUs.
+    capacity = models.PositiveIntegerField(default=1)
+    
+    # The load average the node's agent last reported, and when.
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    load = models.FloatField(null=True, blank=True)
+    
     #---------------------------------------------------------------------------
     # __unicode__
     #---------------------------------------------------------------------------
@@ -93,6 +141,19 @@ class EvhrNodePID(models.Model):
     node = models.ForeignKey('EvhrNode')
     pid = models.IntegerField(null=True)
     
+    # The host where pid runs, which is not the node.
+    host = models.CharField(max_length=80, null=True, blank=True)
+    
+    #---------------------------------------------------------------------------
+    # save
+    #---------------------------------------------------------------------------
+    def save(self, *args, **kwargs):
+
+        if not self.host:
+            self.host = thisHost()
+
+        super(EvhrNodePID, self).save(*args, **kwargs)
+
     #---------------------------------------------------------------------------
     # Meta
     #---------------------------------------------------------------------------
@@ -126,3 +187,28 @@ class EvhrScene(models.Model):
                                 on_delete = models.CASCADE)
 
     sceneFile = models.FileField()
+
+#-------------------------------------------------------------------------------
+# EvhrStageLease
+#
+# A lease on producing one product cache entry, so concurrent requests sharing
+# a strip make it once.  The holder renews it until expires, and other
+# requesters wait for it to go, then take the product from the cache.
+#-------------------------------------------------------------------------------
+class EvhrStageLease(BaseProcess):
+
+    key = models.CharField(max_length = 40, unique = True)
+    expires = models.DateTimeField(db_index = True)
+
+    #---------------------------------------------------------------------------
+    # __unicode__
+    #---------------------------------------------------------------------------
+    def __unicode__(self): 
+        return self.key
+        
+    #---------------------------------------------------------------------------
+    # Meta
+    #---------------------------------------------------------------------------
+    class Meta:
+        verbose_name = 'EVHR Stage Lease'
+        verbose_name_plural = 'EVHR Stage Leases'
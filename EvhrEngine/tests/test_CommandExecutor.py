@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from EvhrEngine.management.CommandExecutor import CommandExecutor
+from EvhrEngine.management.CommandExecutor import PdshExecutor
+from EvhrEngine.management.CommandExecutor import SshExecutor
+
+#--------------------------------------------------------------------------------
+# TestCommandExecutor
+#
+# ./manage.py test EvhrEngine.tests.test_CommandExecutor --failfast
+#--------------------------------------------------------------------------------
+class TestCommandExecutor(SimpleTestCase):
+
+    CMD = ['gdalinfo', 'a b.tif']
+
+    #---------------------------------------------------------------------------
+    # testForGroup
+    #---------------------------------------------------------------------------
+    @override_settings(COMMAND_EXECUTORS = {'sshGroup': 'SshExecutor'})
+    def testForGroup(self):
+
+        executor = CommandExecutor.forGroup('sshGroup')
+
+        self.assertTrue(isinstance(executor, SshExecutor))
+        self.assertTrue(executor is CommandExecutor.forGroup('sshGroup'))
+
+        self.assertTrue(isinstance(CommandExecutor.forGroup('other'),
+                                   PdshExecutor))
+
+    #---------------------------------------------------------------------------
+    # testQuoting
+    #---------------------------------------------------------------------------
+    def testQuoting(self):
+
+        self.assertEqual(PdshExecutor().wrap(TestCommandExecutor.CMD, 'n1'),
+                         ['pdsh', '-w', 'n1', "gdalinfo 'a b.tif'"])
+
+        self.assertEqual(CommandExecutor.toString("echo 'a'"), "echo 'a'")
+
+    #---------------------------------------------------------------------------
+    # testSsh
+    #---------------------------------------------------------------------------
+    def testSsh(self):
+
+        executor = SshExecutor()
+        argv = executor.wrap(TestCommandExecutor.CMD, 'n1')
+
+        self.assertTrue('ControlMaster=auto' in argv)
+        self.assertEqual(argv[-2:], ['n1', "gdalinfo 'a b.tif'"])
+        self.assertTrue(executor.isNodeFailure(255))
+        self.assertFalse(PdshExecutor().isNodeFailure(255))
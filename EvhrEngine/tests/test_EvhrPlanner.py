@@ -0,0 +1,84 @@
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from GeoProcessingEngine.management.GeoRetriever import GeoRetriever
+
+from EvhrEngine.management.EvhrPlanner import EvhrPlanner
+
+#--------------------------------------------------------------------------------
+# TestEvhrPlanner
+#
+# Scenes are grouped by name here, so no NITFs are read.
+#
+# ./manage.py test EvhrEngine.tests.test_EvhrPlanner --failfast
+#--------------------------------------------------------------------------------
+@override_settings(MAXIMUM_PROCESSES = 2)
+class TestEvhrPlanner(SimpleTestCase):
+
+    PAN_STRIP = 'WV01_20080228_P1BS_1020010001076500'
+    MS_STRIP  = 'WV02_20100626_M1BS_1030010005E8AB00'
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        scenes = {'pan1.ntf': TestEvhrPlanner.PAN_STRIP,
+                  'pan2.ntf': TestEvhrPlanner.PAN_STRIP,
+                  'ms1.ntf':  TestEvhrPlanner.MS_STRIP}
+
+        self.planner = EvhrPlanner(-148.5, 65, -147.5, 64.5,
+                                   GeoRetriever.GEOG_4326,
+                                   scenes.keys())
+
+        def groupStrips(sceneFiles):
+
+            strips = {}
+
+            for sceneFile in sceneFiles:
+                strips.setdefault(scenes[sceneFile], []).append(sceneFile)
+
+            return strips
+
+        self.planner.groupStrips = groupStrips
+
+    #---------------------------------------------------------------------------
+    # testPlan
+    #---------------------------------------------------------------------------
+    def testPlan(self):
+
+        plan = self.planner.plan()
+
+        self.assertEqual(plan['scenes'], 3)
+        self.assertEqual(len(plan['strips']), 2)
+        self.assertEqual(plan['demTiles'], 2)
+
+        # One pan band from two scenes, and four bands from one scene.
+        self.assertEqual(plan['tasks']['extract'], 6)
+        self.assertEqual(plan['tasks']['ortho'], 5)
+        self.assertEqual(plan['tasks']['dem'], 2)
+        self.assertEqual(plan['tasks']['merge'], 2)
+
+        strips = plan['strips'].values()
+
+        self.assertAlmostEqual(plan['cpuHours'],
+                               sum([s['cpuHours'] for s in strips]))
+
+        self.assertEqual(plan['peakMemoryGB'],
+                         sum([s['peakMemoryGB'] for s in strips]))
+
+    #---------------------------------------------------------------------------
+    # testCalibration
+    #---------------------------------------------------------------------------
+    def testCalibration(self):
+
+        with override_settings(PLANNER_STAGE_COSTS = \
+                               {'ortho': {'cpuHours': 10.0}}):
+
+            plan = self.planner.plan()
+
+        msPlan = plan['strips'][TestEvhrPlanner.MS_STRIP]
+
+        # Two of the multispectral strip's orthos run at once.
+        self.assertEqual(msPlan['peakMemoryGB'], 32)
+        self.assertTrue(msPlan['cpuHours'] > 40)
@@ -0,0 +1,274 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from django.test import override_settings
+from django.test import SimpleTestCase
+from django.test import TestCase
+
+from EvhrEngine.management.EvhrNodeDistributor import EvhrNodeDistributor
+from EvhrEngine.management.EvhrToaRetriever import EvhrToaRetriever
+from EvhrEngine.management.NodeAgent import callAgent
+from EvhrEngine.management.NodeAgent import NodeAgent
+from EvhrEngine.management.NodeAgent import readMessage
+from EvhrEngine.management.NodeAgent import sendMessage
+from EvhrEngine.management.NodeAgent import speculativeDir
+from ProcessingEngine.management.RequestProcessor import RequestProcessor
+
+#--------------------------------------------------------------------------------
+# TestNodeAgent
+#
+# A localhost agent stands in for the EvhrNodes.
+#
+# ./manage.py test EvhrEngine.tests.test_NodeAgent --failfast
+#--------------------------------------------------------------------------------
+@override_settings(NODE_AGENT_SECRET = 'test')
+class TestNodeAgent(SimpleTestCase):
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.agent = NodeAgent(None, 0, 'localhost')
+        self.port = self.agent.server_address[1]
+
+        thread = threading.Thread(target = self.agent.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    #---------------------------------------------------------------------------
+    # tearDown
+    #---------------------------------------------------------------------------
+    def tearDown(self):
+
+        self.agent.shutdown()
+        self.agent.server_close()
+
+    #---------------------------------------------------------------------------
+    # testStatus
+    #---------------------------------------------------------------------------
+    def testStatus(self):
+
+        status = callAgent('localhost', {'op': 'status'}, self.port, 10)
+
+        self.assertEqual(status['running'], 0)
+        self.assertTrue(status['cpus'] > 0)
+
+    #---------------------------------------------------------------------------
+    # testUnauthorized
+    #---------------------------------------------------------------------------
+    def testUnauthorized(self):
+
+        sock = socket.create_connection(('localhost', self.port), 10)
+
+        try:
+            sendMessage(sock, {'op': 'status', 'secret': 'wrong'})
+            reply = readMessage(sock.makefile('r'))
+
+        finally:
+            sock.close()
+
+        self.assertEqual(reply, {'error': 'Not authorized.'})
+
+        with override_settings(NODE_AGENT_SECRET = None):
+            self.assertRaises(RuntimeError, NodeAgent, None, 0, 'localhost')
+
+    #---------------------------------------------------------------------------
+    # testUnknownOperation
+    #---------------------------------------------------------------------------
+    def testUnknownOperation(self):
+
+        reply = callAgent('localhost', {'op': 'bogus'}, self.port, 10)
+        self.assertTrue('error' in reply)
+
+#--------------------------------------------------------------------------------
+# Stub
+#--------------------------------------------------------------------------------
+class Stub(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+#--------------------------------------------------------------------------------
+# TestEvhrNodeDistributor
+#
+# ./manage.py test EvhrEngine.tests.test_NodeAgent --failfast
+#--------------------------------------------------------------------------------
+@override_settings(NODE_AGENT_SECRET = 'test')
+class TestEvhrNodeDistributor(TestCase):
+
+    #---------------------------------------------------------------------------
+    # testChooseDistributor
+    #
+    # ToA retrievers are subprocessBound, so THREAD_DISTRIBUTOR selects this.
+    #---------------------------------------------------------------------------
+    @override_settings(DISTRIBUTOR = 'PythonFuturesDistributor',
+                       THREAD_DISTRIBUTOR = 'EvhrEngine.management.' + \
+                           'EvhrNodeDistributor.EvhrNodeDistributor')
+    def testChooseDistributor(self):
+
+        processor = RequestProcessor(Stub(name = 'ToA'))
+        processor.retriever = EvhrToaRetriever.__new__(EvhrToaRetriever)
+
+        self.assertIsInstance(processor.chooseDistributor(1),
+                              EvhrNodeDistributor)
+
+    #---------------------------------------------------------------------------
+    # testChooseNode
+    #---------------------------------------------------------------------------
+    def testChooseNode(self):
+
+        agent = NodeAgent(None, 0, 'localhost')
+        thread = threading.Thread(target = agent.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        try:
+            distributor = EvhrNodeDistributor([], 1, None)
+            distributor.port = agent.server_address[1]
+            distributor.getNodeNames = lambda: ['localhost', 'noSuchNode']
+
+            self.assertEqual(distributor.chooseNode(), 'localhost')
+            self.assertEqual(distributor.deadNodes, set(['noSuchNode']))
+
+            # Speculative duplicates avoid the original's node.
+            self.assertEqual(distributor.chooseNode('localhost'), None)
+
+            # No reachable nodes remain.
+            distributor.deadNodes.add('localhost')
+            self.assertEqual(distributor.chooseNode(), None)
+
+        finally:
+
+            agent.shutdown()
+            agent.server_close()
+
+    #---------------------------------------------------------------------------
+    # testPercentile
+    #---------------------------------------------------------------------------
+    def testPercentile(self):
+
+        values = [5, 1, 4, 2, 3]
+
+        self.assertEqual(EvhrNodeDistributor.percentile(values, 0), 1)
+        self.assertEqual(EvhrNodeDistributor.percentile(values, 50), 3)
+        self.assertEqual(EvhrNodeDistributor.percentile(values, 100), 5)
+
+    #---------------------------------------------------------------------------
+    # testSpeculate
+    #---------------------------------------------------------------------------
+    def testSpeculate(self):
+
+        distributor = EvhrNodeDistributor([], 1, None)
+        distributor.percentile = 90
+        started = []
+
+        distributor.startAttempt = \
+            lambda cp, speculative, avoid: started.append((cp, avoid))
+
+        request = Stub(destination = Stub(name = '/requests/1'))
+
+        def makeEntry(cId, age):
+
+            cp = Stub(constituent = Stub(id = cId, request = request),
+                      inputFile = '/requests/1/5-toas/strip' + str(cId))
+
+            distributor.attemptNodes[(cId, False)] = 'node' + str(cId)
+
+            return {'cp': cp,
+                    'started': time.time() - age,
+                    'attempts': 1,
+                    'speculated': False}
+
+        running = {1: makeEntry(1, 5), 2: makeEntry(2, 500)}
+
+        # Too few constituents have finished.
+        distributor.speculate(running, [10, 10])
+        self.assertEqual(started, [])
+
+        # Only the straggler is duplicated, away from its node, and once.
+        distributor.speculate(running, [10, 10, 20])
+        distributor.speculate(running, [10, 10, 20])
+
+        self.assertEqual(started, [(running[2]['cp'], 'node2')])
+        self.assertEqual(running[2]['attempts'], 2)
+        self.assertEqual(running[1]['attempts'], 1)
+
+    #---------------------------------------------------------------------------
+    # testSpeculativeRequest
+    #
+    # This runs a ToA request's constituents through the distributor
+    # RequestProcessor chooses, with attempts that finish at once, except the
+    # straggler's original.  Its duplicate wins, and its output is moved into
+    # the request directory.
+    #---------------------------------------------------------------------------
+    @override_settings(SPECULATION_MIN_SAMPLES = 3,
+                       SPECULATION_PERCENTILE = 50,
+                       THREAD_DISTRIBUTOR = 'EvhrEngine.management.' + \
+                           'EvhrNodeDistributor.EvhrNodeDistributor')
+    def testSpeculativeRequest(self):
+
+        requestDir = tempfile.mkdtemp()
+        aggregated = []
+
+        retriever = Stub(getSlotWeight = lambda: 1,
+                         getCostProfile = lambda: {},
+                         aggregateOne = lambda inFile, dest: \
+                             aggregated.append(dest))
+
+        request = Stub(name = 'ToA', destination = Stub(name = requestDir))
+
+        cps = [Stub(constituent = Stub(id = cId,
+                                       request = request,
+                                       save = lambda **kwargs: None),
+                    inputFile = os.path.join(requestDir,
+                                             'strip' + str(cId) + '.tif'),
+                    retriever = retriever) for cId in range(1, 5)]
+
+        processor = RequestProcessor(request)
+        processor.retriever = EvhrToaRetriever.__new__(EvhrToaRetriever)
+        processor.constituentProcessors = cps
+        distributor = processor.chooseDistributor(len(cps))
+        duplicated = []
+
+        def startAttempt(cp, speculative, avoid = None):
+
+            cId = cp.constituent.id
+            distributor.attemptNodes[(cId, speculative)] = 'node' + str(cId)
+            dest = os.path.join(requestDir, 'strip' + str(cId) + '-toa.tif')
+
+            if speculative:
+
+                duplicated.append((cId, avoid))
+                scratchDir = speculativeDir(requestDir, cId)
+                os.makedirs(scratchDir)
+                dest = os.path.join(scratchDir, os.path.basename(dest))
+                open(dest, 'w').close()
+
+            # Constituent 4 straggles.
+            elif cId == 4:
+                return
+
+            distributor.completions.put((cp, {'success': True,
+                                              'destination': dest},
+                                         speculative))
+
+        distributor.startAttempt = startAttempt
+
+        try:
+            self.assertTrue(distributor.distribute())
+            self.assertEqual(duplicated, [(4, 'node4')])
+
+            finalDest = os.path.join(requestDir, 'strip4-toa.tif')
+
+            self.assertTrue(os.path.exists(finalDest))
+            self.assertFalse(os.path.exists(speculativeDir(requestDir, 4)))
+            self.assertEqual(len(aggregated), 4)
+            self.assertTrue(finalDest in aggregated)
+
+        finally:
+            shutil.rmtree(requestDir, True)
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from EvhrEngine.management.ProductCache import ProductCache
+
+#--------------------------------------------------------------------------------
+# TestProductCache
+#
+# ./manage.py test EvhrEngine.tests.test_ProductCache --failfast
+#--------------------------------------------------------------------------------
+class TestProductCache(SimpleTestCase):
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.tempDir = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.tempDir, 'cache')
+        self.requestDir = os.path.join(self.tempDir, 'request')
+        os.mkdir(self.requestDir)
+
+    #---------------------------------------------------------------------------
+    # tearDown
+    #---------------------------------------------------------------------------
+    def tearDown(self):
+
+        shutil.rmtree(self.tempDir, True)
+
+    #---------------------------------------------------------------------------
+    # makeProduct
+    #---------------------------------------------------------------------------
+    def makeProduct(self, name, size = 10):
+
+        product = os.path.join(self.requestDir, name + '.tif')
+
+        for fileName in [product, product.replace('.tif', '.xml')]:
+
+            with open(fileName, 'w') as f:
+                f.write('x' * size)
+
+        return product
+
+    #---------------------------------------------------------------------------
+    # testKeysChain
+    #---------------------------------------------------------------------------
+    def testKeysChain(self):
+
+        mosaicKey = ProductCache.makeKey('mosaic', ['b.ntf', 'a.ntf'])
+
+        self.assertEqual(mosaicKey,
+                         ProductCache.makeKey('mosaic', ['a.ntf', 'b.ntf']))
+
+        self.assertNotEqual(ProductCache.makeKey('ortho', [mosaicKey],
+                                                 {'outRes': 1}),
+                            ProductCache.makeKey('ortho', [mosaicKey],
+                                                 {'outRes': 2}))
+
+    #---------------------------------------------------------------------------
+    # testStoreAndFetch
+    #---------------------------------------------------------------------------
+    def testStoreAndFetch(self):
+
+        with self.settings(PRODUCT_CACHE_DIR = self.cacheDir):
+
+            cache = ProductCache()
+            product = self.makeProduct('strip')
+            key = ProductCache.makeKey('mosaic', ['a.ntf'])
+
+            self.assertFalse(cache.fetch(key, product))
+            cache.store(key, product)
+            self.assertTrue(cache.contains(key))
+
+            # Another request receives the product and its XML.
+            otherFile = os.path.join(self.tempDir, 'other.tif')
+            self.assertTrue(cache.fetch(key, otherFile))
+            self.assertTrue(os.path.exists(otherFile))
+            self.assertTrue(os.path.exists(otherFile.replace('.tif', '.xml')))
+
+    #---------------------------------------------------------------------------
+    # testEviction
+    #---------------------------------------------------------------------------
+    def testEviction(self):
+
+        # The quota holds one 20-byte product.
+        with self.settings(PRODUCT_CACHE_DIR = self.cacheDir,
+                           PRODUCT_CACHE_QUOTA_GB = 30.0 / 1024 ** 3):
+
+            cache = ProductCache()
+            oldKey = ProductCache.makeKey('mosaic', ['old.ntf'])
+            newKey = ProductCache.makeKey('mosaic', ['new.ntf'])
+
+            cache.store(oldKey, self.makeProduct('old'))
+            os.utime(cache.entryDir(oldKey), (time.time() - 60,) * 2)
+            cache.store(newKey, self.makeProduct('new'))
+
+            # Storing does not evict.
+            self.assertTrue(cache.contains(oldKey))
+
+            self.assertEqual(cache.evict(), 1)
+            self.assertFalse(cache.contains(oldKey))
+            self.assertTrue(cache.contains(newKey))
+
+    #---------------------------------------------------------------------------
+    # testDisabled
+    #---------------------------------------------------------------------------
+    def testDisabled(self):
+
+        cache = ProductCache()
+        cache.cacheDir = None
+        product = self.makeProduct('strip')
+        key = ProductCache.makeKey('mosaic', ['a.ntf'])
+
+        cache.store(key, product)
+        self.assertFalse(cache.fetch(key, product))
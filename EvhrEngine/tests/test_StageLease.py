@@ -0,0 +1,49 @@
+import datetime
+
+from django.test import TestCase
+
+from EvhrEngine.management.StageLease import StageLease
+from EvhrEngine.models import EvhrStageLease
+
+#--------------------------------------------------------------------------------
+# TestStageLease
+#
+# ./manage.py test EvhrEngine.tests.test_StageLease --failfast
+#--------------------------------------------------------------------------------
+class TestStageLease(TestCase):
+
+    #---------------------------------------------------------------------------
+    # testOneHolder
+    #---------------------------------------------------------------------------
+    def testOneHolder(self):
+
+        first = StageLease('strip')
+        second = StageLease('strip')
+
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+        self.assertFalse(EvhrStageLease.objects.filter(key = 'strip').exists())
+
+    #---------------------------------------------------------------------------
+    # testExpiredLeaseTaken
+    #---------------------------------------------------------------------------
+    def testExpiredLeaseTaken(self):
+
+        stale = EvhrStageLease()
+        stale.key = 'strip'
+        stale.pid = 1
+        stale.host = 'some.other.host'
+
+        stale.expires = datetime.datetime.now() - \
+                        datetime.timedelta(seconds = 1)
+
+        stale.save()
+
+        lease = StageLease('strip')
+        self.assertTrue(lease.acquire())
+        lease.release()
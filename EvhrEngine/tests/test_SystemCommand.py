@@ -0,0 +1,284 @@
+import datetime
+import re
+import signal
+import threading
+import time
+
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.db.utils import OperationalError
+from django.test import override_settings
+
+from EvhrEngine.management.CommandExecutor import CommandExecutor
+from EvhrEngine.management.SystemCommand import OutputTail
+from EvhrEngine.management.SystemCommand import SystemCommand
+from EvhrEngine.models import EvhrCommandResult
+from EvhrEngine.models import EvhrNode
+from EvhrEngine.models import EvhrNodeGroup
+from EvhrEngine.models import EvhrNodePID
+
+from ProcessingEngine.management.Retriever import Retriever
+from ProcessingEngine.models import Request
+
+#--------------------------------------------------------------------------------
+# TestOutputTail
+#
+# ./manage.py test EvhrEngine.tests.test_SystemCommand --failfast
+#--------------------------------------------------------------------------------
+class TestOutputTail(SimpleTestCase):
+
+    #---------------------------------------------------------------------------
+    # testErrorsFoundBeyondTail
+    #---------------------------------------------------------------------------
+    def testErrorsFoundBeyondTail(self):
+
+        tail = OutputTail(re.compile('error|ransac', re.IGNORECASE), 2)
+
+        # Errors split across reads are found.
+        tail.feed('ERR')
+        tail.feed('OR one\n')
+
+        for i in range(10):
+            tail.feed('progress ' + str(i) + '\r')
+
+        tail.feed('done')
+        tail.close()
+
+        self.assertEqual(tail.errors, set(['error']))
+        self.assertEqual(tail.text(), 'progress 9\ndone')
+
+    #---------------------------------------------------------------------------
+    # testLongLinesCut
+    #---------------------------------------------------------------------------
+    def testLongLinesCut(self):
+
+        tail = OutputTail(re.compile('ransac'), 10, 8)
+        tail.feed('ransac' + '.' * 100)
+        tail.feed('end\n')
+
+        self.assertEqual(tail.errors, set(['ransac']))
+        self.assertEqual(tail.text(), '.....end')
+
+#--------------------------------------------------------------------------------
+# TestCommandResult
+#
+# ./manage.py test EvhrEngine.tests.test_SystemCommand --failfast
+#--------------------------------------------------------------------------------
+class TestCommandResult(SimpleTestCase):
+
+    #---------------------------------------------------------------------------
+    # testResult
+    #---------------------------------------------------------------------------
+    def testResult(self):
+
+        sCmd = SystemCommand('/bin/echo telemetry', None, None)
+
+        self.assertEqual(sCmd.returnCode, 0)
+        self.assertEqual(sCmd.stdOut, 'telemetry')
+        self.assertEqual(sCmd.result.stage, 'echo')
+        self.assertTrue(sCmd.result.end >= sCmd.result.start)
+        self.assertTrue(sCmd.result.maxRssKB > 0)
+
+    #---------------------------------------------------------------------------
+    # testReturnCode
+    #---------------------------------------------------------------------------
+    def testReturnCode(self):
+
+        sCmd = SystemCommand('exit 3', None, None, stage = 'test')
+
+        self.assertEqual(sCmd.returnCode, 3)
+        self.assertEqual(sCmd.result.returnCode, 3)
+        self.assertEqual(sCmd.result.stage, 'test')
+
+        with self.assertRaises(RuntimeError):
+            SystemCommand('exit 3', None, None, raiseException = True)
+
+#--------------------------------------------------------------------------------
+# TestProcessControl
+#
+# ./manage.py test EvhrEngine.tests.test_SystemCommand --failfast
+#--------------------------------------------------------------------------------
+class TestProcessControl(SimpleTestCase):
+
+    #---------------------------------------------------------------------------
+    # testArgv
+    #---------------------------------------------------------------------------
+    def testArgv(self):
+
+        sCmd = SystemCommand(['echo', 'a  b'], None, None)
+
+        self.assertEqual(sCmd.stdOut, 'a  b')
+        self.assertEqual(sCmd.result.command, "echo 'a  b'")
+
+        self.assertEqual(SystemCommand.toArgv('gdalinfo "a b.tif"'),
+                         ['gdalinfo', 'a b.tif'])
+
+        self.assertEqual(SystemCommand.toArgv('ls *.tif'), None)
+        self.assertEqual(SystemCommand.toArgv('echo a > b'), None)
+
+    #---------------------------------------------------------------------------
+    # testKillRunning
+    #---------------------------------------------------------------------------
+    def testKillRunning(self):
+
+        commands = []
+
+        thread = threading.Thread(target = lambda: commands.append( \
+                                  SystemCommand('sleep 60', None, None)))
+        thread.start()
+
+        while not SystemCommand.running:
+            time.sleep(0.1)
+
+        SystemCommand.killRunning()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(commands[0].returnCode, -signal.SIGTERM)
+
+    #---------------------------------------------------------------------------
+    # testTimeout
+    #---------------------------------------------------------------------------
+    @override_settings(COMMAND_TIMEOUTS = {'slowStage': 1})
+    def testTimeout(self):
+
+        start = time.time()
+
+        # The background sleep holds the pipes, unless its group is killed.
+        sCmd = SystemCommand('sleep 60 & sleep 60', None, None, timeout = 1)
+
+        self.assertTrue(time.time() - start < 10)
+        self.assertTrue(sCmd.timedOut)
+
+        with self.assertRaises(RuntimeError) as cm:
+
+            SystemCommand('sleep 60', None, None, raiseException = True,
+                          stage = 'slowStage')
+
+        self.assertEqual(cm.exception.errorClass, Retriever.TRANSIENT)
+
+#--------------------------------------------------------------------------------
+# TestSystemCommand
+#
+# ./manage.py test EvhrEngine.tests.test_SystemCommand --failfast
+#--------------------------------------------------------------------------------
+@override_settings(NODE_GROUP = 'testGroup', NODE_SELECTION_USE_LOAD = True)
+class TestSystemCommand(TestCase):
+
+    #---------------------------------------------------------------------------
+    # setUp
+    #---------------------------------------------------------------------------
+    def setUp(self):
+
+        self.group = EvhrNodeGroup.objects.create(name = 'testGroup')
+
+    #---------------------------------------------------------------------------
+    # makeNode
+    #---------------------------------------------------------------------------
+    def makeNode(self, name, numPIDs, capacity = 1, load = None, age = 0):
+
+        node = EvhrNode.objects.create(group = self.group,
+                                       name = name,
+                                       capacity = capacity,
+                                       load = load)
+
+        if load != None:
+
+            node.heartbeat = datetime.datetime.now() - \
+                             datetime.timedelta(seconds = age)
+
+            node.save()
+
+        for pid in range(numPIDs):
+            EvhrNodePID.objects.create(node = node, pid = pid)
+
+        return node
+
+    #---------------------------------------------------------------------------
+    # testCapacity
+    #---------------------------------------------------------------------------
+    def testCapacity(self):
+
+        self.makeNode('small', 2)
+        self.makeNode('big', 4, capacity = 8)
+
+        with self.assertNumQueries(1):
+            node = SystemCommand.chooseNode()
+
+        self.assertEqual(node.name, 'big')
+
+    #---------------------------------------------------------------------------
+    # testFailedNodesAvoided
+    #---------------------------------------------------------------------------
+    def testFailedNodesAvoided(self):
+
+        self.makeNode('failed', 0)
+        self.makeNode('busy', 3)
+
+        SystemCommand.failedNodes[-1] = set(['failed'])
+
+        try:
+            self.assertEqual(SystemCommand.chooseNode(-1).name, 'busy')
+
+        finally:
+            SystemCommand.forgetRequest(-1)
+
+        # Finished requests are forgotten.
+        self.assertFalse(-1 in SystemCommand.failedNodes)
+        self.assertEqual(SystemCommand.chooseNode(-1).name, 'failed')
+
+    #---------------------------------------------------------------------------
+    # testLoad
+    #---------------------------------------------------------------------------
+    def testLoad(self):
+
+        self.makeNode('loaded', 0, load = 12.0)
+        self.makeNode('quiet', 1, load = 0.5)
+        self.assertEqual(SystemCommand.chooseNode().name, 'quiet')
+
+        # Stale loads are ignored.
+        EvhrNode.objects.filter(name = 'loaded'). \
+            update(heartbeat = datetime.datetime(2000, 1, 1))
+
+        self.assertEqual(SystemCommand.chooseNode().name, 'loaded')
+
+    #---------------------------------------------------------------------------
+    # testExecutor
+    #---------------------------------------------------------------------------
+    @override_settings(COMMAND_EXECUTORS = {'testGroup': 'FakeExecutor'})
+    def testExecutor(self):
+
+        self.makeNode('remote', 0)
+        executor = CommandExecutor.forGroup('testGroup')
+        del executor.commands[:]
+
+        sCmd = SystemCommand('echo remote', None, None, distribute = True)
+
+        self.assertEqual(executor.commands, [('remote', 'echo remote')])
+        self.assertEqual(sCmd.stdOut, 'remote')
+        self.assertEqual(sCmd.result.node, 'remote')
+        self.assertEqual(EvhrNodePID.objects.count(), 0)
+
+    #---------------------------------------------------------------------------
+    # testRecordFailure
+    #
+    # A command that succeeded does not fail when its result cannot be saved.
+    #---------------------------------------------------------------------------
+    def testRecordFailure(self):
+
+        def locked(*args, **kwargs):
+            raise OperationalError('database is locked')
+
+        save = EvhrCommandResult.save
+        EvhrCommandResult.save = locked
+
+        try:
+            sCmd = SystemCommand('/bin/echo telemetry', None, None,
+                                 request = Request(id = 1),
+                                 raiseException = True)
+
+        finally:
+            EvhrCommandResult.save = save
+
+        self.assertEqual(sCmd.returnCode, 0)
+        self.assertEqual(sCmd.result.stage, 'echo')
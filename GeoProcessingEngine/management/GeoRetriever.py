@@ -393,7 +393,8 @@ class GeoRetriever(Retriever):
     #---------------------------------------------------------------------------
     # transformBbox
     #---------------------------------------------------------------------------
-    def transformBbox(self, ulx, uly, lrx, lry, srs, outSRS):
+    @staticmethod
+    def transformBbox(ulx, uly, lrx, lry, srs, outSRS):
 
         if srs.IsSame(outSRS):
             return ulx, uly, lrx, lry
@@ -0,0 +1,277 @@
+import errno
+import glob
+import logging
+import os
+import select
+import socket
+import tempfile
+
+from django import db
+from django.conf import settings
+
+#-------------------------------------------------------------------------------
+# DaemonNotifier
+#
+# Job daemons sleep until something happens that might allow them to start a
+# request:  a new request arrives or a RequestProcess goes away.  Code causing
+# those events calls notifyDaemons(), and each daemon waits on a DaemonNotifier
+# instead of querying the database every second.
+#
+# UnixSocketNotifier is always available.  Each daemon binds a datagram socket
+# in a host-local directory, and notify() sends one byte to every socket found
+# there.  PostgresNotifier uses LISTEN/NOTIFY, so it also reaches daemons on
+# other hosts.  Notifications are only hints.  Daemons still poll, slowly, in
+# case one is lost.
+#-------------------------------------------------------------------------------
+class DaemonNotifier(object):
+
+    CHANNEL = 'evhr_job_daemon'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        self.logger = logger
+
+    #---------------------------------------------------------------------------
+    # close
+    #---------------------------------------------------------------------------
+    def close(self):
+        pass
+
+    #---------------------------------------------------------------------------
+    # wait
+    #
+    # This blocks until a notification arrives or timeout seconds pass.  It
+    # returns True when it was notified.
+    #---------------------------------------------------------------------------
+    def wait(self, timeout):
+        raise RuntimeError('This must be implemented by subclasses.')
+
+#-------------------------------------------------------------------------------
+# PostgresNotifier
+#-------------------------------------------------------------------------------
+class PostgresNotifier(DaemonNotifier):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #
+    # LISTEN needs a connection that is not shared with the ORM, because the
+    # ORM's connection is closed and reopened as the daemon runs.
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        super(PostgresNotifier, self).__init__(logger)
+
+        import psycopg2
+        import psycopg2.extensions
+
+        dbSettings = settings.DATABASES['default']
+
+        connArgs = {'dbname'   : dbSettings.get('NAME'),
+                    'user'     : dbSettings.get('USER'),
+                    'password' : dbSettings.get('PASSWORD'),
+                    'host'     : dbSettings.get('HOST'),
+                    'port'     : dbSettings.get('PORT')}
+
+        connArgs = dict((k, v) for k, v in connArgs.items() if v)
+
+        self.conn = psycopg2.connect(**connArgs)
+
+        self.conn.set_isolation_level( \
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+        self.conn.cursor().execute('LISTEN ' + DaemonNotifier.CHANNEL)
+
+        if self.logger:
+            self.logger.info('Listening for Postgres notifications.')
+
+    #---------------------------------------------------------------------------
+    # close
+    #---------------------------------------------------------------------------
+    def close(self):
+
+        self.conn.close()
+
+    #---------------------------------------------------------------------------
+    # notify
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def notify():
+
+        db.connection.cursor().execute('NOTIFY ' + DaemonNotifier.CHANNEL)
+
+    #---------------------------------------------------------------------------
+    # wait
+    #---------------------------------------------------------------------------
+    def wait(self, timeout):
+
+        if not select.select([self.conn], [], [], timeout)[0]:
+            return False
+
+        self.conn.poll()
+        del self.conn.notifies[:]
+        return True
+
+#-------------------------------------------------------------------------------
+# UnixSocketNotifier
+#-------------------------------------------------------------------------------
+class UnixSocketNotifier(DaemonNotifier):
+
+    SOCKET_PREFIX = 'jobDaemon-'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        super(UnixSocketNotifier, self).__init__(logger)
+
+        sockDir = UnixSocketNotifier.socketDir()
+
+        if not os.path.exists(sockDir):
+            os.makedirs(sockDir)
+
+        self.sockFile = os.path.join(sockDir,
+                                     UnixSocketNotifier.SOCKET_PREFIX + \
+                                     str(os.getpid()) + '.sock')
+
+        if os.path.exists(self.sockFile):
+            os.remove(self.sockFile)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.sockFile)
+        self.sock.setblocking(0)
+
+        if self.logger:
+            self.logger.info('Listening for notifications on ' + self.sockFile)
+
+    #---------------------------------------------------------------------------
+    # close
+    #---------------------------------------------------------------------------
+    def close(self):
+
+        self.sock.close()
+
+        if os.path.exists(self.sockFile):
+            os.remove(self.sockFile)
+
+    #---------------------------------------------------------------------------
+    # notify
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def notify():
+
+        globStr = os.path.join(UnixSocketNotifier.socketDir(),
+                               UnixSocketNotifier.SOCKET_PREFIX + '*.sock')
+
+        for sockFile in glob.glob(globStr):
+
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.setblocking(0)
+
+            try:
+                sock.sendto(b'1', sockFile)
+
+            except socket.error as err:
+
+                # Nobody is bound to it, so its daemon died.
+                if err.errno == errno.ECONNREFUSED:
+
+                    try:
+                        os.remove(sockFile)
+
+                    except OSError:
+                        pass
+
+                #---
+                # EAGAIN means the daemon's buffer is full of notifications it
+                # has not read yet, so another one is unnecessary.
+                #---
+
+            finally:
+                sock.close()
+
+    #---------------------------------------------------------------------------
+    # socketDir
+    #
+    # Unix sockets only work within a host, so this must not be on a shared
+    # file system.  Otherwise, one host would remove another's sockets.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def socketDir():
+
+        if hasattr(settings, 'JOB_DAEMON_SOCKET_DIR'):
+            return settings.JOB_DAEMON_SOCKET_DIR
+
+        return os.path.join(tempfile.gettempdir(), 'evhrJobDaemon')
+
+    #---------------------------------------------------------------------------
+    # wait
+    #---------------------------------------------------------------------------
+    def wait(self, timeout):
+
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return False
+
+        # Several notifications may have arrived.  Consume them all.
+        try:
+            while True:
+                self.sock.recv(64)
+
+        except socket.error:
+            pass
+
+        return True
+
+#-------------------------------------------------------------------------------
+# createNotifier
+#-------------------------------------------------------------------------------
+def createNotifier(logger = None):
+
+    if usePostgres():
+
+        try:
+            return PostgresNotifier(logger)
+
+        except Exception as e:
+
+            if logger:
+
+                logger.warning('Unable to listen for Postgres ' + \
+                               'notifications, so using a Unix socket.  ' + \
+                               str(e))
+
+    return UnixSocketNotifier(logger)
+
+#-------------------------------------------------------------------------------
+# notifyDaemons
+#
+# This wakes the job daemons.  A failure to notify must never break the caller,
+# because daemons eventually poll anyway.
+#-------------------------------------------------------------------------------
+def notifyDaemons():
+
+    try:
+        if usePostgres():
+            PostgresNotifier.notify()
+
+    except Exception:
+        logging.getLogger('jobDaemon').exception('Postgres notify failed.')
+
+    try:
+        UnixSocketNotifier.notify()
+
+    except Exception:
+        logging.getLogger('jobDaemon').exception('Socket notify failed.')
+
+#-------------------------------------------------------------------------------
+# usePostgres
+#-------------------------------------------------------------------------------
+def usePostgres():
+
+    if hasattr(settings, 'JOB_DAEMON_NOTIFIER'):
+        return settings.JOB_DAEMON_NOTIFIER == 'postgres'
+
+    return db.connections['default'].vendor == 'postgresql'
@@ -0,0 +1,285 @@
+import logging
+import multiprocessing
+import signal
+import time
+import traceback
+
+from django import db
+from django.conf import settings
+
+from ProcessingEngine.management.ProcessReconciler import PROCESS_MODELS
+from ProcessingEngine.management.ProcessReconciler import reconcile
+
+from JobDaemon.models import JobDaemonProcess
+from JobDaemon.management.DaemonNotifier import notifyDaemons
+from JobDaemon.management.RequestClaim import recoverStaleClaims
+from JobDaemon.management.commands import killZombieJobDaemons
+from JobDaemon.management.commands import purgeRequests
+from JobDaemon.management.commands import purgeRequestDirs
+from JobDaemon.management.commands import purgeZipFiles
+
+# Every model whose rows record local PIDs.
+processModels = PROCESS_MODELS + [JobDaemonProcess]
+
+if 'EvhrEngine' in settings.INSTALLED_APPS:
+
+    from EvhrEngine.management.ProductCache import ProductCache
+    from EvhrEngine.models import EvhrNodePID
+    from EvhrEngine.models import EvhrStageLease
+    processModels.append(EvhrNodePID)
+    processModels.append(EvhrStageLease)
+
+#-------------------------------------------------------------------------------
+# Housekeeper
+#
+# This runs the job daemon's housekeeping in its own process, so purging old
+# requests and files never delays dispatch.  It is a process, not a thread,
+# because the daemon forks request workers, and forking while another thread
+# holds a lock can deadlock the child.
+#
+# Each cycle does a bounded amount of work: at most batchSize rows or files per
+# task.  When a task fills its batch, the next cycle starts immediately, so a
+# backlog drains steadily without long pauses.
+#
+# Each task's totals are logged after every cycle with work, and every
+# metricsSeconds otherwise.
+#-------------------------------------------------------------------------------
+class Housekeeper(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cycleSeconds = 60, logger = None):
+
+        self.batchSize      = 500
+        self.cycleSeconds   = cycleSeconds
+        self.logger         = logger or logging.getLogger('jobDaemon')
+        self.metricsSeconds = 3600
+        self.process        = None
+        self.stopEvent      = multiprocessing.Event()
+
+        if hasattr(settings, 'HOUSEKEEPING_BATCH_SIZE'):
+            self.batchSize = settings.HOUSEKEEPING_BATCH_SIZE
+
+        if hasattr(settings, 'HOUSEKEEPING_METRICS_SECONDS'):
+            self.metricsSeconds = settings.HOUSEKEEPING_METRICS_SECONDS
+
+        self.tasks = [('reapProcesses',    self.reapProcesses),
+                      ('purgeZipFiles',    self.purgeZipFiles),
+                      ('purgeRequests',    self.purgeRequests),
+                      ('purgeRequestDirs', self.purgeRequestDirs),
+                      ('killZombies',      self.killZombies),
+                      ('recoverClaims',    self.recoverClaims)]
+
+        if 'EvhrEngine' in settings.INSTALLED_APPS:
+            self.tasks.append(('evictProducts', self.evictProducts))
+
+        # Task name -> {'runs', 'items', 'errors', 'seconds'}
+        self.metrics = {}
+
+        for name, task in self.tasks:
+
+            self.metrics[name] = {'runs': 0,
+                                  'items': 0,
+                                  'errors': 0,
+                                  'seconds': 0.0}
+
+    #---------------------------------------------------------------------------
+    # cycle
+    #
+    # This runs every task once, and returns True when any task filled its
+    # batch, meaning more work is waiting.
+    #---------------------------------------------------------------------------
+    def cycle(self):
+
+        backlog = False
+        summary = []
+
+        for name, task in self.tasks:
+
+            startTime = time.time()
+            numItems  = 0
+
+            try:
+                numItems = task() or 0
+
+            except Exception:
+
+                self.metrics[name]['errors'] += 1
+                self.logger.warning('Housekeeping task ' + name + ' failed.')
+                self.logger.warning(traceback.format_exc())
+
+            seconds = time.time() - startTime
+            self.metrics[name]['runs']    += 1
+            self.metrics[name]['items']   += numItems
+            self.metrics[name]['seconds'] += seconds
+
+            if numItems:
+                summary.append(name + '=' + str(numItems))
+
+            if numItems >= self.batchSize:
+                backlog = True
+
+        # This process may sleep a long time, so do not hold a connection.
+        db.connections.close_all()
+
+        if summary:
+
+            self.logger.info('Housekeeping removed ' + ', '.join(summary) +
+                             ('; more remains.' if backlog else '.'))
+
+        return backlog
+
+    #---------------------------------------------------------------------------
+    # evictProducts
+    #
+    # This keeps EVHR's product cache within its quota.
+    #---------------------------------------------------------------------------
+    def evictProducts(self):
+
+        return ProductCache(self.logger).evict()
+
+    #---------------------------------------------------------------------------
+    # killZombies
+    #---------------------------------------------------------------------------
+    def killZombies(self):
+
+        killZombieJobDaemons.killZombieJobDaemons()
+
+    #---------------------------------------------------------------------------
+    # logMetrics
+    #---------------------------------------------------------------------------
+    def logMetrics(self):
+
+        for name, task in self.tasks:
+
+            m = self.metrics[name]
+
+            self.logger.info('Housekeeping ' + name + ': ' +
+                             str(m['runs']) + ' run(s), ' +
+                             str(m['items']) + ' item(s), ' +
+                             str(m['errors']) + ' error(s), ' +
+                             '%.1f' % m['seconds'] + ' second(s)')
+
+    #---------------------------------------------------------------------------
+    # purgeRequestDirs
+    #---------------------------------------------------------------------------
+    def purgeRequestDirs(self):
+
+        return purgeRequestDirs.purgeRequestDirs(self.batchSize)
+
+    #---------------------------------------------------------------------------
+    # purgeRequests
+    #---------------------------------------------------------------------------
+    def purgeRequests(self):
+
+        return purgeRequests.purgeRequests(self.batchSize)
+
+    #---------------------------------------------------------------------------
+    # purgeZipFiles
+    #---------------------------------------------------------------------------
+    def purgeZipFiles(self):
+
+        return purgeZipFiles.purgeZipFiles(self.batchSize)
+
+    #---------------------------------------------------------------------------
+    # reapProcesses
+    #
+    # Delete process rows on this host whose PIDs are gone, using one scan of
+    # the live PIDs.  Dead request processes free daemon slots, so the daemons
+    # are woken once after the deletions.
+    #---------------------------------------------------------------------------
+    def reapProcesses(self):
+
+        numDeleted = reconcile(processModels, self.logger, self.batchSize)
+
+        if numDeleted:
+            notifyDaemons()
+
+        return numDeleted
+
+    #---------------------------------------------------------------------------
+    # recoverClaims
+    #---------------------------------------------------------------------------
+    def recoverClaims(self):
+
+        recoverStaleClaims(self.logger)
+
+    #---------------------------------------------------------------------------
+    # run
+    #
+    # This is the housekeeping process's main loop.
+    #---------------------------------------------------------------------------
+    def run(self):
+
+        # The daemon handles <ctrl-c> and stops this process through stop().
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        nextMetrics = time.time() + self.metricsSeconds
+
+        while not self.stopEvent.is_set():
+
+            try:
+                backlog = self.cycle()
+
+            except Exception:
+
+                self.logger.warning(traceback.format_exc())
+                backlog = False
+
+            if time.time() >= nextMetrics:
+
+                self.logMetrics()
+                nextMetrics = time.time() + self.metricsSeconds
+
+            if not backlog:
+                self.stopEvent.wait(self.cycleSeconds)
+
+        self.logMetrics()
+
+    #---------------------------------------------------------------------------
+    # start
+    #---------------------------------------------------------------------------
+    def start(self):
+
+        # The child must not share the parent's database connections.
+        db.connections.close_all()
+
+        self.process = multiprocessing.Process(target = self.run)
+        self.process.daemon = True
+        self.process.start()
+
+        self.logger.info('Started housekeeping process ' +
+                         str(self.process.pid))
+
+    #---------------------------------------------------------------------------
+    # stop
+    #---------------------------------------------------------------------------
+    def stop(self, timeout = 30):
+
+        if not self.process:
+            return
+
+        self.stopEvent.set()
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.process = None
+
+    #---------------------------------------------------------------------------
+    # watch
+    #
+    # The daemon calls this regularly to restart a housekeeper that died.
+    #---------------------------------------------------------------------------
+    def watch(self):
+
+        if self.process and not self.process.is_alive():
+
+            self.logger.warning('Housekeeping process ' +
+                                str(self.process.pid) +
+                                ' exited; restarting it.')
+
+            self.process.join()
+            self.start()
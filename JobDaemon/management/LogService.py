@@ -0,0 +1,253 @@
+import gzip
+import logging
+import multiprocessing
+import os
+import Queue
+import shutil
+import signal
+import time
+import traceback
+
+from django.conf import settings
+
+#-------------------------------------------------------------------------------
+# QueueHandler
+#
+# This logging handler hands records to a LogService instead of writing them.
+# Python 2 has no logging.handlers.QueueHandler, so this is a small version of
+# it.  Records are formatted here, because arguments and tracebacks may not
+# pickle, and tagged with the file they belong in.
+#-------------------------------------------------------------------------------
+class QueueHandler(logging.Handler):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, queue, logFile):
+
+        super(QueueHandler, self).__init__()
+
+        self.logFile = logFile
+        self.queue   = queue
+
+    #---------------------------------------------------------------------------
+    # emit
+    #---------------------------------------------------------------------------
+    def emit(self, record):
+
+        try:
+            self.queue.put_nowait((self.logFile, self.format(record)))
+
+        except Exception:
+            self.handleError(record)
+
+#-------------------------------------------------------------------------------
+# LogService
+#
+# Per-request logs live on the shared file system, where every process writing
+# a log line synchronously contends for the file.  Instead, workers, and the
+# constituent processes they fork, put lines on a queue, and one listener
+# process per daemon writes them.  The listener gathers lines for up to
+# flushSeconds, then appends each file's lines in one write.  Files are closed
+# after each batch, so readers on other hosts see the lines.
+#
+# When REQUEST_LOG_ROTATE_BYTES is set, a log larger than that is rotated, and
+# REQUEST_LOG_BACKUP_COUNT older logs are kept.  REQUEST_LOG_COMPRESS gzips
+# the old logs.
+#
+# The queue belongs to this object, so a listener that dies can be replaced
+# without losing queued lines.
+#-------------------------------------------------------------------------------
+class LogService(object):
+
+    # Write at least this often.
+    FLUSH_SECONDS = 1.0
+
+    # Write after gathering this many lines, even if flushSeconds has not
+    # passed.
+    MAX_BATCH = 1000
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        self.backupCount = 5
+        self.compress    = False
+        self.logger      = logger
+        self.process     = None
+        self.queue       = multiprocessing.Queue()
+        self.rotateBytes = 0
+
+        if hasattr(settings, 'REQUEST_LOG_BACKUP_COUNT'):
+            self.backupCount = settings.REQUEST_LOG_BACKUP_COUNT
+
+        if hasattr(settings, 'REQUEST_LOG_COMPRESS'):
+            self.compress = settings.REQUEST_LOG_COMPRESS
+
+        if hasattr(settings, 'REQUEST_LOG_ROTATE_BYTES'):
+            self.rotateBytes = settings.REQUEST_LOG_ROTATE_BYTES
+
+    #---------------------------------------------------------------------------
+    # getHandler
+    #---------------------------------------------------------------------------
+    def getHandler(self, logFile):
+
+        return QueueHandler(self.queue, logFile)
+
+    #---------------------------------------------------------------------------
+    # listen
+    #
+    # This is the listener process's main loop.  A None on the queue stops it,
+    # after writing what came before.
+    #---------------------------------------------------------------------------
+    def listen(self):
+
+        # The daemon handles <ctrl-c> and stops this process through stop().
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        stopping = False
+
+        while not stopping:
+
+            # Block for the first line, then gather more for a while.
+            batch = {}      # log file -> [line, ...]
+            numLines = 0
+            deadline = None
+
+            while numLines < LogService.MAX_BATCH:
+
+                try:
+                    if deadline == None:
+                        item = self.queue.get()
+
+                    else:
+
+                        timeout = deadline - time.time()
+
+                        if timeout <= 0:
+                            break
+
+                        item = self.queue.get(True, timeout)
+
+                except Queue.Empty:
+                    break
+
+                if item == None:
+
+                    stopping = True
+                    break
+
+                logFile, line = item
+                batch.setdefault(logFile, []).append(line)
+                numLines += 1
+
+                if deadline == None:
+                    deadline = time.time() + LogService.FLUSH_SECONDS
+
+            for logFile, lines in batch.items():
+
+                try:
+                    self.write(logFile, lines)
+
+                except Exception:
+
+                    if self.logger:
+
+                        self.logger.warning('Unable to write to ' + logFile)
+                        self.logger.warning(traceback.format_exc())
+
+    #---------------------------------------------------------------------------
+    # rotate
+    #---------------------------------------------------------------------------
+    def rotate(self, logFile):
+
+        suffix = '.gz' if self.compress else ''
+
+        def backupName(i):
+            return logFile + '.' + str(i) + suffix
+
+        for i in range(self.backupCount - 1, 0, -1):
+
+            if os.path.exists(backupName(i)):
+                os.rename(backupName(i), backupName(i + 1))
+
+        if self.backupCount < 1:
+            os.remove(logFile)
+
+        elif self.compress:
+
+            with open(logFile, 'rb') as src:
+
+                with gzip.open(backupName(1), 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+
+            os.remove(logFile)
+
+        else:
+            os.rename(logFile, backupName(1))
+
+    #---------------------------------------------------------------------------
+    # start
+    #---------------------------------------------------------------------------
+    def start(self):
+
+        self.process = multiprocessing.Process(target = self.listen)
+        self.process.daemon = True
+        self.process.start()
+
+        if self.logger:
+            self.logger.info('Started log service ' + str(self.process.pid))
+
+    #---------------------------------------------------------------------------
+    # stop
+    #---------------------------------------------------------------------------
+    def stop(self, timeout = 30):
+
+        if not self.process:
+            return
+
+        self.queue.put(None)
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.process = None
+
+    #---------------------------------------------------------------------------
+    # watch
+    #
+    # The daemon calls this regularly to restart a listener that died.
+    #---------------------------------------------------------------------------
+    def watch(self):
+
+        if self.process and not self.process.is_alive():
+
+            if self.logger:
+
+                self.logger.warning('Log service ' + str(self.process.pid) +
+                                    ' exited; restarting it.')
+
+            self.process.join()
+            self.start()
+
+    #---------------------------------------------------------------------------
+    # write
+    #---------------------------------------------------------------------------
+    def write(self, logFile, lines):
+
+        # The request's directory may have been purged.
+        if not os.path.isdir(os.path.dirname(logFile)):
+            return
+
+        text = '\n'.join(lines) + '\n'
+
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+
+        with open(logFile, 'ab') as f:
+            f.write(text)
+
+        if self.rotateBytes and os.path.getsize(logFile) > self.rotateBytes:
+            self.rotate(logFile)
@@ -0,0 +1,135 @@
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from ProcessingEngine.models import Request
+from ProcessingEngine.models import RequestProcess
+from ProcessingEngine.models import thisHost
+
+from JobDaemon.models import JobDaemonProcess
+from JobDaemon.management.DaemonNotifier import notifyDaemons
+
+#-------------------------------------------------------------------------------
+# Request claims
+#
+# Several job daemons, on one or more hosts, may share the database.  Before
+# running a request, a daemon claims it with a conditional UPDATE that only
+# succeeds when the request is unstarted and unclaimed, or its claim's lease
+# expired.  The database applies the UPDATE atomically, so only one daemon
+# wins.
+#
+# Daemons renew the leases of the requests they run and their own heartbeat.
+# When a daemon dies, its leases and heartbeat expire, and other daemons
+# recover its requests.
+#-------------------------------------------------------------------------------
+
+#-------------------------------------------------------------------------------
+# claimableFilter
+#-------------------------------------------------------------------------------
+def claimableFilter(now = None):
+
+    now = now or datetime.datetime.now()
+
+    return Q(started = False) & \
+           (Q(claimHost__isnull = True) | Q(leaseExpires__lt = now))
+
+#-------------------------------------------------------------------------------
+# claimRequest
+#
+# This returns True when this daemon won the request.
+#-------------------------------------------------------------------------------
+def claimRequest(reqId, daemonPid):
+
+    now = datetime.datetime.now()
+
+    numClaimed = Request.objects.                           \
+                 filter(claimableFilter(now), id = reqId).  \
+                 update(claimHost = thisHost(),
+                        claimPid = daemonPid,
+                        leaseExpires = now + leaseDuration())
+
+    return numClaimed == 1
+
+#-------------------------------------------------------------------------------
+# daemonsAlive
+#-------------------------------------------------------------------------------
+def daemonsAlive():
+
+    return JobDaemonProcess.objects.                               \
+           filter(heartbeat__gte = datetime.datetime.now() -       \
+                                   leaseDuration()).exists()
+
+#-------------------------------------------------------------------------------
+# heartbeat
+#
+# This marks the daemon alive and extends the leases of its requests.
+#-------------------------------------------------------------------------------
+def heartbeat(daemonProcess, reqIds):
+
+    now = datetime.datetime.now()
+    daemonProcess.heartbeat = now
+    daemonProcess.save(update_fields = ['heartbeat'])
+
+    if reqIds:
+
+        Request.objects.filter(id__in = reqIds,
+                               claimHost = thisHost(),
+                               claimPid = daemonProcess.pid). \
+                        update(leaseExpires = now + leaseDuration())
+
+#-------------------------------------------------------------------------------
+# leaseDuration
+#-------------------------------------------------------------------------------
+def leaseDuration():
+
+    seconds = 120
+
+    if hasattr(settings, 'JOB_DAEMON_LEASE_SECONDS'):
+        seconds = settings.JOB_DAEMON_LEASE_SECONDS
+
+    return datetime.timedelta(seconds = seconds)
+
+#-------------------------------------------------------------------------------
+# recoverStaleClaims
+#
+# Unstarted requests with expired leases are released.  Started requests whose
+# claiming daemon stopped renewing them lose their RequestProcesses, which
+# makes them FAILED, just as when a local request process dies.  Processes on
+# this host are left to the PID checks, which are more precise.  The daemons
+# are woken once when anything was recovered.
+#-------------------------------------------------------------------------------
+def recoverStaleClaims(logger = None):
+
+    now = datetime.datetime.now()
+
+    # Forget daemons that stopped beating.
+    JobDaemonProcess.objects.filter(heartbeat__lt = now - leaseDuration()). \
+                             exclude(host = thisHost()).                    \
+                             delete()
+
+    numReleased = Request.objects.                                  \
+                  filter(started = False, leaseExpires__lt = now).  \
+                  update(claimHost = None,
+                         claimPid = None,
+                         leaseExpires = None)
+
+    staleProcs = RequestProcess.objects.                                    \
+                 filter(request__aggregationComplete = False,
+                        request__leaseExpires__lt = now - leaseDuration()). \
+                 exclude(request__claimHost__isnull = True).                \
+                 exclude(host = thisHost())
+
+    numOrphaned = staleProcs.count()
+
+    if numOrphaned:
+        staleProcs.delete()
+
+    if numReleased or numOrphaned:
+        notifyDaemons()
+
+    if logger and (numReleased or numOrphaned):
+
+        logger.info('Released ' + str(numReleased) +
+                    ' stale claim(s) and removed ' + str(numOrphaned) +
+                    ' orphaned request process(es).')
@@ -0,0 +1,178 @@
+import datetime
+import importlib
+import traceback
+
+from django.conf import settings
+from django.db.models import Count
+
+from ProcessingEngine.models import HIGH_PRIORITY
+from ProcessingEngine.models import Request
+from ProcessingEngine.models import RequestProcess
+
+from JobDaemon.management.RequestClaim import claimableFilter
+
+#-------------------------------------------------------------------------------
+# RequestScheduler
+#
+# This chooses which pending requests the job daemon runs next.
+#
+#    1. Higher priority classes run first.  A request waiting longer than
+#       priorityAgingSeconds is promoted one class for each interval, so low
+#       priority requests cannot starve.
+#
+#    2. Within a class, submitters with the fewest running requests go first,
+#       so one submitter cannot fill every worker.
+#
+#    3. Then, shortest job first.  A request's estimated cost is divided by
+#       (1 + wait / agingSeconds), so large requests eventually run.
+#
+# Costs come from the function named by settings.REQUEST_COST_ESTIMATOR, which
+# takes a Request and returns a number, or None when the cost is unknown.  The
+# estimate is saved on the request, so it is computed once.  Unknown costs are
+# not saved, and are treated as typical costs.
+#-------------------------------------------------------------------------------
+class RequestScheduler(object):
+
+    # Only consider this many of the oldest pending requests per decision.
+    MAX_CANDIDATES = 500
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        self.logger               = logger
+        self.agingSeconds         = 3600
+        self.priorityAgingSeconds = 4 * 3600
+        self.estimator            = None
+
+        if hasattr(settings, 'SCHEDULER_AGING_SECONDS'):
+            self.agingSeconds = settings.SCHEDULER_AGING_SECONDS
+
+        if hasattr(settings, 'SCHEDULER_PRIORITY_AGING_SECONDS'):
+            self.priorityAgingSeconds = \
+                settings.SCHEDULER_PRIORITY_AGING_SECONDS
+
+        if hasattr(settings, 'REQUEST_COST_ESTIMATOR') and \
+           settings.REQUEST_COST_ESTIMATOR:
+
+            modName, funcName = settings.REQUEST_COST_ESTIMATOR.rsplit('.', 1)
+            mod = importlib.import_module(modName)
+            self.estimator = getattr(mod, funcName)
+
+    #---------------------------------------------------------------------------
+    # choose
+    #
+    # This returns the IDs of up to numToRun pending requests, best first.
+    #---------------------------------------------------------------------------
+    def choose(self, numToRun, exclude = []):
+
+        if numToRun <= 0:
+            return []
+
+        candidates = list(Request.objects.
+                          filter(claimableFilter()).
+                          exclude(id__in = exclude).
+                          order_by('created')
+                          [:RequestScheduler.MAX_CANDIDATES])
+
+        if not candidates:
+            return []
+
+        # Estimate the costs that are unknown.
+        if self.estimator:
+
+            for request in candidates:
+
+                if request.estimatedCost == None:
+                    self.estimate(request)
+
+        # Count running requests per submitter.
+        running = {}
+
+        runningReqs = RequestProcess.objects.                    \
+                      values('request__submitter').              \
+                      annotate(numRunning = Count('request'))
+
+        for row in runningReqs:
+            running[row['request__submitter']] = row['numRunning']
+
+        chosen = orderRequests(candidates,
+                               running,
+                               datetime.datetime.now(),
+                               self.agingSeconds,
+                               self.priorityAgingSeconds,
+                               numToRun)
+
+        return [request.id for request in chosen]
+
+    #---------------------------------------------------------------------------
+    # estimate
+    #---------------------------------------------------------------------------
+    def estimate(self, request):
+
+        try:
+            cost = self.estimator(request)
+
+            if cost == None:
+                return
+
+            request.estimatedCost = float(cost)
+            request.save(update_fields = ['estimatedCost'])
+
+        except Exception:
+
+            if self.logger:
+
+                self.logger.warning('Unable to estimate the cost of ' +
+                                    'request ' + str(request.id))
+
+                self.logger.warning(traceback.format_exc())
+
+#-------------------------------------------------------------------------------
+# orderRequests
+#
+# This is the scheduling policy, separated from the database.  Candidates need
+# id, priority, submitter, created and estimatedCost attributes.  Running maps
+# submitters to their number of running requests.  It returns up to numToRun
+# candidates, best first.
+#-------------------------------------------------------------------------------
+def orderRequests(candidates, running, now, agingSeconds, priorityAgingSeconds,
+                  numToRun):
+
+    # Unknown costs are treated as typical costs.
+    knownCosts = sorted([c.estimatedCost for c in candidates \
+                         if c.estimatedCost != None])
+
+    defaultCost = knownCosts[len(knownCosts) / 2] if knownCosts else 1.0
+
+    keys = {}
+
+    for c in candidates:
+
+        waitSeconds = max(0.0, (now - c.created).total_seconds())
+
+        priority = min(HIGH_PRIORITY, c.priority + \
+                       int(waitSeconds / priorityAgingSeconds))
+
+        cost = c.estimatedCost if c.estimatedCost != None else defaultCost
+        agedCost = cost / (1.0 + waitSeconds / agingSeconds)
+        keys[c.id] = (-priority, agedCost, c.created)
+
+    # Choose one at a time, because each choice changes the fair share.
+    running   = dict(running)
+    remaining = list(candidates)
+    chosen    = []
+
+    while remaining and len(chosen) < numToRun:
+
+        best = min(remaining, key = lambda c: (keys[c.id][0],
+                                               running.get(c.submitter, 0),
+                                               keys[c.id][1],
+                                               keys[c.id][2]))
+
+        chosen.append(best)
+        remaining.remove(best)
+        running[best.submitter] = running.get(best.submitter, 0) + 1
+
+    return chosen
@@ -0,0 +1,284 @@
+import logging
+import multiprocessing
+import os
+import Queue
+import time
+import traceback
+
+from django import db
+from django.conf import settings
+
+from ProcessingEngine.management.RequestProcessor import RequestProcessor
+from ProcessingEngine.models import Request
+from ProcessingEngine.models import thisHost
+
+from JobDaemon.management.DaemonNotifier import notifyDaemons
+from JobDaemon.management.LogService import QueueHandler
+
+requestTypes = []
+
+if 'GeoProcessingEngine' in settings.INSTALLED_APPS:
+
+    from GeoProcessingEngine.models import GeoRequest
+    requestTypes.append('georequest')
+
+if 'Loader' in settings.INSTALLED_APPS:
+
+    from Loader.models import LoaderRequest
+    requestTypes.append('loaderrequest')
+
+#-------------------------------------------------------------------------------
+# RequestWorkerPool
+#
+# This is a pool of long-lived processes that run RequestProcessors.  Forking
+# a fresh process for every request costs a fork, new database connections and
+# GDAL start-up, which dominates small requests.  Workers take request IDs from
+# a queue, instead, and exit after maxRequests requests, so leaks cannot
+# accumulate.  The pool replaces workers that exit.
+#
+# Workers report ('start', requestId, pid) and ('done', requestId, pid) on a
+# second queue, so the daemon knows which workers are idle.
+#
+# When a logQueue from a LogService is given, request logs are written through
+# it, instead of by each process.
+#-------------------------------------------------------------------------------
+class RequestWorkerPool(object):
+
+    # Seconds a submitted request may wait for a worker to report it started.
+    STARTUP_TIMEOUT = 60
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, numWorkers, maxRequests, numProcs = -1, logger = None,
+                 logQueue = None):
+
+        self.logger      = logger
+        self.logQueue    = logQueue
+        self.maxRequests = maxRequests
+        self.numProcs    = numProcs
+        self.numWorkers  = numWorkers
+        self.doneQueue   = multiprocessing.Queue()
+        self.taskQueue   = multiprocessing.Queue()
+        self.workers     = []
+
+        # Request ID -> submission time, for requests no worker has reported.
+        self.submitted = {}
+
+        # Worker PID -> request ID, for requests that are running.
+        self.running = {}
+
+    #---------------------------------------------------------------------------
+    # idleWorkers
+    #---------------------------------------------------------------------------
+    def idleWorkers(self):
+
+        return self.numWorkers - len(self.submitted) - len(self.running)
+
+    #---------------------------------------------------------------------------
+    # inFlight
+    #
+    # This returns the IDs of requests submitted to or running in the pool.
+    #---------------------------------------------------------------------------
+    def inFlight(self):
+
+        return self.submitted.keys() + self.running.values()
+
+    #---------------------------------------------------------------------------
+    # maintain
+    #
+    # Call this regularly to collect worker reports and replace workers that
+    # exited.
+    #---------------------------------------------------------------------------
+    def maintain(self):
+
+        # Collect reports.
+        try:
+            while True:
+
+                event, reqId, pid = self.doneQueue.get_nowait()
+
+                if event == 'start':
+
+                    self.submitted.pop(reqId, None)
+                    self.running[pid] = reqId
+
+                else:
+                    self.running.pop(pid, None)
+
+        except Queue.Empty:
+            pass
+
+        # Reap workers that exited, whether recycled or crashed.
+        for worker in list(self.workers):
+
+            if not worker.is_alive():
+
+                worker.join()
+                self.workers.remove(worker)
+                reqId = self.running.pop(worker.pid, None)
+
+                if reqId and self.logger:
+
+                    self.logger.warning('Request worker ' +
+                                        str(worker.pid) +
+                                        ' exited while running request ' +
+                                        str(reqId))
+
+        #---
+        # A worker could die after taking a request from the queue, but before
+        # reporting it.  That request is still unstarted, so forget it to allow
+        # resubmission.
+        #---
+        now = time.time()
+
+        for reqId, submitTime in self.submitted.items():
+
+            if now - submitTime > RequestWorkerPool.STARTUP_TIMEOUT:
+                del self.submitted[reqId]
+
+        # Replace missing workers.
+        while len(self.workers) < self.numWorkers:
+            self._startWorker()
+
+    #---------------------------------------------------------------------------
+    # _startWorker
+    #---------------------------------------------------------------------------
+    def _startWorker(self):
+
+        worker = multiprocessing.Process(target = requestWorker,
+                                         args = (self.taskQueue,
+                                                 self.doneQueue,
+                                                 self.maxRequests,
+                                                 self.numProcs,
+                                                 self.logQueue))
+
+        # The child must not share the parent's database connections.
+        db.connections.close_all()
+        worker.start()
+        self.workers.append(worker)
+
+        if self.logger:
+            self.logger.info('Started request worker ' + str(worker.pid))
+
+    #---------------------------------------------------------------------------
+    # stop
+    #---------------------------------------------------------------------------
+    def stop(self, timeout = 10):
+
+        for worker in self.workers:
+            self.taskQueue.put(None)
+
+        for worker in self.workers:
+
+            worker.join(timeout)
+
+            if worker.is_alive():
+                worker.terminate()
+
+        self.workers = []
+
+    #---------------------------------------------------------------------------
+    # submit
+    #---------------------------------------------------------------------------
+    def submit(self, reqId):
+
+        self.submitted[reqId] = time.time()
+        self.taskQueue.put(reqId)
+
+#-------------------------------------------------------------------------------
+# getTrueRequest
+#
+# Get the request object as its true type, instead of a base Request object,
+# so the derived methods are available.
+#
+# r = baseReq.georequest or baseReq.loaderrequest or baseReq
+#-------------------------------------------------------------------------------
+def getTrueRequest(baseReq):
+
+    for requestType in requestTypes:
+
+        try:
+            return baseReq.__getattribute__(requestType)
+
+        except:
+            pass
+
+    return baseReq
+
+#-------------------------------------------------------------------------------
+# requestWorker
+#
+# This is the main loop of one worker process.  Database connections persist
+# between requests, subject to CONN_MAX_AGE.
+#-------------------------------------------------------------------------------
+def requestWorker(taskQueue, doneQueue, maxRequests, numProcs,
+                  logQueue = None):
+
+    logger = logging.getLogger('jobDaemon')
+    numDone = 0
+
+    while maxRequests <= 0 or numDone < maxRequests:
+
+        reqId = taskQueue.get()
+
+        if reqId == None:
+            break
+
+        doneQueue.put(('start', reqId, os.getpid()))
+
+        try:
+            db.close_old_connections()
+            runRequest(reqId, numProcs, logQueue)
+
+        except Exception:
+            logger.info(traceback.format_exc())
+
+        doneQueue.put(('done', reqId, os.getpid()))
+        numDone += 1
+
+        # Wake the daemon, so it can give this worker another request.
+        notifyDaemons()
+
+#-------------------------------------------------------------------------------
+# runRequest
+#-------------------------------------------------------------------------------
+def runRequest(reqId, numProcs, logQueue = None):
+
+    # The request must still be claimed by this worker's daemon.
+    baseReqs = Request.objects.filter(id = reqId, 
+                                      started = False,
+                                      claimHost = thisHost(),
+                                      claimPid = os.getppid())
+
+    for requestType in requestTypes:
+        baseReqs = baseReqs.select_related(requestType)
+
+    # Another worker or daemon could have started it already.
+    if not baseReqs:
+        return
+
+    request = getTrueRequest(baseReqs[0])
+
+    # Create a logger.
+    reqLogger = logging.getLogger('request.' + str(request.id))
+    reqLogger.setLevel(logging.INFO)
+    logFile = os.path.join(request.destination.name, request.name + '.log')
+    
+    if logQueue:
+        handler = QueueHandler(logQueue, logFile)
+        
+    else:
+        handler = logging.FileHandler(logFile)
+        
+    handler.setLevel(logging.INFO)
+    reqLogger.addHandler(handler)
+
+    try:
+        RequestProcessor(request, numProcs, reqLogger)()
+
+    finally:
+
+        # This process lives on, so release the log file.
+        reqLogger.removeHandler(handler)
+        handler.close()
@@ -1,5 +1,5 @@
+import datetime
 import logging
-import multiprocessing
 import os
 import sys
 import time
@@ -10,29 +10,20 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db.utils import InterfaceError
 
-from ProcessingEngine.management.RequestProcessor import RequestProcessor
-from ProcessingEngine.models import ConstituentProcess
-from ProcessingEngine.models import Request
-from ProcessingEngine.models import RequestProcess
+from ProcessingEngine.management.ProcessReconciler import reconcile
 
 from JobDaemon import models
-from JobDaemon.management.commands import killZombieJobDaemons
-from JobDaemon.management.commands import purgeRequests
-from JobDaemon.management.commands import purgeRequestDirs
-from JobDaemon.management.commands import purgeZipFiles
+from JobDaemon.management.DaemonNotifier import createNotifier
+from JobDaemon.management.DaemonNotifier import notifyDaemons
+from JobDaemon.management.Housekeeper import Housekeeper
+from JobDaemon.management.Housekeeper import processModels
+from JobDaemon.management.LogService import LogService
+from JobDaemon.management.RequestClaim import claimRequest
+from JobDaemon.management.RequestClaim import heartbeat
+from JobDaemon.management.RequestClaim import leaseDuration
+from JobDaemon.management.RequestScheduler import RequestScheduler
+from JobDaemon.management.RequestWorkerPool import RequestWorkerPool
 
-requestTypes = []
-
-if 'GeoProcessingEngine' in settings.INSTALLED_APPS:
-
-    from GeoProcessingEngine.models import GeoRequest
-    requestTypes.append('georequest')
-    
-if 'Loader' in settings.INSTALLED_APPS:
-    
-    from Loader.models import LoaderRequest
-    requestTypes.append('loaderrequest')
-    
 #-------------------------------------------------------------------------------
 # Command
 #
@@ -53,97 +44,113 @@ class Command(BaseCommand):
         self.maxProcesses = 10
         self.requestProcesses = -1
         
-        for jdp in models.JobDaemonProcess.objects.iterator():
-            
-            if not jdp.pidRunning():
-                
-                self.logger.info('Deleting job daemon process whose ' + 
-                                 'pid is not running.')
-                jdp.delete()
+        self.pollSeconds = 30
+        
+        if hasattr(settings, 'JOB_DAEMON_POLL_SECONDS'):
+            self.pollSeconds = settings.JOB_DAEMON_POLL_SECONDS
+
+        housekeepingSeconds = 60
+
+        if hasattr(settings, 'JOB_DAEMON_HOUSEKEEPING_SECONDS'):
+            housekeepingSeconds = settings.JOB_DAEMON_HOUSEKEEPING_SECONDS
+        
+        self.housekeeper = Housekeeper(housekeepingSeconds, self.logger)
+
+        # Remove the rows of processes that died while no daemon ran.
+        if reconcile(processModels, self.logger):
+            notifyDaemons()
+
+        # Long-lived workers run the requests.
+        maxRequestsPerWorker = 50
+        
+        if hasattr(settings, 'JOB_DAEMON_MAX_REQUESTS_PER_WORKER'):
+            maxRequestsPerWorker = settings.JOB_DAEMON_MAX_REQUESTS_PER_WORKER
+
+        if hasattr(settings, 'JOB_DAEMON_WORKERS'):
+            self.maxProcesses = settings.JOB_DAEMON_WORKERS
+
+        # One process writes every request's log.
+        self.logService = LogService(self.logger)
+
+        self.workerPool = RequestWorkerPool(self.maxProcesses,
+                                            maxRequestsPerWorker,
+                                            self.requestProcesses,
+                                            self.logger,
+                                            self.logService.queue)
+
+        self.scheduler = RequestScheduler(self.logger)
 
         # Indicate this JD is running.
         self.process = models.JobDaemonProcess()
         self.process.pid = os.getpid()
+        self.process.heartbeat = datetime.datetime.now()
         self.process.save()
         
+    #--------------------------------------------------------------------
+    # dispatch
+    #--------------------------------------------------------------------
+    def dispatch(self):
+
+        self.workerPool.maintain()
+        numToRun = self.workerPool.idleWorkers()
+        
+        if numToRun <= 0:
+            return
+
+        # Get the best numToRun requests that are PENDING.
+        pendingReqs = self.scheduler.choose(numToRun, 
+                                            self.workerPool.inFlight())
+
+        # Claim them, and hand those won to idle workers.
+        for reqId in pendingReqs:
+            
+            if claimRequest(reqId, self.process.pid):
+                self.workerPool.submit(reqId)
+            
     #--------------------------------------------------------------------
     # handle
     #--------------------------------------------------------------------
     def handle(self, **options):
     
+        #---
+        # Sleep until a notification arrives, instead of querying every
+        # second.  Polling continues at a slower rate in case a notification
+        # is lost.
+        #---
+        notifier = createNotifier(self.logger)
+
+        # Housekeeping runs in its own process, so it cannot delay dispatch.
+        self.housekeeper.start()
+        self.logService.start()
+
+        #---
+        # Beat often enough that leases cannot expire between beats, and at
+        # least as often as the daemon wakes.
+        #---
+        heartbeatSeconds = min(self.pollSeconds,
+                               leaseDuration().total_seconds() / 4)
+                               
+        nextHeartbeat = time.time()
+
         # Loop until <ctrl-c> is encountered.
         loop = True
-        loopsUntilHousekeeping = 10
-        loopNum = 0
         
         while loop:
         
             try:
-                # Count the RequestProcesses. 
-                numRunning = RequestProcess.objects.values('request').count()
-                numToRun = self.maxProcesses - numRunning
-
-                # Get numToRun requests that are PENDING.
-                pendingReqs = Request.objects.   \
-                              filter(started = False).  \
-                              order_by('created')[:numToRun]
-
-                for requestType in requestTypes:
-                    pendingReqs = pendingReqs.select_related(requestType)
+                if time.time() >= nextHeartbeat:
 
-                # Launch them.
-                for baseReq in pendingReqs:
-                    
-                    # Create a logger.
-                    reqLogger = logging.getLogger('request.' + str(baseReq.id))
-                    
-                    logFile = os.path.join(baseReq.destination.name,
-                                           baseReq.name + '.log')
-                    
-                    if not os.path.exists(logFile):
-                        
-                        open(logFile, 'a').close()
-                        handler = logging.FileHandler(logFile)
-                        handler.setLevel(logging.INFO)
-                        reqLogger.setLevel(logging.INFO)
-                        reqLogger.addHandler(handler)
-
-                    #---
-                    # Get the request object as its true type, instead of a
-                    # base Request object, so the derived methods are available.
-                    #
-                    # r = baseReq.georequest or baseReq.loaderrequest or baseReq
-                    #---
-                    request = baseReq
-                    
-                    for requestType in requestTypes:
-
-                        try:
-                            request = baseReq.__getattribute__(requestType)
-                            break
-
-                        except:
-                            pass
-                        
-                    # Create the runner.
-                    reqRnr = RequestProcessor(request, \
-                                              self.requestProcesses, \
-                                              reqLogger)
-                    
-                    thread = multiprocessing.Process(target = reqRnr)
-                    db.connections.close_all()
-                    thread.start()
+                    heartbeat(self.process, self.workerPool.inFlight())
+                    self.housekeeper.watch()
+                    self.logService.watch()
+                    nextHeartbeat = time.time() + heartbeatSeconds
                     
-                # Is it time to perform housekeeping?
-                loopNum += 1
-                
-                if loopNum >= loopsUntilHousekeeping:
+                self.dispatch()
                     
-                    loopNum = 0
-                    self.housekeeping()
-                
                 # Take a break.
-                time.sleep(1)
+                timeout = max(0, nextHeartbeat - time.time())
+
+                notifier.wait(timeout)
  
             except KeyboardInterrupt:
                 self.logger.info('\n<Ctrl-c> detected')
@@ -155,27 +162,9 @@ class Command(BaseCommand):
             except:
                 self.logger.info(traceback.format_exc())
                 
+        notifier.close()
+        self.housekeeper.stop()
+        self.workerPool.stop()
+        self.logService.stop()
         self.process.delete()
-   
-    #--------------------------------------------------------------------
-    # housekeeping
-    #--------------------------------------------------------------------
-    def housekeeping(self):
-        
-        rps = RequestProcess.objects.all()
-        
-        for rp in rps:
-            if not rp.pidRunning():
-                rp.delete()
-        
-        cps = ConstituentProcess.objects.all()
-        
-        for cp in cps:
-            if not cp.pidRunning():
-                cp.delete()
-
-        purgeZipFiles.purgeZipFiles()
-        purgeRequests.purgeRequests()
-        purgeRequestDirs.purgeRequestDirs()
-        killZombieJobDaemons.killZombieJobDaemons()
-            
+
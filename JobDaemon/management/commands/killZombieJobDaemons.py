@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 
 from ProcessingEngine.models import ConstituentProcess
 from ProcessingEngine.models import RequestProcess
+from ProcessingEngine.models import thisHost
 from JobDaemon.models import JobDaemonProcess
 
 #------------------------------------------------------------------------
@@ -26,6 +27,18 @@ class Command(BaseCommand):
 #--------------------------------------------------------------------
 def killZombieJobDaemons():
     
+    # Process rows from other hosts say nothing about this host's PIDs.
+    host = thisHost()
+    
+    jdpPids = set(JobDaemonProcess.objects.filter(host = host). \
+                                           values_list('pid', flat = True))
+
+    registered = jdpPids | \
+        set(RequestProcess.objects.filter(host = host). \
+                                   values_list('pid', flat = True)) | \
+        set(ConstituentProcess.objects.filter(host = host). \
+                                       values_list('pid', flat = True))
+
     # Get all the process IDs.
     pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
     
@@ -42,13 +55,14 @@ def killZombieJobDaemons():
                 # If this PID is unrepresented in ConstituentProcess
                 # or JobDaemonProcess, delete it.
                 #---
-                if JobDaemonProcess.objects.filter(pid = pid).exists():
-                    continue
-                
-                if RequestProcess.objects.filter(pid = pid).exists():
+                if int(pid) in registered:
                     continue
                 
-                if ConstituentProcess.objects.filter(pid = pid).exists():
+                # Idle request workers belong to a registered job daemon.
+                statLine = open(os.path.join('/proc', pid, 'stat')).read()
+                ppid = statLine.rsplit(')', 1)[1].split()[1]
+
+                if int(ppid) in jdpPids:
                     continue
                 
                 # Delete the PID.
@@ -62,5 +76,3 @@ def killZombieJobDaemons():
         
         except IOError: # proc has already terminated
             continue
-
-
@@ -21,17 +21,23 @@ class Command(BaseCommand):
         
 #--------------------------------------------------------------------
 # purgeReqDirs
+#
+# When maxDirs is given, only that many directories are removed, so one
+# call is bounded.  This returns the number removed.
 #--------------------------------------------------------------------
-def purgeRequestDirs():
+def purgeRequestDirs(maxDirs = None):
 
         workDir = settings.WORK_DIRECTORY
         onDisk  = glob.glob(workDir + '/*')
-        inDb    = Request.objects.values_list('destination', flat = True)
+        inDb    = set(Request.objects.values_list('destination', flat = True))
         notInDb = [d for d in onDisk if d not in inDb]
+        
+        if maxDirs:
+            notInDb = notInDb[:maxDirs]
 
         print 'Orphaned request directories to be deleted: ' + str(notInDb)
     
         for d in notInDb:
             shutil.rmtree(d)
     
-    
\ No newline at end of file
+        return len(notInDb)
@@ -7,6 +7,8 @@ from django.core.management.base import BaseCommand
 
 from ProcessingEngine.models import Request
 
+from JobDaemon.management.DaemonNotifier import notifyDaemons
+
 #-------------------------------------------------------------------------------
 # Command
 #-------------------------------------------------------------------------------
@@ -21,13 +23,30 @@ class Command(BaseCommand):
         
 #-------------------------------------------------------------------------------
 # purgeReqs
+#
+# When maxRequests is given, only that many of the oldest are purged, so one
+# call is bounded.  This returns the number purged.
 #-------------------------------------------------------------------------------
-def purgeRequests():
+def purgeRequests(maxRequests = None):
 
     timeThreshold = datetime.now() - \
                     timedelta(days = settings.DAYS_UNTIL_REQUEST_PURGE)
                     
     results = Request.objects.filter(created__lt = timeThreshold)
-    print 'Purging ' + str(results.count()) + ' request(s).'
+    
+    if maxRequests:
+        
+        ids = list(results.order_by('created'). \
+                           values_list('id', flat = True)[:maxRequests])
+
+        results = Request.objects.filter(id__in = ids)
+        
+    numPurged = results.count()
+    print 'Purging ' + str(numPurged) + ' request(s).'
     results.delete()
-    
\ No newline at end of file
+    
+    # Their request processes went with them, once.
+    if numPurged:
+        notifyDaemons()
+    
+    return numPurged
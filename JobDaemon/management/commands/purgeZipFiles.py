@@ -20,8 +20,11 @@ class Command(BaseCommand):
         
 #--------------------------------------------------------------------
 # purgeZipFiles
+#
+# When maxFiles is given, only that many files are removed, so one
+# call is bounded.  This returns the number removed.
 #--------------------------------------------------------------------
-def purgeZipFiles():
+def purgeZipFiles(maxFiles = None):
 
     zipDir     = settings.DOWNLOAD_DIR
     globStr    = 'WRANGLER-*.zip'
@@ -31,8 +34,15 @@ def purgeZipFiles():
 
     print 'Zip files considered for purge: ' + str(zips)
 
+    numRemoved = 0
+    
     for zipFile in zips:
+        
+        if maxFiles and numRemoved >= maxFiles:
+            break
+            
         if time.time() - os.path.getmtime(zipFile) > maxSeconds:
             os.remove(zipFile)
+            numRemoved += 1
 
-
+    return numRemoved
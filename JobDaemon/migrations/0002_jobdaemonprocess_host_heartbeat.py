@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('JobDaemon', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobdaemonprocess',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='jobdaemonprocess',
+            name='host',
+            field=models.CharField(blank=True, max_length=80, null=True),
+        ),
+    ]
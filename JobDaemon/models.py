@@ -6,6 +6,8 @@ import os
 
 from django.db import models
 
+from ProcessingEngine.models import thisHost
+
 #-------------------------------------------------------------------------------
 # BaseProcess
 #-------------------------------------------------------------------------------
@@ -13,6 +15,9 @@ class BaseProcess(models.Model):
 
     pid = models.IntegerField(null = True)
 
+    # PIDs are only meaningful on the host that owns them.
+    host = models.CharField(max_length = 80, null = True, blank = True)
+
     #---------------------------------------------------------------------------
     # pidRunning
     #---------------------------------------------------------------------------
@@ -42,6 +47,16 @@ class BaseProcess(models.Model):
 
         return True
 
+    #---------------------------------------------------------------------------
+    # save
+    #---------------------------------------------------------------------------
+    def save(self, *args, **kwargs):
+
+        if not self.host:
+            self.host = thisHost()
+
+        super(BaseProcess, self).save(*args, **kwargs)
+
     #---------------------------------------------------------------------------
     # Meta
     #---------------------------------------------------------------------------
@@ -53,10 +68,12 @@ class BaseProcess(models.Model):
 #------------------------------------------------------------------------
 class JobDaemonProcess(BaseProcess):
 
+    # Daemons update this regularly, so other hosts can tell they are alive.
+    heartbeat = models.DateTimeField(null = True, blank = True)
+
     #--------------------------------------------------------------------
     # Meta
     #--------------------------------------------------------------------
     class Meta:
         verbose_name        = 'Job Daemon Process'
         verbose_name_plural = 'Job Daemon Processes'
-
@@ -1,6 +1,206 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import datetime
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import override_settings
+
+from JobDaemon.management.RequestClaim import claimRequest
+from JobDaemon.management.RequestClaim import heartbeat
+from JobDaemon.management.RequestClaim import leaseDuration
+from JobDaemon.management.RequestClaim import recoverStaleClaims
+from JobDaemon.management.RequestScheduler import orderRequests
+from JobDaemon.management.RequestScheduler import RequestScheduler
+from JobDaemon.models import JobDaemonProcess
+from ProcessingEngine.models import EndPoint
+from ProcessingEngine.models import HIGH_PRIORITY
+from ProcessingEngine.models import LOW_PRIORITY
+from ProcessingEngine.models import NORMAL_PRIORITY
+from ProcessingEngine.models import Protocol
+from ProcessingEngine.models import Request
+from ProcessingEngine.models import RequestProcess
+
+#-------------------------------------------------------------------------------
+# FakeRequest
+#-------------------------------------------------------------------------------
+class FakeRequest(object):
+
+    def __init__(self, id, priority, submitter, ageSeconds, cost, now):
+
+        self.id            = id
+        self.priority      = priority
+        self.submitter     = submitter
+        self.created       = now - datetime.timedelta(seconds = ageSeconds)
+        self.estimatedCost = cost
+
+#-------------------------------------------------------------------------------
+# RequestSchedulerTestCase
+#-------------------------------------------------------------------------------
+class RequestSchedulerTestCase(SimpleTestCase):
+
+    now = datetime.datetime(2018, 1, 1, 12)
+
+    def order(self, candidates, running = {}, numToRun = 10):
+
+        chosen = orderRequests(candidates, running, self.now, 3600, 14400,
+                               numToRun)
+
+        return [c.id for c in chosen]
+
+    def testPriority(self):
+
+        reqs = [FakeRequest(1, LOW_PRIORITY,    'a', 60, 1, self.now),
+                FakeRequest(2, HIGH_PRIORITY,   'a', 60, 100, self.now),
+                FakeRequest(3, NORMAL_PRIORITY, 'a', 60, 1, self.now)]
+
+        self.assertEqual(self.order(reqs), [2, 3, 1])
+
+    def testShortestJobFirst(self):
+
+        reqs = [FakeRequest(1, NORMAL_PRIORITY, 'a', 60, 100, self.now),
+                FakeRequest(2, NORMAL_PRIORITY, 'b', 60, 2, self.now)]
+
+        self.assertEqual(self.order(reqs), [2, 1])
+
+    def testAging(self):
+
+        # Waiting 99 hours shrinks a cost of 100 to 1.
+        reqs = [FakeRequest(1, NORMAL_PRIORITY, 'a', 99 * 3600, 100, self.now),
+                FakeRequest(2, NORMAL_PRIORITY, 'a', 60, 2, self.now)]
+
+        self.assertEqual(self.order(reqs), [1, 2])
+
+    def testFairShare(self):
+
+        reqs = [FakeRequest(1, NORMAL_PRIORITY, 'a', 60, 1, self.now),
+                FakeRequest(2, NORMAL_PRIORITY, 'a', 60, 1, self.now),
+                FakeRequest(3, NORMAL_PRIORITY, 'b', 60, 50, self.now)]
+
+        self.assertEqual(self.order(reqs, {'a': 1}, 2), [3, 1])
+
+    @override_settings(REQUEST_COST_ESTIMATOR = None)
+    def testUnknownCost(self):
+
+        class FakeLogger(object):
+
+            warnings = []
+
+            def warning(self, msg):
+                self.warnings.append(msg)
+
+        request = FakeRequest(1, NORMAL_PRIORITY, 'a', 60, None, self.now)
+        request.save = lambda **kwargs: self.fail('Saved an unknown cost.')
+
+        scheduler = RequestScheduler(FakeLogger())
+        scheduler.estimator = lambda request: None
+        scheduler.estimate(request)
+
+        self.assertEqual(request.estimatedCost, None)
+        self.assertEqual(scheduler.logger.warnings, [])
+
+#-------------------------------------------------------------------------------
+# RequestClaimTestCase
+#-------------------------------------------------------------------------------
+class RequestClaimTestCase(TestCase):
+
+    def setUp(self):
+
+        self.requestDir = tempfile.mkdtemp()
+
+        protocol = Protocol.objects.create(name = 'test',
+                                           module = 'test',
+                                           className = 'Test')
+
+        self.endPoint = EndPoint.objects.create(protocol = protocol,
+                                                name = 'test',
+                                                url = 'http://localhost')
+
+    def tearDown(self):
+
+        shutil.rmtree(self.requestDir, True)
+
+    def makeRequest(self, **kwargs):
+
+        request = Request(name = 'test',
+                          endPoint = self.endPoint,
+                          destination = self.requestDir,
+                          **kwargs)
+
+        request.save()
+        return request
+
+    def testSecondClaimLoses(self):
+
+        request = self.makeRequest()
+
+        self.assertTrue(claimRequest(request.id, 1))
+        self.assertFalse(claimRequest(request.id, 2))
+        self.assertEqual(Request.objects.get(id = request.id).claimPid, 1)
+
+    def testExpiredLeaseReclaimed(self):
+
+        request = self.makeRequest()
+        self.assertTrue(claimRequest(request.id, 1))
+
+        Request.objects.filter(id = request.id). \
+            update(leaseExpires = datetime.datetime.now() -
+                                  datetime.timedelta(seconds = 1))
+
+        self.assertTrue(claimRequest(request.id, 2))
+        self.assertEqual(Request.objects.get(id = request.id).claimPid, 2)
+
+    def testHeartbeat(self):
+
+        daemon = JobDaemonProcess(pid = 1)
+        daemon.save()
+
+        mine   = self.makeRequest()
+        theirs = self.makeRequest()
+
+        self.assertTrue(claimRequest(mine.id, 1))
+        self.assertTrue(claimRequest(theirs.id, 2))
+
+        old = datetime.datetime(2000, 1, 1)
+        Request.objects.update(leaseExpires = old)
+
+        heartbeat(daemon, [mine.id, theirs.id])
+
+        self.assertTrue(Request.objects.get(id = mine.id).leaseExpires >
+                        datetime.datetime.now())
+
+        self.assertEqual(Request.objects.get(id = theirs.id).leaseExpires, old)
+
+        self.assertNotEqual(JobDaemonProcess.objects.get(id = daemon.id).
+                            heartbeat, None)
+
+    def testRecoverStaleClaims(self):
+
+        stale = datetime.datetime.now() - 2 * leaseDuration()
+
+        started = self.makeRequest(started = True,
+                                   claimHost = 'some.other.host',
+                                   claimPid = 5,
+                                   leaseExpires = stale)
+
+        unstarted = self.makeRequest(claimHost = 'some.other.host',
+                                     claimPid = 6,
+                                     leaseExpires = stale)
+
+        process         = RequestProcess()
+        process.request = started
+        process.pid     = 7
+        process.host    = 'some.other.host'
+        process.save()
+
+        recoverStaleClaims()
+
+        self.assertFalse(RequestProcess.objects.filter(id = process.id).
+                         exists())
 
-# Create your tests here.
+        unstarted = Request.objects.get(id = unstarted.id)
+        self.assertEqual(unstarted.claimHost, None)
+        self.assertEqual(unstarted.leaseExpires, None)
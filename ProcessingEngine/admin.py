@@ -7,6 +7,7 @@ from django.contrib import admin
 from ProcessingEngine.models import Constituent
 from ProcessingEngine.models import ConstituentProcess
 from ProcessingEngine.models import EndPoint
+from ProcessingEngine.models import ProcessSlot
 from ProcessingEngine.models import Request
 from ProcessingEngine.models import Protocol
 from ProcessingEngine.models import RequestProcess
@@ -32,5 +33,6 @@ admin.site.register(Constituent, ConstituentAdmin)
 admin.site.register(ConstituentProcess)
 admin.site.register(EndPoint)
 admin.site.register(Request, RequestAdmin)
+admin.site.register(ProcessSlot)
 admin.site.register(Protocol)
 admin.site.register(RequestProcess)
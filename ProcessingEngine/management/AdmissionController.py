@@ -0,0 +1,224 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+
+#-------------------------------------------------------------------------------
+# AdmissionController
+#
+# Slot pools bound how many constituents run, but not what they use.  A few
+# memory-heavy orthorectifications can exhaust a node's memory while slots
+# remain, and the kernel's OOM killer then fails whole requests.  This decides
+# whether the node can take one more constituent now, from its cost profile
+# and the node's live state in /proc.
+#
+#    - load:    the one-minute load average per CPU must be below
+#               maxLoadPerCpu.
+#    - memory:  available memory, less reserveGB and the memory of
+#               constituents admitted in the last rampSeconds, which have not
+#               allocated yet, must cover the profile's memoryGB.
+#    - I/O:     for I/O-heavy profiles, the fraction of CPU time in iowait
+#               since the previous check must be below maxIoWait.
+#
+# When nothing runs on the node, constituents are always admitted, so work
+# always progresses, even when something else is using the node.
+#
+# Profiles are dicts with optional 'memoryGB', 'cpus' and 'io' keys.  See
+# Retriever.stageProfiles.
+#-------------------------------------------------------------------------------
+class AdmissionController(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, logger = None):
+
+        self.enabled       = True
+        self.logger        = logger
+        self.maxIoWait     = 0.3
+        self.maxLoadPerCpu = 1.5
+        self.numCpus       = multiprocessing.cpu_count()
+        self.pollSeconds   = 5
+        self.rampSeconds   = 60
+        self.reserveGB     = 2.0
+        self.lastCpuTimes  = None
+        self.recent        = []     # [(admission time, memoryGB), ...]
+        self.saturated     = False
+
+        if hasattr(settings, 'ADMISSION_CONTROL'):
+            self.enabled = settings.ADMISSION_CONTROL
+
+        if hasattr(settings, 'ADMISSION_MAX_IOWAIT'):
+            self.maxIoWait = settings.ADMISSION_MAX_IOWAIT
+
+        if hasattr(settings, 'ADMISSION_MAX_LOAD_PER_CPU'):
+            self.maxLoadPerCpu = settings.ADMISSION_MAX_LOAD_PER_CPU
+
+        if hasattr(settings, 'ADMISSION_RAMP_SECONDS'):
+            self.rampSeconds = settings.ADMISSION_RAMP_SECONDS
+
+        if hasattr(settings, 'ADMISSION_RESERVE_GB'):
+            self.reserveGB = settings.ADMISSION_RESERVE_GB
+
+    #---------------------------------------------------------------------------
+    # admit
+    #
+    # This returns True when a constituent with the given profile may start.
+    # numRunning is the number of constituents, or slot weight, running on the
+    # node.
+    #---------------------------------------------------------------------------
+    def admit(self, profile, numRunning):
+
+        if not self.enabled:
+            return True
+
+        try:
+            reason = self.saturation(profile)
+
+        except (IOError, OSError, ValueError):
+
+            # Without /proc, admission control cannot work.
+            reason = None
+
+        if reason and numRunning > 0:
+
+            if self.logger and not self.saturated:
+
+                self.logger.info('Delaying constituents, because ' + reason +
+                                 '.')
+
+            self.saturated = True
+            return False
+
+        if self.logger and self.saturated:
+            self.logger.info('Resuming constituents.')
+
+        self.saturated = False
+        self.recent.append((time.time(), profile.get('memoryGB', 0)))
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # readCpuTimes
+    #
+    # This returns (iowait, total) jiffies from /proc/stat.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def readCpuTimes():
+
+        with open('/proc/stat') as f:
+
+            fields = [int(v) for v in f.readline().split()[1:]]
+
+        return fields[4], sum(fields)
+
+    #---------------------------------------------------------------------------
+    # readLoadAverage
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def readLoadAverage():
+
+        with open('/proc/loadavg') as f:
+            return float(f.read().split()[0])
+
+    #---------------------------------------------------------------------------
+    # readMemAvailableGB
+    #
+    # Older kernels lack MemAvailable, so it is estimated from free memory and
+    # the page cache.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def readMemAvailableGB():
+
+        memInfo = {}
+
+        with open('/proc/meminfo') as f:
+
+            for line in f:
+
+                key, value = line.split(':', 1)
+                memInfo[key] = int(value.split()[0])   # kB
+
+        if 'MemAvailable' in memInfo:
+            availableKb = memInfo['MemAvailable']
+
+        else:
+            availableKb = memInfo['MemFree'] + \
+                          memInfo.get('Buffers', 0) + \
+                          memInfo.get('Cached', 0)
+
+        return availableKb / (1024.0 * 1024.0)
+
+    #---------------------------------------------------------------------------
+    # readIoWait
+    #
+    # This returns the fraction of CPU time spent in iowait since the previous
+    # call, or zero on the first call.
+    #---------------------------------------------------------------------------
+    def readIoWait(self):
+
+        ioWait, total = self.readCpuTimes()
+        fraction = 0.0
+
+        if self.lastCpuTimes:
+
+            lastIoWait, lastTotal = self.lastCpuTimes
+
+            if total > lastTotal:
+
+                fraction = float(ioWait - lastIoWait) / \
+                           float(total - lastTotal)
+
+        self.lastCpuTimes = (ioWait, total)
+
+        return fraction
+
+    #---------------------------------------------------------------------------
+    # saturation
+    #
+    # This returns why the node cannot take a constituent with this profile, or
+    # None when it can.
+    #---------------------------------------------------------------------------
+    def saturation(self, profile):
+
+        # Recently admitted constituents may not have allocated memory yet.
+        now = time.time()
+
+        self.recent = [(t, gb) for t, gb in self.recent \
+                       if now - t < self.rampSeconds]
+
+        pendingGB = sum([gb for t, gb in self.recent])
+
+        # I/O is sampled every time, so the next interval is current.
+        ioWait = self.readIoWait()
+
+        loadPerCpu = self.readLoadAverage() / self.numCpus
+        neededCpus = profile.get('cpus', 1)
+
+        if loadPerCpu + float(neededCpus) / self.numCpus > \
+           self.maxLoadPerCpu:
+
+            return 'the load per CPU is ' + '%.2f' % loadPerCpu
+
+        availableGB = self.readMemAvailableGB() - pendingGB
+
+        if availableGB - self.reserveGB < profile.get('memoryGB', 0):
+
+            return 'only ' + '%.1f' % availableGB + \
+                   ' GB of memory is available'
+
+        if profile.get('io') and ioWait > self.maxIoWait:
+            return 'iowait is ' + '%.0f' % (ioWait * 100) + '%'
+
+        return None
+
+    #---------------------------------------------------------------------------
+    # wait
+    #
+    # This blocks until a constituent with this profile is admitted.
+    # numRunning is a function returning the number running on the node.
+    #---------------------------------------------------------------------------
+    def wait(self, profile, numRunning):
+
+        while not self.admit(profile, numRunning()):
+            time.sleep(self.pollSeconds)
@@ -1,9 +1,14 @@
 
+import json
 import logging
 import os
 import signal
+import time
 import traceback
 
+from django.conf import settings
+
+from ProcessingEngine.management.Retriever import Retriever
 from ProcessingEngine.models import Constituent
 from ProcessingEngine.models import ConstituentProcess
 
@@ -48,8 +53,13 @@ class ConstituentProcessor():
         self.parent = requestProcess
         
         # Create the Constituent.
-        self.constituent         = Constituent()
-        self.constituent.request = request
+        self.constituent                  = Constituent()
+        self.constituent.request          = request
+        self.constituent.inputFile        = oneConstituentAndFiles[0]
+        
+        self.constituent.constituentFiles = \
+            json.dumps(oneConstituentAndFiles[1], default = list)
+            
         self.constituent.save()
         
         self.retriever = retriever
@@ -159,7 +169,11 @@ class ConstituentProcessor():
             constituent.save(update_fields = ['started'])
         
             constituent.destination = \
-                retriever.retrieveOne(inputFile, constituentFiles)
+                ConstituentProcessor.retrieve(retriever,
+                                              inputFile,
+                                              constituentFiles,
+                                              constituent,
+                                              logger)
                                           
             constituent.save()
             success = True
@@ -177,4 +191,54 @@ class ConstituentProcessor():
         ConstituentProcessor.cleanUp(cProcess, constituent, logger)
 
         return success
+
+    #---------------------------------------------------------------------------
+    # retrieve
+    #
+    # This runs retrieveOne(), retrying failures the retriever classifies as
+    # transient or node failures.  Retries wait CONSTITUENT_RETRY_SECONDS,
+    # doubling each time, up to CONSTITUENT_MAX_RETRIES retries.  The count is
+    # recorded in the constituent.  Node failures are retried as they are,
+    # because the commands that failed avoid the failed node from then on.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def retrieve(retriever, inputFile, constituentFiles, constituent, logger):
+        
+        maxRetries   = 3
+        retrySeconds = 60
         
+        if hasattr(settings, 'CONSTITUENT_MAX_RETRIES'):
+            maxRetries = settings.CONSTITUENT_MAX_RETRIES
+            
+        if hasattr(settings, 'CONSTITUENT_RETRY_SECONDS'):
+            retrySeconds = settings.CONSTITUENT_RETRY_SECONDS
+            
+        while True:
+            
+            try:
+                return retriever.retrieveOne(inputFile, constituentFiles)
+                
+            except Exception as e:
+                
+                errorClass = retriever.classifyFailure(e)
+                
+                if errorClass == Retriever.PERMANENT or \
+                   constituent.retries >= maxRetries:
+                    raise
+                
+                delay = retrySeconds * 2 ** constituent.retries
+                constituent.retries += 1
+                constituent.save(update_fields = ['retries'])
+
+                if logger:
+
+                    logger.info(traceback.format_exc())
+
+                    logger.warning('Retrying ' + str(inputFile) + 
+                                   ' after a ' + 
+                                   errorClass + ' failure, in ' + 
+                                   str(delay) + ' seconds (retry ' + 
+                                   str(constituent.retries) + ' of ' + 
+                                   str(maxRetries) + ').')
+                                   
+                time.sleep(delay)
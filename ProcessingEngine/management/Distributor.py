@@ -1,5 +1,11 @@
 
 import multiprocessing
+import traceback
+
+from ProcessingEngine.management.AdmissionController \
+    import AdmissionController
+    
+from ProcessingEngine.management.SlotPool import SlotPool
 
 #-------------------------------------------------------------------------------
 # Distributor
@@ -34,6 +40,45 @@ class Distributor(object):
         # ConstituentProcessors.
         #---
         self.errorQueue = multiprocessing.Queue()
+
+        #---
+        # Every constituent holds slots in the host's constituent pool while it
+        # runs, so concurrent requests cannot oversubscribe the host.
+        #---
+        self.slotPool = SlotPool.constituentPool(self.logger)
+        self.slotWeight = 1
+        
+        #---
+        # Constituents only start when the node has the memory, CPU and I/O 
+        # capacity for them.
+        #---
+        self.admission = AdmissionController(self.logger)
+        self.costProfile = {}
+        
+        if cpList:
+            
+            self.slotWeight = cpList[0].retriever.getSlotWeight()
+            self.costProfile = cpList[0].retriever.getCostProfile()
+            
+    #---------------------------------------------------------------------------
+    # constituentDone
+    #
+    # Distributors call this in the distributing process as each constituent
+    # succeeds, so the retriever can aggregate it while others still run.
+    # Aggregation errors are logged, because aggregate() runs at the end, too.
+    #---------------------------------------------------------------------------
+    def constituentDone(self, cp, destination):
+        
+        if not destination:
+            return
+            
+        try:
+            cp.retriever.aggregateOne(cp.inputFile, destination)
+            
+        except Exception:
+            
+            if self.logger:
+                self.logger.info(traceback.format_exc())
             
     #---------------------------------------------------------------------------
     # distribute
@@ -52,7 +97,20 @@ class Distributor(object):
         if self.maxRunning == 1:
         
             for cp in self.constituentProcessors:
-                cp(self.errorQueue)
+                
+                self.admission.wait(self.costProfile, self.numRunningOnHost)
+                slot = self.slotPool.acquire(self.slotWeight)
+
+                try:
+                    cp(self.errorQueue)
+                    
+                finally:
+                    self.slotPool.release(slot)
+
+                if cp.constituent.destination:
+                    
+                    self.constituentDone(cp, 
+                                         cp.constituent.destination.name)
 
             success = self.errorQueue.empty()
             
@@ -68,3 +126,13 @@ class Distributor(object):
     def myDistribute(self):
         
         raise RuntimeError('This must be implemented by subclasses.')
+
+    #---------------------------------------------------------------------------
+    # numRunningOnHost
+    #
+    # This returns the slot weight held by every request's constituents on
+    # this host.
+    #---------------------------------------------------------------------------
+    def numRunningOnHost(self):
+        
+        return self.slotPool.capacity - self.slotPool.available()
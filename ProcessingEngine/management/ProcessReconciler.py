@@ -0,0 +1,114 @@
+import os
+
+from django.db.models import Q
+
+from ProcessingEngine.models import ConstituentProcess
+from ProcessingEngine.models import ProcessSlot
+from ProcessingEngine.models import RequestProcess
+from ProcessingEngine.models import thisHost
+
+try:
+    import psutil
+
+except ImportError:
+    psutil = None
+
+# The process models this app owns.  Other apps add theirs when reconciling.
+PROCESS_MODELS = [RequestProcess, ConstituentProcess, ProcessSlot]
+
+#-------------------------------------------------------------------------------
+# Process reconciliation
+#
+# Process rows record PIDs on the host that saved them.  When those processes
+# die without cleaning up, their rows must go.  Checking each row with
+# os.kill() costs a query and a system call per row, so instead this reads the
+# live PIDs once and each model's local rows with one query, and compares
+# them here.  Binding the live PIDs in a query would exceed SQLite's limit on
+# query parameters, so dead rows are deleted by ID, in batches of BATCH_SIZE.
+#
+# Models need integer pid and host fields.  Rows without a host predate host
+# tracking and are treated as local.
+#-------------------------------------------------------------------------------
+
+# IDs per delete, below SQLite's limit of 999 query parameters
+BATCH_SIZE = 500
+
+#-------------------------------------------------------------------------------
+# deadProcesses
+#
+# This returns the IDs of the model's local rows whose PIDs are not in pids.
+# Given a queryset of the model, only its rows are considered.
+#-------------------------------------------------------------------------------
+def deadProcesses(model, pids, queryset = None):
+
+    if queryset == None:
+        queryset = model.objects.all()
+
+    rows = queryset.filter(Q(host = thisHost()) | Q(host__isnull = True)). \
+                    filter(pid__isnull = False).                          \
+                    values_list('id', 'pid')
+
+    return [rowId for rowId, pid in rows if pid not in pids]
+
+#-------------------------------------------------------------------------------
+# deleteProcesses
+#
+# This deletes the model's rows with the given IDs, in batches, and returns
+# the number deleted.
+#-------------------------------------------------------------------------------
+def deleteProcesses(model, ids):
+
+    numDeleted = 0
+
+    for start in range(0, len(ids), BATCH_SIZE):
+
+        numDeleted += model.objects. \
+                          filter(id__in = ids[start:start + BATCH_SIZE]). \
+                          delete()[1].get(model._meta.label, 0)
+
+    return numDeleted
+
+#-------------------------------------------------------------------------------
+# livePids
+#-------------------------------------------------------------------------------
+def livePids():
+
+    if psutil:
+        return set(psutil.pids())
+
+    return set([int(pid) for pid in os.listdir('/proc') if pid.isdigit()])
+
+#-------------------------------------------------------------------------------
+# reconcile
+#
+# This deletes the dead rows of each model, at most limit per model, and
+# returns the number deleted.  Pass pids to reuse one scan for several calls.
+#-------------------------------------------------------------------------------
+def reconcile(models = PROCESS_MODELS, logger = None, limit = None,
+              pids = None):
+
+    if pids == None:
+        pids = livePids()
+
+    numDeleted = 0
+
+    for model in models:
+
+        dead = deadProcesses(model, pids)
+
+        if limit:
+            dead = dead[:limit]
+
+        numDead = deleteProcesses(model, dead)
+
+        if numDead:
+
+            numDeleted += numDead
+
+            if logger:
+
+                logger.info('Deleted ' + str(numDead) + ' ' +
+                            model._meta.verbose_name_plural.lower() +
+                            ' whose PIDs are not running.')
+
+    return numDeleted
@@ -0,0 +1,404 @@
+import multiprocessing
+import os
+import Queue
+import signal
+import time
+import traceback
+
+from django import db
+
+from ProcessingEngine.management.ConstituentProcessor \
+    import ConstituentProcessor
+
+from ProcessingEngine.management.Distributor import Distributor
+
+#-------------------------------------------------------------------------------
+# ConstituentFuture
+#
+# This represents one constituent running in its own process.  When it
+# finishes, result() returns a dict:
+#
+#    {'constituent': Constituent ID,
+#     'success':     True when the constituent succeeded,
+#     'destination': the output file, or None,
+#     'duration':    seconds from launch to completion,
+#     'exitcode':    the process's exit code,
+#     'pid':         the process ID,
+#     'cancelled':   True when the constituent was cancelled}
+#-------------------------------------------------------------------------------
+class ConstituentFuture(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, constituentProcessor, slot):
+
+        self.callbacks            = []
+        self.constituentProcessor = constituentProcessor
+        self.process              = None
+        self.slot                 = slot
+        self.startTime            = None
+        self._result              = None
+
+    #---------------------------------------------------------------------------
+    # addDoneCallback
+    #
+    # Callbacks run in the distributing process, with this future, when it
+    # finishes.
+    #---------------------------------------------------------------------------
+    def addDoneCallback(self, callback):
+
+        if self.done():
+            callback(self)
+
+        else:
+            self.callbacks.append(callback)
+
+    #---------------------------------------------------------------------------
+    # cancel
+    #---------------------------------------------------------------------------
+    def cancel(self):
+
+        if self.done():
+            return False
+
+        if self.process and self.process.is_alive():
+            self.process.terminate()
+
+        self.finish({'success': False, 'cancelled': True})
+
+        return True
+
+    #---------------------------------------------------------------------------
+    # done
+    #---------------------------------------------------------------------------
+    def done(self):
+
+        return self._result != None
+
+    #---------------------------------------------------------------------------
+    # finish
+    #---------------------------------------------------------------------------
+    def finish(self, result):
+
+        if self.done():
+            return
+
+        if self.process:
+
+            self.process.join(5)
+            result.setdefault('exitcode', self.process.exitcode)
+            result.setdefault('pid', self.process.pid)
+
+        cp = self.constituentProcessor
+        result.setdefault('constituent', cp.constituent.id)
+        result.setdefault('destination', None)
+        result.setdefault('cancelled', False)
+        result['duration'] = time.time() - self.startTime \
+                             if self.startTime else 0.0
+
+        self._result = result
+
+        for callback in self.callbacks:
+            callback(self)
+
+    #---------------------------------------------------------------------------
+    # result
+    #---------------------------------------------------------------------------
+    def result(self):
+
+        return self._result
+
+    #---------------------------------------------------------------------------
+    # start
+    #---------------------------------------------------------------------------
+    def start(self, resultQueue):
+
+        self.process = multiprocessing.Process(target = runConstituent,
+                                               args = (self.
+                                                       constituentProcessor,
+                                                       resultQueue))
+
+        # The child must not share the parent's database connections.
+        db.connections.close_all()
+        self.startTime = time.time()
+        self.process.start()
+
+#-------------------------------------------------------------------------------
+# PythonFuturesDistributor
+#
+# This runs each constituent in its own process, like
+# PythonMultiprocessingDistributor, but is driven by completions instead of
+# polling.  Children post their results to a queue, and the distributor blocks
+# on it, so the next constituent starts the moment one finishes.  Children
+# that die without posting, like those the OOM killer takes, are found when the
+# queue is quiet for SWEEP_SECONDS.
+#
+# Each constituent's result is available through its ConstituentFuture, and
+# callbacks added with addDoneCallback() run as each finishes.  cancel() stops
+# the running constituents and those not yet started.
+#-------------------------------------------------------------------------------
+class PythonFuturesDistributor(Distributor):
+
+    # Seconds without results before checking for children that died.
+    SWEEP_SECONDS = 30
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cpList, maxRunning, logger):
+
+        super(PythonFuturesDistributor, self).__init__(cpList,
+                                                       maxRunning,
+                                                       logger)
+
+        self.callbacks   = []
+        self.cancelled   = False
+        self.futures     = []
+        self.resultQueue = multiprocessing.Queue()
+        self.running     = {}    # constituent ID -> ConstituentFuture
+
+    #---------------------------------------------------------------------------
+    # addDoneCallback
+    #
+    # The callback receives each ConstituentFuture as it finishes.
+    #---------------------------------------------------------------------------
+    def addDoneCallback(self, callback):
+
+        self.callbacks.append(callback)
+
+    #---------------------------------------------------------------------------
+    # awaitCompletion
+    #
+    # This waits up to timeout seconds for a result, then finishes every
+    # future whose result arrived or whose process died.
+    #---------------------------------------------------------------------------
+    def awaitCompletion(self, timeout):
+
+        try:
+            self.collect(self.resultQueue.get(True, timeout))
+
+        except Queue.Empty:
+
+            # Drain results that arrived, then look for dead children.
+            self.collectAll()
+
+            for future in self.running.values():
+
+                if not future.process.is_alive():
+
+                    # It may have posted its result while dying.
+                    self.collectAll()
+
+                    if not future.done():
+
+                        self.finished(future, {'success': False})
+
+                        if self.logger:
+
+                            self.logger.warning('Constituent ' +
+                                str(future.constituentProcessor.constituent.id)
+                                + ' exited without reporting, with code ' +
+                                str(future.process.exitcode))
+
+            return
+
+        self.collectAll()
+
+    #---------------------------------------------------------------------------
+    # cancel
+    #---------------------------------------------------------------------------
+    def cancel(self):
+
+        self.cancelled = True
+
+        for future in self.running.values():
+
+            if self.logger:
+
+                self.logger.info('Cancelling constituent ' +
+                        str(future.constituentProcessor.constituent.id))
+
+            future.cancel()
+            self.release(future)
+
+        self.running = {}
+
+    #---------------------------------------------------------------------------
+    # collect
+    #---------------------------------------------------------------------------
+    def collect(self, result):
+
+        future = self.running.get(result['constituent'])
+
+        if future:
+            self.finished(future, result)
+
+    #---------------------------------------------------------------------------
+    # collectAll
+    #---------------------------------------------------------------------------
+    def collectAll(self):
+
+        try:
+            while True:
+                self.collect(self.resultQueue.get_nowait())
+
+        except Queue.Empty:
+            pass
+
+    #---------------------------------------------------------------------------
+    # finished
+    #---------------------------------------------------------------------------
+    def finished(self, future, result):
+
+        future.finish(result)
+        self.release(future)
+        del self.running[future.constituentProcessor.constituent.id]
+
+        r = future.result()
+
+        if self.logger:
+
+            self.logger.info('Constituent ' + str(r['constituent']) +
+                             (' succeeded' if r['success'] else ' failed') +
+                             ' in ' + '%.1f' % r['duration'] + ' seconds.')
+
+        if r['success']:
+            self.constituentDone(future.constituentProcessor, r['destination'])
+
+        for callback in self.callbacks:
+
+            try:
+                callback(future)
+
+            except Exception:
+
+                if self.logger:
+                    self.logger.info(traceback.format_exc())
+
+    #---------------------------------------------------------------------------
+    # launch
+    #
+    # This starts as many pending constituents as the limits allow, and
+    # returns True when one was held back by a slot or admission.
+    #---------------------------------------------------------------------------
+    def launch(self, pending):
+
+        while pending and len(self.running) < self.maxRunning:
+
+            if not self.admission.admit(self.costProfile,
+                                        self.numRunningOnHost()):
+                return True
+
+            slot = self.slotPool.tryAcquire(self.slotWeight)
+
+            if not slot:
+                return True
+
+            future = ConstituentFuture(pending.pop(), slot)
+            self.futures.append(future)
+            self.running[future.constituentProcessor.constituent.id] = future
+            future.start(self.resultQueue)
+
+        return False
+
+    #---------------------------------------------------------------------------
+    # myDistribute
+    #---------------------------------------------------------------------------
+    def myDistribute(self):
+
+        pending = list(self.constituentProcessors)
+
+        try:
+            while (pending or self.running) and not self.cancelled:
+
+                heldBack = self.launch(pending)
+
+                #---
+                # Completions of other requests' constituents are not
+                # signalled, so retry held-back launches at the pool's poll
+                # rate.
+                #---
+                if heldBack:
+                    timeout = self.slotPool.pollSeconds
+
+                else:
+                    timeout = PythonFuturesDistributor.SWEEP_SECONDS
+
+                if self.running:
+                    self.awaitCompletion(timeout)
+
+                else:
+                    time.sleep(timeout)
+
+        except Exception as e:
+
+            if self.logger:
+                self.logger.info(traceback.format_exc())
+
+            self.cancel()
+            raise e
+
+        return not self.cancelled and \
+               not [f for f in self.futures if not f.result()['success']]
+
+    #---------------------------------------------------------------------------
+    # release
+    #---------------------------------------------------------------------------
+    def release(self, future):
+
+        if future.slot:
+
+            self.slotPool.release(future.slot)
+            future.slot = None
+
+    #---------------------------------------------------------------------------
+    # results
+    #
+    # This returns the results of the constituents that finished.
+    #---------------------------------------------------------------------------
+    def results(self):
+
+        return [f.result() for f in self.futures if f.done()]
+
+#-------------------------------------------------------------------------------
+# runConstituent
+#
+# This runs in the child process.  Cancelling terminates it, which does not
+# reach the commands it runs, because they lead their own process groups, so
+# its retriever cancels them before it exits.
+#-------------------------------------------------------------------------------
+def runConstituent(constituentProcessor, resultQueue):
+
+    cp = constituentProcessor
+
+    signal.signal(signal.SIGTERM, 
+                  lambda signum, frame: stopConstituent(cp.retriever))
+
+    success = ConstituentProcessor.process(cp.retriever,
+                                           cp.inputFile,
+                                           cp.constituentFiles,
+                                           cp.constituent,
+                                           cp.parent,
+                                           cp.logger)
+
+    destination = cp.constituent.destination.name \
+                  if cp.constituent.destination else None
+
+    resultQueue.put({'constituent': cp.constituent.id,
+                     'success': success,
+                     'destination': destination,
+                     'pid': os.getpid()})
+
+#-------------------------------------------------------------------------------
+# stopConstituent
+#
+# This is the child process's SIGTERM handler.
+#-------------------------------------------------------------------------------
+def stopConstituent(retriever):
+
+    try:
+        retriever.cancel()
+
+    finally:
+        os._exit(1)
@@ -1,3 +1,4 @@
+import traceback
 
 from ProcessingEngine.management.ConstituentProcessor \
     import ConstituentProcessor
@@ -47,6 +48,10 @@ class PythonMapDistributor(Distributor):
                    parentArgs,
                    loggerArgs]
 
+        # Map runs the constituents one at a time, so it needs one slot.
+        self.admission.wait(self.costProfile, self.numRunningOnHost)
+        slot = self.slotPool.acquire(self.slotWeight)
+
         try:
             map(ConstituentProcessor.process, *mapArgs)
 
@@ -54,13 +59,16 @@ class PythonMapDistributor(Distributor):
 
             msg = traceback.format_exc()
 
-            if logger:
-                logger.info(msg)
+            if self.logger:
+                self.logger.info(msg)
             
             else:
                 print msg
                 
             return False
         
+        finally:
+            self.slotPool.release(slot)
+        
         return True
             
\ No newline at end of file
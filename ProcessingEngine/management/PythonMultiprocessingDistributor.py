@@ -35,21 +35,17 @@ class PythonMultiprocessingDistributor(Distributor):
     def processQueue(self):
         
         try:
-            threads = []
+            threads = {}    # thread -> slot
 
             while len(self.constituentProcessors) > 0:
 
-                # Track when threads finish.
-                numRunning = 0
-
-                for thread in threads:
+                # Track when threads finish, and release their slots.
+                for thread in threads.keys():
                     
-                    if thread.is_alive():
-                        
-                        numRunning += 1
-                        
-                    else:
-                        threads.remove(thread)
+                    if not thread.is_alive():
+                        self.slotPool.release(threads.pop(thread))
+
+                numRunning = len(threads)
 
                 if self.logger:
                     self.logger.info(str(numRunning) + \
@@ -63,13 +59,26 @@ class PythonMultiprocessingDistributor(Distributor):
                     if len(self.constituentProcessors) < 1:
                         break
                         
+                    #---
+                    # Do not block waiting for a slot, because this loop must
+                    # continue to release the slots of finished threads.
+                    #---
+                    if not self.admission.admit(self.costProfile,
+                                                self.numRunningOnHost()):
+                        break
+                        
+                    slot = self.slotPool.tryAcquire(self.slotWeight)
+                    
+                    if not slot:
+                        break
+                        
                     constituentProcessor = self.constituentProcessors.pop()
                     
                     thread = multiprocessing.\
                              Process(target=constituentProcessor,
                                      args=(self.errorQueue,))
                     
-                    threads.append(thread)
+                    threads[thread] = slot
                     db.connections.close_all()
                     thread.start()
 
@@ -80,10 +89,15 @@ class PythonMultiprocessingDistributor(Distributor):
             if self.logger:
                 self.logger.info(traceback.format_exc())
 
+            for slot in threads.values():
+                self.slotPool.release(slot)
+
             raise e
 
         # Await the final threads.
-        for thread in threads:
+        for thread, slot in threads.items():
+            
             thread.join()
+            self.slotPool.release(slot)
         
         return self.errorQueue.empty()
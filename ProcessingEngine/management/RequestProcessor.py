@@ -9,11 +9,6 @@ import traceback
 # from django import db
 from django.conf import settings
 
-from ProcessingEngine.management.PythonMultiprocessingDistributor \
-    import PythonMultiprocessingDistributor
-
-from ProcessingEngine.management.PythonMapDistributor import PythonMapDistributor
-
 from ProcessingEngine.management.ConstituentProcessor import ConstituentProcessor
 from ProcessingEngine.models import Constituent
 from ProcessingEngine.models import RequestProcess
@@ -36,6 +31,7 @@ class RequestProcessor():
         self.logger                = logger
         self.numProcs              = numProcs
         self.constituentProcessors = []
+        self.distributor           = None
         self.process               = None
         self.request               = request
         self.retriever             = None
@@ -110,25 +106,8 @@ class RequestProcessor():
             # at least one fails.  These notifications are only informative.
             # The logs contain the details.
             #---
-            distributor = None
-        
-            if hasattr(settings, 'DISTRIBUTOR'):
-
-                if settings.DISTRIBUTOR == 'PythonMapDistributor':
-                
-                    distributor = \
-                        PythonMapDistributor(self.constituentProcessors,
-                                             maxRunning,
-                                             self.logger)
-
-            if not distributor:
-
-                distributor = \
-                    PythonMultiprocessingDistributor(self.constituentProcessors,
-                                                     maxRunning,
-                                                     self.logger)
-
-            success = distributor.distribute()
+            self.distributor = self.chooseDistributor(maxRunning)
+            success = self.distributor.distribute()
             
             if not success:
                 
@@ -165,6 +144,8 @@ class RequestProcessor():
             self.cleanUp()
             raise e
             
+        self.retriever.finish()
+
         # Register that this instance is not running.
         if self.logger:
             self.logger.info('Completed request process for ' + 
@@ -172,6 +153,38 @@ class RequestProcessor():
         
         self.process.delete()
 
+    #---------------------------------------------------------------------------
+    # chooseDistributor
+    #
+    # settings.DISTRIBUTOR names a distributor class in ProcessingEngine, like
+    # PythonFuturesDistributor, or gives the full path to one elsewhere, like
+    # package.module.ClassName.  Retrievers that are subprocessBound use
+    # settings.THREAD_DISTRIBUTOR, ThreadPoolDistributor by default, instead.
+    #---------------------------------------------------------------------------
+    def chooseDistributor(self, maxRunning):
+        
+        name = 'PythonMultiprocessingDistributor'
+        
+        if hasattr(settings, 'DISTRIBUTOR'):
+            name = settings.DISTRIBUTOR
+            
+        if self.retriever.subprocessBound:
+            
+            name = 'ThreadPoolDistributor'
+            
+            if hasattr(settings, 'THREAD_DISTRIBUTOR'):
+                name = settings.THREAD_DISTRIBUTOR
+            
+        if '.' in name:
+            modName, className = name.rsplit('.', 1)
+            
+        else:
+            modName, className = 'ProcessingEngine.management.' + name, name
+            
+        mod = importlib.import_module(modName)
+        classObj = getattr(mod, className)
+        return classObj(self.constituentProcessors, maxRunning, self.logger)
+            
     #---------------------------------------------------------------------------
     # chooseRetriever
     #---------------------------------------------------------------------------
@@ -197,6 +210,15 @@ class RequestProcessor():
             
         if self.process and self.process.id != None:
 
+            # Stop constituents that are still running.
+            if self.distributor and hasattr(self.distributor, 'cancel'):
+                self.distributor.cancel()
+                
+            if self.retriever:
+
+                self.retriever.cancel()
+                self.retriever.finish()
+                
             for cProc in self.constituentProcessors:
 
                 cProc.cleanUp(cProc.constituentProcess, 
@@ -1,4 +1,8 @@
 
+from django.conf import settings
+
+from ProcessingEngine.management.SlotPool import SlotPool
+from ProcessingEngine.management.TaskGraph import TaskGraph
 from ProcessingEngine.models import Request
 
 #-------------------------------------------------------------------------------
@@ -43,13 +47,90 @@ from ProcessingEngine.models import Request
 #      create a final output file.  End Points can produce multiple
 #      Constituents, which means there could be multiple final output files.
 #
+#    - aggregateOne():  optional
+#      Distributors call this in the request's process as each constituent
+#      succeeds, with its name and output file.  Use it to combine outputs
+#      incrementally, so partial products are usable early, and aggregate()
+#      has little left to do.
+#
 #    - aggregate():  optional
 #      Use this method when constituents must be combined to form the final
 #      product of a retriever.
 #
+#    - speculate():  optional
+#      Distributors that race a duplicate of a slow constituent against it
+#      call this on the duplicate's retriever, which works in a scratch copy of
+#      the request directory, before its retrieveOne().  Stop waiting for work
+#      shared with other requests here, because the original may be the one
+#      doing it.
+#
+#    - cancel():  optional
+#      RequestProcessor calls this when it cleans up a failed or interrupted
+#      request, after cancelling its distributor.  Distributors running
+#      constituents in child processes call it in each child they cancel.
+#      Stop the request's running external programs here, so they do not
+#      outlive it.
+#
+#    - finish():  optional
+#      RequestProcessor calls this when the request ends, whether it succeeded
+#      or not.  Persistent request workers run many requests, so forget state
+#      kept for this request here.
+#
+#    - classifyFailure():  optional
+#      When retrieveOne() raises, this says whether retrying could help:
+#      TRANSIENT failures are retried, NODE failures are retried after the
+#      failed node is avoided, and PERMANENT failures are not retried.  By
+#      default, exceptions with an errorClass attribute, like
+#      SystemCommandError, are classified by it, and others are PERMANENT.
+#
+# Class attributes:
+#
+#    - slotWeight:  how many slots of the host's constituent SlotPool one
+#      constituent holds while it runs.  Use larger weights for retrievers
+#      whose constituents are heavier.  settings.CONSTITUENT_SLOT_WEIGHTS,
+#      keyed by class name, overrides this.
+#
+#    - stageProfiles:  the resources each stage of a constituent needs, as
+#      {stageName: {'memoryGB': 8, 'cpus': 2, 'io': True}, ...}.  Keys are
+#      optional.  Distributors admit a constituent only when the node can
+#      supply its heaviest stage.  settings.CONSTITUENT_STAGE_PROFILES, keyed
+#      by class name, overrides this.
+#
+#    - stageLimits:  how many of a stage may run at once, across every
+#      constituent, request and host, as {stageName: number}.  Use this for a
+#      step only one machine or license can run, like {'maiac': 1}, instead of
+#      serializing whole constituents.  Stages limited here hold a slot of a
+#      global SlotPool named for the stage while they run, whether they are
+#      TaskGraph tasks of that kind or calls through runStage().  Retrievers
+#      declaring the same stage share its pool.
+#      settings.CONSTITUENT_STAGE_LIMITS, keyed by class name, overrides this.
+#
+#    - subprocessBound:  set this True when constituents spend their time
+#      waiting for external programs, so RequestProcessor runs them in
+#      threads with ThreadPoolDistributor, instead of forking processes.
+#      Constituents then share the retriever, so they must lock any state they
+#      change.
+#
+#    - taskThreads, taskLimits:  retrievers that run a constituent's stages
+#      as a TaskGraph, from createTaskGraph(), run up to taskThreads stages at
+#      once.  taskLimits caps the stages of one kind, as {kind: number}, in
+#      one constituent.
+#
 #-------------------------------------------------------------------------------
 class Retriever(object):
 
+    # Failure classes
+    NODE      = 'node'
+    PERMANENT = 'permanent'
+    TRANSIENT = 'transient'
+    
+    slotWeight = 1
+    stageLimits = {}
+    stageProfiles = {}
+    subprocessBound = False
+    taskLimits = {}
+    taskThreads = 1
+
     #---------------------------------------------------------------------------
     # __init__ 
     #---------------------------------------------------------------------------
@@ -68,6 +149,120 @@ class Retriever(object):
     def aggregate(self, outFiles):
         pass
                    
+    #---------------------------------------------------------------------------
+    # aggregateOne
+    #---------------------------------------------------------------------------
+    def aggregateOne(self, constituentFileName, outFile):
+        pass
+                   
+    #---------------------------------------------------------------------------
+    # cancel
+    #---------------------------------------------------------------------------
+    def cancel(self):
+        pass
+                   
+    #---------------------------------------------------------------------------
+    # classifyFailure
+    #---------------------------------------------------------------------------
+    def classifyFailure(self, exception):
+        
+        return getattr(exception, 'errorClass', Retriever.PERMANENT)
+        
+    #---------------------------------------------------------------------------
+    # createTaskGraph
+    #---------------------------------------------------------------------------
+    def createTaskGraph(self):
+
+        graph = TaskGraph(self.taskThreads, self.logger)
+        
+        for kind, maxRunning in self.taskLimits.items():
+            graph.setLimit(kind, maxRunning)
+            
+        for kind in self.getStageLimits():
+            graph.setPool(kind, self.getStagePool(kind))
+            
+        return graph
+        
+    #---------------------------------------------------------------------------
+    # finish
+    #---------------------------------------------------------------------------
+    def finish(self):
+        pass
+                   
+    #---------------------------------------------------------------------------
+    # getCostProfile
+    #
+    # This combines the stage profiles into one for the whole constituent: the
+    # most memory and CPUs of any stage, and I/O-heavy if any stage is.
+    #---------------------------------------------------------------------------
+    def getCostProfile(self):
+
+        stageProfiles = self.stageProfiles
+        
+        if hasattr(settings, 'CONSTITUENT_STAGE_PROFILES'):
+
+            className = self.__class__.__name__
+
+            if className in settings.CONSTITUENT_STAGE_PROFILES:
+                stageProfiles = settings.CONSTITUENT_STAGE_PROFILES[className]
+
+        profile = {'memoryGB': 0, 'cpus': 1, 'io': False}
+        
+        for stageProfile in stageProfiles.values():
+            
+            profile['memoryGB'] = max(profile['memoryGB'], 
+                                      stageProfile.get('memoryGB', 0))
+                                      
+            profile['cpus'] = max(profile['cpus'], stageProfile.get('cpus', 1))
+            profile['io'] = profile['io'] or stageProfile.get('io', False)
+            
+        return profile
+        
+    #---------------------------------------------------------------------------
+    # getSlotWeight
+    #---------------------------------------------------------------------------
+    def getSlotWeight(self):
+
+        if hasattr(settings, 'CONSTITUENT_SLOT_WEIGHTS'):
+
+            className = self.__class__.__name__
+
+            if className in settings.CONSTITUENT_SLOT_WEIGHTS:
+                return settings.CONSTITUENT_SLOT_WEIGHTS[className]
+
+        return self.slotWeight
+
+    #---------------------------------------------------------------------------
+    # getStageLimits
+    #---------------------------------------------------------------------------
+    def getStageLimits(self):
+
+        if hasattr(settings, 'CONSTITUENT_STAGE_LIMITS'):
+
+            className = self.__class__.__name__
+
+            if className in settings.CONSTITUENT_STAGE_LIMITS:
+                return settings.CONSTITUENT_STAGE_LIMITS[className]
+
+        return self.stageLimits
+
+    #---------------------------------------------------------------------------
+    # getStagePool
+    #
+    # This returns the global SlotPool limiting a stage, or None.
+    #---------------------------------------------------------------------------
+    def getStagePool(self, stageName):
+
+        stageLimits = self.getStageLimits()
+        
+        if stageName not in stageLimits:
+            return None
+            
+        return SlotPool('stage-' + stageName, 
+                        stageLimits[stageName], 
+                        False, 
+                        self.logger)
+        
     #---------------------------------------------------------------------------
     # listConstituents
     #
@@ -112,4 +307,28 @@ class Retriever(object):
     def retrieveOne(self, constituentFileName, fileList):
          raise RuntimeError('This method must be overridden by a subclass.')
         
+    #---------------------------------------------------------------------------
+    # runStage
+    #
+    # This calls func(*args) as the named stage, holding a slot of its pool
+    # when stageLimits limits it.
+    #---------------------------------------------------------------------------
+    def runStage(self, stageName, func, *args):
 
+        pool = self.getStagePool(stageName)
+        slot = pool.acquire() if pool else None
+        
+        try:
+            return func(*args)
+            
+        finally:
+            
+            if slot:
+                pool.release(slot)
+            
+    #---------------------------------------------------------------------------
+    # speculate
+    #---------------------------------------------------------------------------
+    def speculate(self):
+        pass
+        
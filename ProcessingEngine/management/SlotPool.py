@@ -0,0 +1,224 @@
+import datetime
+import os
+import threading
+import time
+
+from django import db
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from ProcessingEngine.management.ProcessReconciler import deadProcesses
+from ProcessingEngine.management.ProcessReconciler import deleteProcesses
+from ProcessingEngine.management.ProcessReconciler import livePids
+from ProcessingEngine.models import ProcessSlot
+from ProcessingEngine.models import SlotPoolLock
+from ProcessingEngine.models import thisHost
+
+#-------------------------------------------------------------------------------
+# SlotPool
+#
+# This is a weighted counting semaphore kept in the database, so every process
+# sharing the database can use it.  A pool has a name and a capacity.  Holders
+# acquire a weight, and the sum of held weights never exceeds the capacity.
+#
+# Per-host pools limit work on one machine.  Their slots are keyed by host, so
+# each machine has its own capacity.  Global pools limit work everywhere.
+#
+# Slots of processes that died on this host are reclaimed when the pool is
+# full.  A global pool's holder may be on a host that dies, so its slots are
+# leases, which a thread renews every third of settings.SLOT_LEASE_SECONDS
+# until they are released.  Expired slots are reclaimed, too.
+#-------------------------------------------------------------------------------
+class SlotPool(object):
+
+    # The constituent pool shared by all requests on a host.
+    CONSTITUENT_POOL = 'constituents'
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, name, capacity, perHost = True, logger = None,
+                 pollSeconds = 2):
+
+        self.capacity     = capacity
+        self.leaseSeconds = 300
+        self.logger       = logger
+        self.name         = name + '@' + thisHost() if perHost else name
+        self.perHost      = perHost
+        self.pollSeconds  = pollSeconds
+
+        if hasattr(settings, 'SLOT_LEASE_SECONDS'):
+            self.leaseSeconds = settings.SLOT_LEASE_SECONDS
+
+        SlotPoolLock.objects.get_or_create(pool = self.name)
+
+    #---------------------------------------------------------------------------
+    # acquire
+    #
+    # This blocks until weight is available, and returns the ProcessSlot to
+    # pass to release().  It returns None when timeout seconds pass first.
+    #---------------------------------------------------------------------------
+    def acquire(self, weight = 1, timeout = None):
+
+        startTime = time.time()
+        logged = False
+
+        while True:
+
+            slot = self.tryAcquire(weight)
+
+            if slot:
+                return slot
+
+            if timeout != None and time.time() - startTime >= timeout:
+                return None
+
+            if self.logger and not logged:
+
+                logged = True
+
+                self.logger.info('Waiting for ' + str(weight) +
+                                 ' slot(s) in ' + self.name)
+
+            time.sleep(self.pollSeconds)
+
+    #---------------------------------------------------------------------------
+    # available
+    #---------------------------------------------------------------------------
+    def available(self):
+
+        return self.capacity - self._used()
+
+    #---------------------------------------------------------------------------
+    # constituentPool
+    #
+    # This is the pool every Distributor acquires from before launching a
+    # ConstituentProcessor.
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def constituentPool(logger = None):
+
+        capacity = 10
+
+        if hasattr(settings, 'CONSTITUENT_SLOTS'):
+            capacity = settings.CONSTITUENT_SLOTS
+
+        return SlotPool(SlotPool.CONSTITUENT_POOL, capacity, True, logger)
+
+    #---------------------------------------------------------------------------
+    # _reclaim
+    #---------------------------------------------------------------------------
+    def _reclaim(self):
+
+        dead = deadProcesses(ProcessSlot,
+                             livePids(),
+                             ProcessSlot.objects.filter(pool = self.name))
+        
+        if dead:
+
+            if self.logger:
+
+                self.logger.info('Reclaiming ' + str(len(dead)) + 
+                                 ' slot(s) of dead processes in ' + self.name)
+
+            deleteProcesses(ProcessSlot, dead)
+
+        numExpired = ProcessSlot.objects. \
+                         filter(pool = self.name,
+                                expires__lt = datetime.datetime.now()). \
+                         delete()[0]
+
+        if numExpired and self.logger:
+
+            self.logger.info('Reclaiming ' + str(numExpired) + 
+                             ' expired slot(s) in ' + self.name)
+
+    #---------------------------------------------------------------------------
+    # release
+    #---------------------------------------------------------------------------
+    def release(self, slot):
+
+        if slot and hasattr(slot, 'stopRenewing'):
+            slot.stopRenewing.set()
+
+        if slot and slot.id != None:
+            slot.delete()
+
+    #---------------------------------------------------------------------------
+    # renew
+    #
+    # This runs in a thread while a global pool's slot is held.
+    #---------------------------------------------------------------------------
+    def renew(self, slot):
+
+        try:
+            while not slot.stopRenewing.wait(self.leaseSeconds / 3.0):
+
+                expires = datetime.datetime.now() + \
+                          datetime.timedelta(seconds = self.leaseSeconds)
+
+                ProcessSlot.objects.filter(id = slot.id). \
+                                    update(expires = expires)
+
+        finally:
+            db.connection.close()
+
+    #---------------------------------------------------------------------------
+    # tryAcquire
+    #
+    # This returns a ProcessSlot, or None when the pool is too full.  A weight
+    # larger than the capacity is reduced to the capacity, so it can run alone.
+    #---------------------------------------------------------------------------
+    def tryAcquire(self, weight = 1):
+
+        weight = max(1, min(weight, self.capacity))
+
+        with transaction.atomic():
+
+            #---
+            # Serialize acquisitions in this pool by writing its lock row
+            # first.  SQLite ignores select_for_update(), but a write takes
+            # its database lock until the transaction ends.  Postgres locks
+            # the row.
+            #---
+            SlotPoolLock.objects.filter(pool = self.name). \
+                                 update(pool = self.name)
+
+            if self._used() + weight > self.capacity:
+
+                self._reclaim()
+
+                if self._used() + weight > self.capacity:
+                    return None
+
+            slot        = ProcessSlot()
+            slot.pool   = self.name
+            slot.weight = weight
+            slot.pid    = os.getpid()
+
+            if not self.perHost:
+
+                slot.expires = datetime.datetime.now() + \
+                               datetime.timedelta(seconds = self.leaseSeconds)
+
+            slot.save()
+
+        if not self.perHost:
+
+            slot.stopRenewing = threading.Event()
+            renewer = threading.Thread(target = self.renew, args = (slot,))
+            renewer.daemon = True
+            renewer.start()
+
+        return slot
+
+    #---------------------------------------------------------------------------
+    # _used
+    #---------------------------------------------------------------------------
+    def _used(self):
+
+        used = ProcessSlot.objects.filter(pool = self.name). \
+                                   aggregate(Sum('weight'))['weight__sum']
+
+        return used or 0
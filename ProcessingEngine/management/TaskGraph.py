@@ -0,0 +1,199 @@
+import Queue
+import sys
+import threading
+import traceback
+
+from django import db
+
+#-------------------------------------------------------------------------------
+# TaskGraph
+#
+# This runs a constituent's stages as a dependency graph, instead of one after
+# another.  Each task is a function, the names of the tasks it depends on, and
+# extra arguments.  The function receives the extra arguments followed by its
+# dependencies' results, in order.  Tasks whose dependencies finished run
+# concurrently in threads, up to maxThreads at a time.  The stages run external
+# programs, so threads spend their time waiting, not holding the interpreter.
+#
+# Tasks may have a kind, like 'ortho', and setLimit() caps how many tasks of a
+# kind run at once, for stages that need much memory.  setPool() makes tasks
+# of a kind hold a slot of a SlotPool while they run, which limits them across
+# every graph sharing the pool, in any process.
+#
+# When a task fails, the tasks depending on it are skipped, while independent
+# tasks continue.  Then run() raises the first failure's exception.
+#
+# Each thread closes its database connection after every task, because Django
+# opens one connection per thread.
+#
+# graph = TaskGraph(4, logger)
+# graph.add('a', makeA)
+# graph.add('b', makeB, ['a'])          # makeB(resultOfA)
+# graph.add('c', makeC, ['a'], (3,))    # makeC(3, resultOfA)
+# results = graph.run()
+#-------------------------------------------------------------------------------
+class TaskGraph(object):
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, maxThreads = 4, logger = None):
+
+        self.limits     = {}    # kind -> maximum running
+        self.logger     = logger
+        self.maxThreads = max(1, maxThreads)
+        self.order      = []    # task names, in the order added
+        self.pools      = {}    # kind -> SlotPool
+        self.tasks      = {}    # name -> (func, deps, args, kind)
+
+    #---------------------------------------------------------------------------
+    # add
+    #
+    # Dependencies must be added first, which also prevents cycles.
+    #---------------------------------------------------------------------------
+    def add(self, name, func, deps = [], args = (), kind = None):
+
+        if name in self.tasks:
+            raise RuntimeError('Task ' + str(name) + ' is already in the graph.')
+
+        for dep in deps:
+
+            if dep not in self.tasks:
+
+                raise RuntimeError('Task ' + str(name) + ' depends on ' +
+                                   str(dep) + ', which is not in the graph.')
+
+        self.tasks[name] = (func, list(deps), tuple(args), kind)
+        self.order.append(name)
+
+        return name
+
+    #---------------------------------------------------------------------------
+    # run
+    #
+    # This returns a dict of task names to results.
+    #---------------------------------------------------------------------------
+    def run(self):
+
+        completions = Queue.Queue()
+        pending     = list(self.order)
+        running     = {}    # name -> kind
+        results     = {}
+        failures    = []    # [(name, exc_info), ...]
+        skipped     = set()
+
+        while pending or running:
+
+            # Skip tasks that can no longer run.
+            for name in list(pending):
+
+                deps = self.tasks[name][1]
+
+                if [dep for dep in deps if dep in skipped or \
+                                           dep in dict(failures)]:
+
+                    pending.remove(name)
+                    skipped.add(name)
+
+            # Start tasks whose dependencies finished.
+            for name in list(pending):
+
+                if len(running) >= self.maxThreads:
+                    break
+
+                func, deps, args, kind = self.tasks[name]
+
+                if [dep for dep in deps if dep not in results]:
+                    continue
+
+                if kind in self.limits and \
+                   running.values().count(kind) >= self.limits[kind]:
+                    continue
+
+                depResults = tuple([results[dep] for dep in deps])
+                pending.remove(name)
+                running[name] = kind
+
+                thread = threading.Thread(target = TaskGraph._runTask,
+                                          args = (name,
+                                                  func,
+                                                  args + depResults,
+                                                  completions,
+                                                  self.pools.get(kind)))
+                thread.daemon = True
+                thread.start()
+
+            if not running:
+                break
+
+            # Wait for a task to finish.
+            name, result, excInfo = completions.get()
+            del running[name]
+
+            if excInfo:
+
+                failures.append((name, excInfo))
+
+                if self.logger:
+
+                    self.logger.error('Task ' + str(name) + ' failed.')
+
+                    self.logger.error(''.join(traceback.format_exception(
+                                                                   *excInfo)))
+
+            else:
+                results[name] = result
+
+        if failures:
+
+            if self.logger and skipped:
+
+                self.logger.error('Skipped tasks: ' +
+                                  ', '.join([str(s) for s in skipped]))
+
+            excType, excValue, excTraceback = failures[0][1]
+            raise excType, excValue, excTraceback
+
+        return results
+
+    #---------------------------------------------------------------------------
+    # _runTask
+    #---------------------------------------------------------------------------
+    @staticmethod
+    def _runTask(name, func, args, completions, pool = None):
+
+        result  = None
+        excInfo = None
+        slot    = None
+
+        try:
+            if pool:
+                slot = pool.acquire()
+
+            result = func(*args)
+
+        except Exception:
+            excInfo = sys.exc_info()
+
+        finally:
+
+            if slot:
+                pool.release(slot)
+
+            db.connection.close()
+
+        completions.put((name, result, excInfo))
+
+    #---------------------------------------------------------------------------
+    # setLimit
+    #---------------------------------------------------------------------------
+    def setLimit(self, kind, maxRunning):
+
+        self.limits[kind] = max(1, maxRunning)
+
+    #---------------------------------------------------------------------------
+    # setPool
+    #---------------------------------------------------------------------------
+    def setPool(self, kind, pool):
+
+        self.pools[kind] = pool
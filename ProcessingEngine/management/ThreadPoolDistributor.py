@@ -0,0 +1,174 @@
+import logging
+import Queue
+import threading
+import time
+import traceback
+
+from django import db
+
+from ProcessingEngine.management.ConstituentProcessor \
+    import ConstituentProcessor
+
+from ProcessingEngine.management.Distributor import Distributor
+
+#-------------------------------------------------------------------------------
+# ConstituentLoggerAdapter
+#
+# Constituents running in threads share the request's log, so their lines are
+# prefixed with the constituent they belong to.
+#-------------------------------------------------------------------------------
+class ConstituentLoggerAdapter(logging.LoggerAdapter):
+
+    #---------------------------------------------------------------------------
+    # process
+    #---------------------------------------------------------------------------
+    def process(self, msg, kwargs):
+
+        return '[constituent ' + str(self.extra['constituent']) + '] ' + \
+               str(msg), kwargs
+
+#-------------------------------------------------------------------------------
+# ThreadPoolDistributor
+#
+# This runs constituents in threads of the request's process, instead of
+# forking a process for each.  It suits retrievers whose constituents spend
+# their time waiting for external programs, which run outside the interpreter
+# lock.  Such retrievers set subprocessBound = True.  Their constituents must
+# not change shared retriever state without a lock.
+#
+# Each thread has its own logger, and closes its database connection when its
+# constituent finishes, because Django opens a connection per thread.
+#
+# Threads cannot be killed, so cancel() only prevents constituents that have
+# not started from starting.  Each thread releases its constituent's slot when
+# the constituent finishes, so the slots of constituents still running after
+# cancellation stay held until they end.
+#-------------------------------------------------------------------------------
+class ThreadPoolDistributor(Distributor):
+
+    # Seconds to wait for a completion before checking for cancellation.
+    WAIT_SECONDS = 30
+
+    #---------------------------------------------------------------------------
+    # __init__
+    #---------------------------------------------------------------------------
+    def __init__(self, cpList, maxRunning, logger):
+
+        super(ThreadPoolDistributor, self).__init__(cpList, maxRunning, logger)
+
+        self.cancelled   = False
+        self.completions = Queue.Queue()
+
+    #---------------------------------------------------------------------------
+    # cancel
+    #---------------------------------------------------------------------------
+    def cancel(self):
+
+        self.cancelled = True
+
+    #---------------------------------------------------------------------------
+    # myDistribute
+    #---------------------------------------------------------------------------
+    def myDistribute(self):
+
+        pending = list(self.constituentProcessors)
+        running = set()    # ConstituentProcessors
+        success = True
+
+        try:
+            while (pending or running) and not self.cancelled:
+
+                heldBack = False
+
+                # Start constituents.
+                while pending and len(running) < self.maxRunning:
+
+                    if not self.admission.admit(self.costProfile,
+                                                self.numRunningOnHost()):
+                        heldBack = True
+                        break
+
+                    slot = self.slotPool.tryAcquire(self.slotWeight)
+
+                    if not slot:
+                        heldBack = True
+                        break
+
+                    cp = pending.pop()
+                    running.add(cp)
+
+                    thread = threading.Thread(target = self.runOne,
+                                              args = (cp, slot))
+                    thread.daemon = True
+                    thread.start()
+
+                if not running:
+
+                    time.sleep(self.slotPool.pollSeconds)
+                    continue
+
+                # Wait for a constituent to finish.
+                timeout = self.slotPool.pollSeconds if heldBack else \
+                          ThreadPoolDistributor.WAIT_SECONDS
+
+                try:
+                    cp, cSuccess = self.completions.get(True, timeout)
+
+                except Queue.Empty:
+                    continue
+
+                running.discard(cp)
+                success = success and cSuccess
+
+                if cSuccess:
+                    self.constituentDone(cp, cp.constituent.destination.name)
+
+        except Exception as e:
+
+            if self.logger:
+                self.logger.info(traceback.format_exc())
+
+            self.cancel()
+            raise e
+
+        return success and not self.cancelled
+
+    #---------------------------------------------------------------------------
+    # runOne
+    #
+    # This runs in a constituent's thread, which holds slot until the
+    # constituent finishes.
+    #---------------------------------------------------------------------------
+    def runOne(self, cp, slot):
+
+        success = False
+        logger  = None
+
+        if cp.logger:
+
+            logger = ConstituentLoggerAdapter(cp.logger,
+                                              {'constituent':
+                                               cp.constituent.id})
+
+        try:
+            success = ConstituentProcessor.process(cp.retriever,
+                                                   cp.inputFile,
+                                                   cp.constituentFiles,
+                                                   cp.constituent,
+                                                   cp.parent,
+                                                   logger)
+
+        except Exception:
+
+            if logger:
+                logger.error(traceback.format_exc())
+
+        finally:
+
+            try:
+                self.slotPool.release(slot)
+
+            finally:
+                db.connection.close()
+
+        self.completions.put((cp, success))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProcessingEngine', '0002_request_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='request',
+            name='estimatedCost',
+            field=models.FloatField(blank=True, help_text='Relative cost estimate for shortest-job-first ordering', null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='priority',
+            field=models.IntegerField(choices=[(0, 'Low'), (1, 'Normal'), (2, 'High')], default=1, help_text='The scheduling class of this request'),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='submitter',
+            field=models.CharField(blank=True, help_text='Who submitted this request, for fair sharing', max_length=80, null=True),
+        ),
+    ]
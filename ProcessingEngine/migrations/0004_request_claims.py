@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProcessingEngine', '0003_request_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='constituentprocess',
+            name='host',
+            field=models.CharField(blank=True, max_length=80, null=True),
+        ),
+        migrations.AddField(
+            model_name='requestprocess',
+            name='host',
+            field=models.CharField(blank=True, max_length=80, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='claimHost',
+            field=models.CharField(blank=True, max_length=80, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='claimPid',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='leaseExpires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
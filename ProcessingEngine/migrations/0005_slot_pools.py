@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProcessingEngine', '0004_request_claims'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pid', models.IntegerField(null=True)),
+                ('host', models.CharField(blank=True, max_length=80, null=True)),
+                ('pool', models.CharField(db_index=True, max_length=120)),
+                ('weight', models.IntegerField(default=1)),
+                ('acquired', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Process Slot',
+                'verbose_name_plural': 'Process Slots',
+            },
+        ),
+        migrations.CreateModel(
+            name='SlotPoolLock',
+            fields=[
+                ('pool', models.CharField(max_length=120, primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
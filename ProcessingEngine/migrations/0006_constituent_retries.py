@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProcessingEngine', '0005_slot_pools'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='constituent',
+            name='retries',
+            field=models.IntegerField(default=0, help_text='The times this constituent was retried after transient failures.'),
+        ),
+    ]
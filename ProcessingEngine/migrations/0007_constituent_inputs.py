@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProcessingEngine', '0006_constituent_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='constituent',
+            name='constituentFiles',
+            field=models.TextField(blank=True, default='', help_text='The JSON of the files given to retrieveOne().'),
+        ),
+        migrations.AddField(
+            model_name='constituent',
+            name='inputFile',
+            field=models.TextField(blank=True, default='', help_text='The input file given to retrieveOne().'),
+        ),
+    ]
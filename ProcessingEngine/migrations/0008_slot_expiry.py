@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ProcessingEngine', '0007_constituent_inputs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processslot',
+            name='expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
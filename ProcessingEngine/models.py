@@ -7,6 +7,7 @@ import glob
 # import grp
 import os
 import shutil
+import socket
 import stat
 
 from django.conf import settings
@@ -26,6 +27,15 @@ RUNNING  = 'RUN'
 COMPLETE = 'CPT'
 FAILED   = 'FLD'
 
+# Priority classes
+LOW_PRIORITY    = 0
+NORMAL_PRIORITY = 1
+HIGH_PRIORITY   = 2
+
+PRIORITY_CHOICES = ((LOW_PRIORITY,    'Low'),
+                    (NORMAL_PRIORITY, 'Normal'),
+                    (HIGH_PRIORITY,   'High'))
+
 #-------------------------------------------------------------------------------
 # BaseProcess
 #-------------------------------------------------------------------------------
@@ -33,6 +43,9 @@ class BaseProcess(models.Model):
 
     pid = models.IntegerField(null = True)
 
+    # PIDs are only meaningful on the host that owns them.
+    host = models.CharField(max_length = 80, null = True, blank = True)
+
     #---------------------------------------------------------------------------
     # pidRunning
     #---------------------------------------------------------------------------
@@ -62,6 +75,16 @@ class BaseProcess(models.Model):
 
         return True
 
+    #---------------------------------------------------------------------------
+    # save
+    #---------------------------------------------------------------------------
+    def save(self, *args, **kwargs):
+
+        if not self.host:
+            self.host = thisHost()
+
+        super(BaseProcess, self).save(*args, **kwargs)
+
     #---------------------------------------------------------------------------
     # Meta
     #---------------------------------------------------------------------------
@@ -73,12 +96,22 @@ class BaseProcess(models.Model):
 #-------------------------------------------------------------------------------
 class Constituent(models.Model):
 
+    constituentFiles = models.TextField(blank = True, default = '',
+            help_text = 'The JSON of the files given to retrieveOne().')
+
     destination = models.FileField(
             help_text = 'The file path for this constituent\'s disk file.')
 
+    inputFile = models.TextField(blank = True, default = '',
+            help_text = 'The input file given to retrieveOne().')
+
     request = models.ForeignKey('Request')
     started = models.BooleanField(default = False)
     
+    retries = models.IntegerField(default = 0,
+            help_text = 'The times this constituent was retried after ' + \
+                        'transient failures.')
+    
     url = models.URLField(
             help_text = 'The URL of this constituent\'s file',
             validators = [URLValidator()])
@@ -257,6 +290,32 @@ class Request(models.Model):
     # This is so the oldest Predictors are processed first.
     created = models.DateTimeField(auto_now_add = True)
 
+    # These are used by the job daemon's scheduler.
+    priority = models.IntegerField(
+        choices = PRIORITY_CHOICES,
+        default = NORMAL_PRIORITY,
+        help_text = 'The scheduling class of this request')
+
+    submitter = models.CharField(
+        max_length = 80,
+        null = True,
+        blank = True,
+        help_text = 'Who submitted this request, for fair sharing')
+
+    estimatedCost = models.FloatField(
+        null = True,
+        blank = True,
+        help_text = 'Relative cost estimate for shortest-job-first ordering')
+
+    #---
+    # A job daemon claims a request before running it, so daemons on other
+    # hosts do not run it too.  The daemon renews the lease while it runs the
+    # request.  An expired lease means the daemon died.
+    #---
+    claimHost = models.CharField(max_length = 80, null = True, blank = True)
+    claimPid = models.IntegerField(null = True, blank = True)
+    leaseExpires = models.DateTimeField(null = True, blank = True)
+
     #--------------------------------------------------------------------
     # describeStatus
     #--------------------------------------------------------------------
@@ -464,6 +523,44 @@ class RequestProcess(BaseProcess):
         verbose_name        = "Request Process"
         verbose_name_plural = "Request Processes"
 
+#-------------------------------------------------------------------------------
+# ProcessSlot
+#
+# A ProcessSlot is a share of a SlotPool held by a process.  Heavier work holds
+# a larger weight.  Slots of global pools expire unless their holder renews
+# them, because their holder's host may die.
+#-------------------------------------------------------------------------------
+class ProcessSlot(BaseProcess):
+
+    pool     = models.CharField(max_length = 120, db_index = True)
+    weight   = models.IntegerField(default = 1)
+    acquired = models.DateTimeField(auto_now_add = True)
+    expires  = models.DateTimeField(null = True, blank = True)
+
+    #---------------------------------------------------------------------------
+    # Meta
+    #---------------------------------------------------------------------------
+    class Meta:
+        verbose_name        = 'Process Slot'
+        verbose_name_plural = 'Process Slots'
+
+#-------------------------------------------------------------------------------
+# SlotPoolLock
+#
+# Each SlotPool writes its row before counting and acquiring slots, which locks
+# it until the transaction ends, so concurrent acquisitions cannot overfill the
+# pool.
+#-------------------------------------------------------------------------------
+class SlotPoolLock(models.Model):
+
+    pool = models.CharField(max_length = 120, primary_key = True)
+
+    #---------------------------------------------------------------------------
+    # __unicode__
+    #---------------------------------------------------------------------------
+    def __unicode__(self): 
+        return self.pool
+
 #-------------------------------------------------------------------------------
 # post_delete
 #
@@ -531,4 +628,9 @@ def createUniqueDirName(baseDir, dirName):
         
     return uniqueDir
 
+#-------------------------------------------------------------------------------
+# thisHost
+#-------------------------------------------------------------------------------
+def thisHost():
 
+    return socket.gethostname()
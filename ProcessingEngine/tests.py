@@ -1,6 +1,332 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import datetime
+import os
+import threading
+
+from django import db
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+
+from ProcessingEngine.management.AdmissionController \
+    import AdmissionController
+    
+from ProcessingEngine.management.ConstituentProcessor \
+    import ConstituentProcessor
+    
+from ProcessingEngine.management.Distributor import Distributor
+from ProcessingEngine.management.ProcessReconciler import reconcile
+from ProcessingEngine.management.Retriever import Retriever
+from ProcessingEngine.management.SlotPool import SlotPool
+from ProcessingEngine.management.TaskGraph import TaskGraph
+from ProcessingEngine.models import ProcessSlot
+from ProcessingEngine.models import thisHost
+
+#-------------------------------------------------------------------------------
+# ProcessReconcilerTestCase
+#-------------------------------------------------------------------------------
+class ProcessReconcilerTestCase(TestCase):
+
+    def makeSlot(self, pid, host = None):
+
+        slot        = ProcessSlot()
+        slot.pool   = 'test'
+        slot.pid    = pid
+        slot.host   = host
+        slot.save()
+        return slot
+
+    def testDeadRowsDeleted(self):
+
+        live = self.makeSlot(os.getpid())
+        dead = self.makeSlot(os.getpid() + 1)
+
+        numDeleted = reconcile([ProcessSlot], pids = set([os.getpid()]))
+
+        self.assertEqual(numDeleted, 1)
+        self.assertTrue(ProcessSlot.objects.filter(id = live.id).exists())
+        self.assertFalse(ProcessSlot.objects.filter(id = dead.id).exists())
+
+    def testManyPids(self):
+
+        # More live PIDs and dead rows than SQLite binds in one query
+        pids = set(range(1, 2001))
+
+        ProcessSlot.objects.bulk_create(
+            [ProcessSlot(pool = 'test', pid = pid, host = thisHost()) \
+             for pid in range(1001, 3201)])
+
+        self.assertEqual(reconcile([ProcessSlot], pids = pids), 1200)
+        self.assertEqual(ProcessSlot.objects.count(), 1000)
+
+    def testOtherHostsIgnored(self):
+
+        remote = self.makeSlot(os.getpid() + 1, 'some.other.host')
+
+        self.assertEqual(reconcile([ProcessSlot], pids = set()), 0)
+        self.assertTrue(ProcessSlot.objects.filter(id = remote.id).exists())
+
+#-------------------------------------------------------------------------------
+# AdmissionControllerTestCase
+#-------------------------------------------------------------------------------
+class AdmissionControllerTestCase(SimpleTestCase):
+
+    def makeController(self, load, memGB, ioWait):
+
+        controller                    = AdmissionController()
+        controller.enabled            = True
+        controller.numCpus            = 4
+        controller.reserveGB          = 2.0
+        controller.readIoWait         = lambda: ioWait
+        controller.readLoadAverage    = lambda: load
+        controller.readMemAvailableGB = lambda: memGB
+        return controller
+
+    def testMemory(self):
+
+        controller = self.makeController(1.0, 12.0, 0.0)
+        profile = {'memoryGB': 8}
+
+        self.assertTrue(controller.admit(profile, 1))
+
+        # The first admission has not allocated yet, so 4 GB remain.
+        self.assertFalse(controller.admit(profile, 1))
+
+    def testIoWaitOnlyLimitsIoHeavyProfiles(self):
+
+        controller = self.makeController(1.0, 64.0, 0.5)
+
+        self.assertTrue(controller.admit({'memoryGB': 1}, 1))
+        self.assertFalse(controller.admit({'io': True}, 1))
+
+    def testIdleNodeAlwaysAdmits(self):
+
+        controller = self.makeController(100.0, 0.0, 1.0)
+
+        self.assertTrue(controller.admit({'memoryGB': 8, 'io': True}, 0))
+
+#-------------------------------------------------------------------------------
+# TaskGraphTestCase
+#-------------------------------------------------------------------------------
+class TaskGraphTestCase(SimpleTestCase):
+
+    def testResultsFlowToDependents(self):
+
+        graph = TaskGraph(4)
+        graph.add('a', lambda: 2)
+        graph.add('b', lambda x, a: x * a, ['a'], (3,))
+        graph.add('c', lambda a, b: a + b, ['a', 'b'])
+
+        self.assertEqual(graph.run()['c'], 8)
+
+    def testFailureSkipsDependents(self):
+
+        ran = []
+
+        def fail():
+            raise ValueError('failed')
+
+        graph = TaskGraph(2)
+        graph.add('a', fail)
+        graph.add('b', lambda a: ran.append('b'), ['a'])
+        graph.add('c', lambda: ran.append('c'))
+
+        self.assertRaises(ValueError, graph.run)
+        self.assertEqual(ran, ['c'])
+
+    def testPoolsHeldWhileTasksRun(self):
+
+        events = []
+
+        class FakePool(object):
+
+            def acquire(self):
+                events.append('acquire')
+                return 'slot'
+
+            def release(self, slot):
+                events.append('release')
+
+        graph = TaskGraph(2)
+        graph.setPool('maiac', FakePool())
+        graph.add('a', lambda: events.append('a'), [], (), 'maiac')
+        graph.add('b', lambda a: events.append('b'), ['a'], (), 'ortho')
+        graph.run()
+
+        self.assertEqual(events, ['acquire', 'a', 'release', 'b'])
+
+#-------------------------------------------------------------------------------
+# DistributorTestCase
+#-------------------------------------------------------------------------------
+class DistributorTestCase(TestCase):
+
+    class FakeRetriever(object):
+
+        def __init__(self):
+            self.aggregated = []
+
+        def aggregateOne(self, constituentFileName, outFile):
+
+            if outFile == 'bad.tif':
+                raise RuntimeError('Aggregation failed.')
+
+            self.aggregated.append((constituentFileName, outFile))
+
+    class FakeProcessor(object):
+
+        def __init__(self, retriever, inputFile):
+
+            self.retriever = retriever
+            self.inputFile = inputFile
+
+    def testConstituentDoneAggregates(self):
+
+        retriever   = DistributorTestCase.FakeRetriever()
+        distributor = Distributor([], 2)
+
+        distributor.constituentDone(
+            DistributorTestCase.FakeProcessor(retriever, 'a'), 'a.tif')
+
+        distributor.constituentDone(
+            DistributorTestCase.FakeProcessor(retriever, 'b'), None)
+
+        # Aggregation errors do not stop distribution.
+        distributor.constituentDone(
+            DistributorTestCase.FakeProcessor(retriever, 'c'), 'bad.tif')
+
+        self.assertEqual(retriever.aggregated, [('a', 'a.tif')])
+
+#-------------------------------------------------------------------------------
+# ConstituentRetryTestCase
+#-------------------------------------------------------------------------------
+@override_settings(CONSTITUENT_MAX_RETRIES = 2, CONSTITUENT_RETRY_SECONDS = 0)
+class ConstituentRetryTestCase(SimpleTestCase):
+
+    class FailingRetriever(Retriever):
+
+        def __init__(self, errorClasses):
+            self.errorClasses = list(errorClasses)
+
+        def retrieveOne(self, constituentFileName, fileList):
+
+            if self.errorClasses:
+
+                e = RuntimeError('Failed.')
+                e.errorClass = self.errorClasses.pop(0)
+                raise e
+
+            return constituentFileName
+
+    class FakeConstituent(object):
+
+        retries = 0
+
+        def save(self, update_fields = None):
+            pass
+
+    def retrieve(self, errorClasses):
+
+        constituent = ConstituentRetryTestCase.FakeConstituent()
+
+        retriever = \
+            ConstituentRetryTestCase.FailingRetriever(errorClasses)
+
+        result = ConstituentProcessor.retrieve(retriever, 'out.tif', [],
+                                               constituent, None)
+
+        return result, constituent.retries
+
+    def testTransientFailuresRetried(self):
+
+        self.assertEqual(self.retrieve([Retriever.TRANSIENT, Retriever.NODE]),
+                         ('out.tif', 2))
+
+    def testRetriesLimited(self):
+
+        self.assertRaises(RuntimeError, self.retrieve, [Retriever.TRANSIENT] * 3)
+
+    def testPermanentFailuresNotRetried(self):
+
+        self.assertRaises(RuntimeError, self.retrieve, [Retriever.PERMANENT])
+
+#-------------------------------------------------------------------------------
+# SlotPoolTestCase
+#
+# Threads use their own database connections, so this cannot run inside
+# TestCase's transaction.
+#-------------------------------------------------------------------------------
+class SlotPoolTestCase(TransactionTestCase):
+
+    def testCapacity(self):
+
+        pool  = SlotPool('test', 3, False)
+        slots = [pool.tryAcquire() for i in range(4)]
+
+        self.assertEqual(len([slot for slot in slots if slot]), 3)
+        self.assertEqual(pool.tryAcquire(), None)
+
+        pool.release(slots[0])
+        self.assertNotEqual(pool.tryAcquire(), None)
+
+    def testExpiredSlotReclaimed(self):
+
+        pool = SlotPool('test', 1, False)
+
+        # A slot whose holder's host died
+        stale         = ProcessSlot()
+        stale.pool    = pool.name
+        stale.pid     = 1
+        stale.host    = 'some.other.host'
+        stale.expires = datetime.datetime.now() - \
+                        datetime.timedelta(minutes = 1)
+        stale.save()
+
+        slot = pool.tryAcquire()
+
+        self.assertNotEqual(slot, None)
+        self.assertTrue(slot.expires > datetime.datetime.now())
+        self.assertFalse(ProcessSlot.objects.filter(id = stale.id).exists())
+
+        pool.release(slot)
+        self.assertTrue(slot.stopRenewing.is_set())
+
+    def testConcurrentAcquisitions(self):
+
+        pool     = SlotPool('test', 3, False)
+        acquired = []
+
+        def acquire():
+
+            try:
+                for i in range(5):
+
+                    try:
+                        slot = pool.tryAcquire()
+
+                    except OperationalError:
+
+                        # Another thread holds SQLite's lock.
+                        slot = None
+
+                    if slot:
+                        acquired.append(slot)
+
+            finally:
+                db.connection.close()
+
+        threads = [threading.Thread(target = acquire) for i in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(len(acquired) <= 3)
 
-# Create your tests here.
+        self.assertEqual(ProcessSlot.objects.filter(pool = pool.name).count(),
+                         len(acquired))
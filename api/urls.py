@@ -12,6 +12,7 @@ urlpatterns = [
     url(r'^orderComposite/$',     api.views.orderMosaic),
     url(r'^orderSR/$',            api.views.orderSR),
     url(r'^percentageComplete/$', api.views.percentageComplete),
+    url(r'^planRequest/$',        api.views.planRequest),
     url(r'^ready/$',              api.views.ready),
     url(r'^status/$',             api.views.status),
 
@@ -13,12 +13,15 @@ from EVHR import settings
 
 from ProcessingEngine.management.CommandHelper import CommandHelper
 from ProcessingEngine.models import EndPoint
+from ProcessingEngine.models import PRIORITY_CHOICES
 
 from GeoProcessingEngine.models import GeoRequest
 from GeoProcessingEngine.management.GeoRetriever import GeoRetriever
 
-from JobDaemon.models import JobDaemonProcess
+from JobDaemon.management.DaemonNotifier import notifyDaemons
+from JobDaemon.management.RequestClaim import daemonsAlive
 
+from EvhrEngine.management.EvhrPlanner import EvhrPlanner
 from EvhrEngine.models import EvhrError
 from EvhrEngine.models import EvhrScene
 
@@ -128,13 +131,12 @@ def getToaPath(request):
 #-------------------------------------------------------------------------------
 def isDaemonRunning():
     
+    #---
+    # Daemons can run on any host, so their PIDs cannot be checked here.
+    # Instead, look for a recent heartbeat.
+    #---
     try:
-        # Get the job daemon process from the DB.
-        jdProcs = JobDaemonProcess.objects.all()
-        
-        for jdProc in jdProcs:
-            if jdProc.pidRunning():
-                return True
+        return daemonsAlive()
                 
     except Exception, e:
         pass
@@ -163,6 +165,8 @@ def orderDEM(request):
     geoRequest.lrx         = request.POST['lrx']
     geoRequest.lry         = request.POST['lry']
     
+    setScheduling(geoRequest, request)
+    
     ep = EndPoint.objects.filter(name = 'EVHR DEM')[0]
     geoRequest.endPoint = ep
     
@@ -184,6 +188,9 @@ def orderDEM(request):
             evhrScene.sceneFile = scene
             evhrScene.save()
         
+    # Wake the job daemons, so they need not wait to poll for the request.
+    notifyDaemons()
+
     return JsonResponse({'id': geoRequest.id})
     
 #-------------------------------------------------------------------------------
@@ -212,6 +219,8 @@ def orderMosaic(request):
     geoRequest.lrx         = request.POST['lrx']
     geoRequest.lry         = request.POST['lry']
     
+    setScheduling(geoRequest, request)
+    
     ep = EndPoint.objects.filter(name = 'EVHR ToA')[0]
     geoRequest.endPoint = ep
     
@@ -233,6 +242,9 @@ def orderMosaic(request):
             evhrScene.sceneFile = scene
             evhrScene.save()
         
+    # Wake the job daemons, so they need not wait to poll for the request.
+    notifyDaemons()
+
     return JsonResponse({'id': geoRequest.id})
     
 #-------------------------------------------------------------------------------
@@ -259,6 +271,8 @@ def orderSR(request):
     geoRequest.lrx         = request.POST['lrx']
     geoRequest.lry         = request.POST['lry']
     
+    setScheduling(geoRequest, request)
+    
     ep = EndPoint.objects.filter(name = 'EVHR SR')[0]
     geoRequest.endPoint = ep
     
@@ -280,6 +294,9 @@ def orderSR(request):
             evhrScene.sceneFile = scene
             evhrScene.save()
         
+    # Wake the job daemons, so they need not wait to poll for the request.
+    notifyDaemons()
+
     return JsonResponse({'id': geoRequest.id})
     
 #-------------------------------------------------------------------------------
@@ -304,6 +321,51 @@ def percentageComplete(request):
 
     return JsonResponse({'success': success, 'msg': msg})
 
+#-------------------------------------------------------------------------------
+# planRequest
+#
+# This estimates an order's tasks and cost without placing it.  Give an
+# existing request's ID, or the order's AoI and optional scenes.
+#
+# curl --url "http://evhr102/api/planRequest/?id=36"
+#
+# curl --data "ulx=-148&uly=65&lrx=-147.5&lry=64.5&epsg=4326" http://evhr102/api/planRequest/
+#-------------------------------------------------------------------------------
+@csrf_exempt
+def planRequest(request):
+
+    params = request.POST if request.method == 'POST' else request.GET
+    
+    try:
+        if params.has_key('id'):
+            
+            req = GeoRequest.objects.get(id = params['id'])
+            planner = EvhrPlanner.forRequest(req)
+            
+        else:
+            
+            scenes = params['scenes'].split(',') \
+                     if params.has_key('scenes') else None
+            
+            planner = EvhrPlanner(params['ulx'],
+                                  params['uly'],
+                                  params['lrx'],
+                                  params['lry'],
+                                  GeoRetriever. \
+                                  constructSrsFromIntCode(params['epsg']),
+                                  scenes)
+                                  
+        return JsonResponse({'success': True, 'msg': planner.plan()})
+
+    except GeoRequest.DoesNotExist:
+
+        msg = 'Request ' + str(params['id']) + ' does not exist.'
+        
+    except Exception, e:
+        msg = str(e)
+        
+    return JsonResponse({'success': False, 'msg': msg})
+
 #-------------------------------------------------------------------------------
 # ready
 #
@@ -324,6 +386,24 @@ def ready(request):
         
     return JsonResponse({'success': success, 'msg': msg})
         
+#-------------------------------------------------------------------------------
+# setScheduling
+#
+# Orders may include "submitter" and "priority" (0 low, 1 normal, 2 high).  The
+# submitter defaults to the client address, for fair sharing.
+#-------------------------------------------------------------------------------
+def setScheduling(geoRequest, request):
+
+    geoRequest.submitter = request.POST.get('submitter',
+                                            request.META.get('REMOTE_ADDR'))
+
+    if request.POST.has_key('priority'):
+
+        priority = int(request.POST['priority'])
+
+        if priority in dict(PRIORITY_CHOICES):
+            geoRequest.priority = priority
+
 #-------------------------------------------------------------------------------
 # simulateOrderMosaic
 #